@@ -0,0 +1,118 @@
+# -*- encoding: utf-8 -*-
+
+"""
+转写用音频中间文件格式对比：用服务端 MediaProcessor.extract_audio 把同一段录像分别抽取为
+wav / opus / mp3（16 kHz 单声道，见 server/services/media_processor.py 的 AUDIO_FORMATS），
+统计文件大小、折算每小时体积、相对 wav 的压缩比和抽取耗时。
+
+加 --transcribe 时再调用 AIService.transcribe_audio（需要 DASHSCOPE_API_KEY 和 dashscope），
+记录识别耗时，并以 wav 的识别文本为基准计算各格式文本相似度，用于确认压缩没有影响识别效果。
+
+    python benchmarks/audio_formats.py --input storage/1/20240101_120000.mp4
+    python benchmarks/audio_formats.py --input sample.flv --formats wav opus --transcribe
+"""
+
+import argparse
+import asyncio
+import difflib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
+sys.path.insert(0, ROOT_DIR)
+
+
+def probe_duration(path: str) -> float | None:
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30
+        ).stdout.strip()
+        return float(output) if output else None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def transcript_text(transcript: str) -> str:
+    try:
+        sentences = json.loads(transcript)
+    except ValueError:
+        return transcript
+    return "".join(item.get("text", "") for item in sentences if isinstance(item, dict))
+
+
+async def run(args) -> list[dict]:
+    from services.media_processor import MediaProcessor, AUDIO_FORMATS
+
+    duration = probe_duration(args.input)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="dlr-bench-audio-")
+    os.makedirs(work_dir, exist_ok=True)
+    base = os.path.join(work_dir, os.path.splitext(os.path.basename(args.input))[0])
+
+    results = []
+    for audio_format in args.formats:
+        output_path = f"{base}.{AUDIO_FORMATS[audio_format]['extension']}"
+        started = time.perf_counter()
+        await MediaProcessor.extract_audio(args.input, output_path)
+        extract_seconds = time.perf_counter() - started
+        size = os.path.getsize(output_path)
+        results.append({
+            "format": audio_format,
+            "path": output_path,
+            "bytes": size,
+            "mb_per_hour": round(size / duration * 3600 / 1024 / 1024, 1) if duration else None,
+            "extract_seconds": round(extract_seconds, 3),
+        })
+
+    reference = next((r for r in results if r["format"] == "wav"), None)
+    for result in results:
+        result["ratio_vs_wav"] = round(reference["bytes"] / result["bytes"], 1) if reference else None
+
+    if args.transcribe:
+        from services.ai_service import AIService
+        if os.getenv("DASHSCOPE_API_KEY"):
+            AIService.set_api_key(os.getenv("DASHSCOPE_API_KEY"))
+        texts = {}
+        for result in results:
+            started = time.perf_counter()
+            transcript = await AIService.transcribe_audio(result["path"])
+            result["transcribe_seconds"] = round(time.perf_counter() - started, 3)
+            texts[result["format"]] = transcript_text(transcript)
+            result["transcript_chars"] = len(texts[result["format"]])
+        if "wav" in texts:
+            for result in results:
+                matcher = difflib.SequenceMatcher(None, texts["wav"], texts[result["format"]], autojunk=False)
+                result["text_similarity_vs_wav"] = round(matcher.ratio(), 4)
+
+    for result in results:
+        if not args.keep:
+            os.remove(result["path"])
+        result.pop("path")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="用于抽取音频的录像文件")
+    parser.add_argument("--formats", nargs="+", default=["wav", "opus", "mp3"])
+    parser.add_argument("--transcribe", action="store_true", help="同时对比识别耗时与识别结果")
+    parser.add_argument("--work-dir", default=None, help="音频输出目录，默认使用临时目录")
+    parser.add_argument("--keep", action="store_true", help="保留生成的音频文件")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
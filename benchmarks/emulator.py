@@ -0,0 +1,349 @@
+# -*- encoding: utf-8 -*-
+
+"""
+离线平台模拟器：在本地 HTTP 服务上模拟抖音/B站/虎牙的房间接口，并用 FFmpeg testsrc/sine
+生成的合成音视频提供“直播中”的 HLS 与 FLV 流。
+
+spider 中的请求通过 HostRewriteTransport 改写到本服务，原始域名放在 X-Original-Host 头中，
+模拟器据此按平台分发；返回的推流地址直接指向本服务，FFmpeg 可以像录制真实直播一样拉流。
+"""
+
+import argparse
+import base64
+import json
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+SEGMENT_SECONDS = 2
+PLAYLIST_WINDOW = 3
+
+
+class HostRewriteTransport(httpx.AsyncBaseTransport):
+    """把所有请求改写到模拟器地址，原始域名通过 X-Original-Host 传递"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.headers["X-Original-Host"] = request.url.host
+        request.url = request.url.copy_with(scheme="http", host=self.host, port=self.port)
+        # async_req 每次请求都新建并关闭 AsyncClient，且 main.py 中每次 asyncio.run 都是新的事件循环，
+        # 因此这里每个请求使用独立的连接，并在返回前读完响应体，与线上的连接行为保持一致
+        async with httpx.AsyncHTTPTransport() as inner:
+            response = await inner.handle_async_request(request)
+            content = await response.aread()
+        return httpx.Response(response.status_code, headers=response.headers, content=content, request=request)
+
+    async def aclose(self):
+        # 同一个实例会被多个 AsyncClient 复用，客户端关闭时不能把它一起关掉
+        pass
+
+
+def generate_media(output_dir: str, seconds: int = 20) -> dict:
+    """用 testsrc + sine 生成一段 HLS 分片和一个 FLV 文件，循环播放即可模拟长时间直播"""
+    os.makedirs(output_dir, exist_ok=True)
+    source = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", "testsrc=size=640x360:rate=25",
+        "-f", "lavfi", "-i", "sine=frequency=440:sample_rate=44100",
+        "-t", str(seconds),
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", str(25 * SEGMENT_SECONDS), "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-b:a", "64k",
+    ]
+    subprocess.run(source + [
+        "-f", "hls", "-hls_time", str(SEGMENT_SECONDS), "-hls_list_size", "0",
+        "-hls_segment_filename", os.path.join(output_dir, "seg_%03d.ts"),
+        os.path.join(output_dir, "vod.m3u8"),
+    ], check=True)
+    subprocess.run(source + ["-f", "flv", os.path.join(output_dir, "live.flv")], check=True)
+
+    segments = sorted(f for f in os.listdir(output_dir) if f.endswith(".ts"))
+    return {"dir": output_dir, "segments": segments, "duration": seconds}
+
+
+class RoomState:
+    __slots__ = ("key", "platform", "room_id", "live_since")
+
+    def __init__(self, key: str, platform: str, room_id: str):
+        self.key = key
+        self.platform = platform
+        self.room_id = room_id
+        self.live_since: float | None = None
+
+
+class PlatformEmulator:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, media_dir: str | None = None):
+        self._own_media_dir = media_dir is None
+        self.media = generate_media(media_dir or tempfile.mkdtemp(prefix="dlr-bench-"))
+        self.rooms: dict[str, RoomState] = {}
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.host, self.port = self.server.server_address[:2]
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def transport(self) -> HostRewriteTransport:
+        return HostRewriteTransport(self.host, self.port)
+
+    # ---- 房间管理 ----
+
+    def add_room(self, platform: str, room_id: str, live: bool = False) -> str:
+        key = f"{platform}-{room_id}"
+        room = RoomState(key, platform, room_id)
+        if live:
+            room.live_since = time.time()
+        self.rooms[key] = room
+        return {
+            "douyin": f"https://live.douyin.com/{room_id}",
+            "bilibili": f"https://live.bilibili.com/{room_id}",
+            "huya": f"https://www.huya.com/{room_id}",
+        }[platform]
+
+    def set_live(self, platform: str, room_id: str, live: bool) -> float:
+        room = self.rooms[f"{platform}-{room_id}"]
+        room.live_since = time.time() if live else None
+        return room.live_since or time.time()
+
+    def is_live(self, platform: str, room_id: str) -> bool:
+        room = self.rooms.get(f"{platform}-{room_id}")
+        return bool(room and room.live_since is not None)
+
+    def media_url(self, platform: str, room_id: str, kind: str) -> str:
+        name = "index.m3u8" if kind == "hls" else "live.flv"
+        return f"{self.base_url}/media/{platform}-{room_id}/{name}"
+
+    # ---- 平台接口 ----
+
+    def _douyin(self, path: str, query: dict) -> tuple[int, str, bytes]:
+        room_id = query.get("web_rid", [""])[0]
+        live = self.is_live("douyin", room_id)
+        room = {"status": 2 if live else 4, "title": f"bench douyin {room_id}"}
+        if live:
+            flv = self.media_url("douyin", room_id, "flv")
+            hls = self.media_url("douyin", room_id, "hls")
+            room["stream_url"] = {
+                "flv_pull_url": {"FULL_HD1": flv, "HD1": flv},
+                "hls_pull_url_map": {"FULL_HD1": hls, "HD1": hls},
+                "live_core_sdk_data": {},
+                "pull_datas": {},
+            }
+        body = {"data": {"data": [room], "user": {"nickname": f"douyin_{room_id}"}}}
+        return 200, "application/json", json.dumps(body).encode()
+
+    def _bilibili(self, path: str, query: dict) -> tuple[int, str, bytes]:
+        if path.endswith("/room_init"):
+            room_id = query.get("id", [""])[0]
+            body = {"data": {"uid": room_id, "live_status": 1 if self.is_live("bilibili", room_id) else 0}}
+        elif path.endswith("/Master/info"):
+            body = {"data": {"info": {"uname": f"bili_{query.get('uid', [''])[0]}"}}}
+        elif path.endswith("/getH5InfoByRoom"):
+            body = {"data": {"room_info": {"title": f"bench bilibili {query.get('room_id', [''])[0]}"}}}
+        elif path.endswith("/playUrl"):
+            room_id = query.get("cid", [""])[0]
+            body = {"code": 0, "data": {"durl": [{"url": self.media_url("bilibili", room_id, "flv")}]}}
+        else:
+            return 404, "application/json", b"{}"
+        return 200, "application/json", json.dumps(body).encode()
+
+    def _huya(self, path: str, query: dict) -> tuple[int, str, bytes]:
+        room_id = path.strip("/").split("/")[0]
+        stream_list = []
+        if self.is_live("huya", room_id):
+            fm = urllib.parse.quote(base64.b64encode(b"benchsecret_$0_$1_$2_$3").decode())
+            stream_list.append({
+                "sFlvUrl": f"{self.base_url}/media/huya-{room_id}",
+                "sHlsUrl": f"{self.base_url}/media/huya-{room_id}",
+                "sStreamName": "live",
+                "sFlvUrlSuffix": "flv",
+                "sHlsUrlSuffix": "m3u8",
+                "sFlvAntiCode": f"wsSecret=0&wsTime=0&fm={fm}&ctype=huya_live&fs=bgct",
+            })
+        stream = {"data": [{
+            "gameLiveInfo": {"introduction": f"bench huya {room_id}", "nick": f"huya_{room_id}"},
+            "gameStreamInfoList": stream_list,
+        }]}
+        html = f'<html><script>var hyPlayerConfig = {{stream: {json.dumps(stream)},"iWebDefaultBitRate":0}};</script></html>'
+        return 200, "text/html; charset=utf-8", html.encode()
+
+    # ---- 合成直播流 ----
+
+    def _playlist(self, room_key: str) -> bytes:
+        room = self.rooms.get(room_key)
+        if not room or room.live_since is None:
+            return b""
+        elapsed = time.time() - room.live_since
+        first_seq = int(elapsed // SEGMENT_SECONDS)
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first_seq}",
+        ]
+        count = len(self.media["segments"])
+        for seq in range(first_seq, first_seq + PLAYLIST_WINDOW):
+            if seq and seq % count == 0:
+                lines.append("#EXT-X-DISCONTINUITY")
+            lines.append(f"#EXTINF:{SEGMENT_SECONDS:.3f},")
+            lines.append(f"/media/{room_key}/seg/{seq}.ts")
+        return ("\n".join(lines) + "\n").encode()
+
+    def _segment_path(self, seq: int) -> str:
+        segments = self.media["segments"]
+        return os.path.join(self.media["dir"], segments[seq % len(segments)])
+
+    def _stream_flv(self, handler: BaseHTTPRequestHandler, room_key: str):
+        path = os.path.join(self.media["dir"], "live.flv")
+        size = os.path.getsize(path)
+        bytes_per_second = size / self.media["duration"]
+        chunk = 64 * 1024
+        handler.send_response(200)
+        handler.send_header("Content-Type", "video/x-flv")
+        handler.end_headers()
+        offset = 0
+        with open(path, "rb") as f:
+            while room_key in self.rooms and self.rooms[room_key].live_since is not None:
+                data = f.read(chunk)
+                if not data:
+                    # 循环播放时跳过 FLV 文件头(9字节) + PreviousTagSize0(4字节)
+                    f.seek(13)
+                    continue
+                try:
+                    handler.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                offset += len(data)
+                time.sleep(len(data) / bytes_per_second)
+
+    # ---- HTTP ----
+
+    def _make_handler(self):
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, content_type: str, body: bytes, head: bool = False):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(body)
+
+            def _handle(self, head: bool = False):
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+                host = self.headers.get("X-Original-Host", "")
+
+                if parsed.path.startswith("/_control/"):
+                    return self._reply(200, "application/json", emulator._control(parsed.path, query), head)
+
+                if parsed.path.startswith("/media/"):
+                    emulator._count("media")
+                    parts = parsed.path.split("/")
+                    room_key = parts[2]
+                    if parts[-1].endswith(".m3u8"):
+                        body = emulator._playlist(room_key)
+                        status = 200 if body else 404
+                        return self._reply(status, "application/vnd.apple.mpegurl", body, head)
+                    if parts[-2] == "seg":
+                        with open(emulator._segment_path(int(parts[-1].split(".")[0])), "rb") as f:
+                            return self._reply(200, "video/mp2t", f.read(), head)
+                    if parts[-1].endswith(".flv"):
+                        if not emulator.rooms.get(room_key) or emulator.rooms[room_key].live_since is None:
+                            return self._reply(404, "text/plain", b"offline", head)
+                        if head:
+                            return self._reply(200, "video/x-flv", b"", head)
+                        self.close_connection = True
+                        return emulator._stream_flv(self, room_key)
+                    return self._reply(404, "text/plain", b"not found", head)
+
+                if "douyin.com" in host:
+                    emulator._count("douyin")
+                    return self._reply(*emulator._douyin(parsed.path, query), head=head)
+                if "bilibili.com" in host:
+                    emulator._count("bilibili")
+                    return self._reply(*emulator._bilibili(parsed.path, query), head=head)
+                if "huya.com" in host:
+                    emulator._count("huya")
+                    return self._reply(*emulator._huya(parsed.path, query), head=head)
+                return self._reply(404, "text/plain", b"unknown host", head)
+
+            def do_GET(self):
+                self._handle()
+
+            def do_HEAD(self):
+                self._handle(head=True)
+
+        return Handler
+
+    def _control(self, path: str, query: dict) -> bytes:
+        """基准测试进程通过 /_control/ 接口切换房间开播状态、读取请求计数"""
+        if path == "/_control/room":
+            platform = query["platform"][0]
+            room_id = query["room_id"][0]
+            if f"{platform}-{room_id}" not in self.rooms:
+                url = self.add_room(platform, room_id)
+            else:
+                url = None
+            live_since = self.set_live(platform, room_id, query.get("live", ["0"])[0] == "1")
+            return json.dumps({"url": url, "live_since": live_since}).encode()
+        if path == "/_control/stats":
+            with self._lock:
+                return json.dumps({"requests": dict(self.requests), "rooms": len(self.rooms)}).encode()
+        return b"{}"
+
+    def _count(self, name: str):
+        with self._lock:
+            self.requests[name] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._own_media_dir:
+            shutil.rmtree(self.media["dir"], ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DouyinLiveRecorder platform emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--media-dir", default=None, help="合成媒体的缓存目录，默认使用临时目录")
+    args = parser.parse_args()
+
+    stop_signals = {signal.SIGINT, signal.SIGTERM}
+    signal.pthread_sigmask(signal.SIG_BLOCK, stop_signals)
+    emulator = PlatformEmulator(args.host, args.port, args.media_dir).start()
+    # 第一行输出监听地址，供 run_benchmark.py 读取
+    print(json.dumps({"host": emulator.host, "port": emulator.port}), flush=True)
+    try:
+        signal.sigwait(stop_signals)
+    finally:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# -*- encoding: utf-8 -*-
+
+"""
+离线基准测试：启动平台模拟器（benchmarks/emulator.py），把 spider 的所有请求重定向到本地，
+分别在 10/100/1000 个房间规模下测量：
+
+  monitor  CLI 录制器的监测循环（每个房间一个线程，semaphore 限制并发请求，asyncio.run 调用 spider/stream）
+  server   服务端 execute_recording_job（解析 -> FFmpeg 录制合成流，AI 关闭），使用临时目录中的独立数据库
+
+输出 CPU 时间（本进程 + 已回收的子进程，如 FFmpeg）、RSS、请求速率与开播检测延迟百分位。
+模拟器运行在独立进程中，其开销不计入结果。
+
+    python benchmarks/run_benchmark.py --rooms 10 100 1000 --mode monitor --duration 120
+    python benchmarks/run_benchmark.py --rooms 10 100 --mode server --record-seconds 10
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+PLATFORMS = ("douyin", "bilibili", "huya")
+# 与 main.py 中一致，虎牙 OD/BD/UHD 画质会走 App 接口，这里使用网页接口对应的画质
+VIDEO_QUALITY = "HD"
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)], 3)
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def cpu_seconds() -> float:
+    usage = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        r = resource.getrusage(who)
+        usage += r.ru_utime + r.ru_stime
+    return usage
+
+
+class EmulatorProcess:
+    def __init__(self, media_dir: str | None = None):
+        command = [sys.executable, os.path.join(BENCH_DIR, "emulator.py")]
+        if media_dir:
+            command += ["--media-dir", media_dir]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        address = json.loads(self.process.stdout.readline())
+        self.host, self.port = address["host"], address["port"]
+
+    def _get(self, path: str, **params) -> dict:
+        url = f"http://{self.host}:{self.port}{path}?{urllib.parse.urlencode(params)}"
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            return json.loads(resp.read())
+
+    def set_live(self, platform: str, room_id: str, live: bool) -> dict:
+        return self._get("/_control/room", platform=platform, room_id=room_id, live=int(live))
+
+    def stats(self) -> dict:
+        return self._get("/_control/stats")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=30)
+
+
+def install_transport(emulator: EmulatorProcess):
+    from emulator import HostRewriteTransport
+    from src.http_clients import async_http
+    async_http.transport = HostRewriteTransport(emulator.host, emulator.port)
+
+
+def create_rooms(emulator: EmulatorProcess, count: int) -> list[tuple[str, str, str]]:
+    rooms = []
+    for i in range(count):
+        platform = PLATFORMS[i % len(PLATFORMS)]
+        room_id = str(100000 + i)
+        url = emulator.set_live(platform, room_id, False)["url"]
+        rooms.append((platform, room_id, url))
+    return rooms
+
+
+# ---------------- monitor ----------------
+
+def resolve_room(url: str) -> dict:
+    """与 main.start_record 中对应平台分支的调用保持一致"""
+    from src import spider, stream
+    if "douyin.com/" in url:
+        json_data = asyncio.run(spider.get_douyin_web_stream_data(url=url))
+        return asyncio.run(stream.get_douyin_stream_url(json_data, VIDEO_QUALITY, None))
+    if "huya.com/" in url:
+        json_data = asyncio.run(spider.get_huya_stream_data(url=url))
+        return asyncio.run(stream.get_huya_stream_url(json_data, VIDEO_QUALITY))
+    if "bilibili.com/" in url:
+        json_data = asyncio.run(spider.get_bilibili_room_info(url=url))
+        return asyncio.run(stream.get_bilibili_stream_url(
+            json_data, video_quality=VIDEO_QUALITY, cookies=None, proxy_addr=None))
+    raise ValueError(f"Unsupported url: {url}")
+
+
+def run_monitor(emulator: EmulatorProcess, rooms: list, args) -> dict:
+    """
+    main.py 是模块级脚本（导入即读取配置并进入主循环），无法直接驱动，
+    这里按 start_record 的结构复现：每个房间一个线程，semaphore 限制同时请求数，循环间隔 delay±5 秒。
+    """
+    semaphore = threading.Semaphore(args.max_request)
+    stop = threading.Event()
+    live_since: dict[str, float] = {}
+    latencies: list[float] = []
+    errors = 0
+    checks = 0
+    lock = threading.Lock()
+
+    def worker(platform: str, room_id: str, url: str):
+        nonlocal errors, checks
+        detected = False
+        # 错开首次检测，避免所有线程同时发起请求
+        if stop.wait(random.uniform(0, args.interval)):
+            return
+        while not stop.is_set():
+            try:
+                with semaphore:
+                    port_info = resolve_room(url)
+                with lock:
+                    checks += 1
+                if port_info and port_info.get("is_live") and not detected and url in live_since:
+                    detected = True
+                    with lock:
+                        latencies.append(time.time() - live_since[url])
+            except Exception:
+                with lock:
+                    errors += 1
+            stop.wait(max(0, args.interval + random.randint(-5, 5)))
+
+    threads = [threading.Thread(target=worker, args=room, daemon=True) for room in rooms]
+    for t in threads:
+        t.start()
+
+    # 在前半段时间内让一部分房间随机开播
+    live_rooms = random.sample(rooms, max(1, int(len(rooms) * args.live_fraction)))
+    go_live_at = sorted((random.uniform(0, args.duration / 2), room) for room in live_rooms)
+    started = time.time()
+    for offset, (platform, room_id, url) in go_live_at:
+        if stop.wait(max(0.0, started + offset - time.time())):
+            break
+        live_since[url] = emulator.set_live(platform, room_id, True)["live_since"]
+    stop.wait(max(0.0, started + args.duration - time.time()))
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+
+    return {
+        "checks": checks,
+        "errors": errors,
+        "went_live": len(live_since),
+        "detected": len(latencies),
+        "detect_latency_p50": percentile(latencies, 50),
+        "detect_latency_p90": percentile(latencies, 90),
+        "detect_latency_p99": percentile(latencies, 99),
+        "threads_peak": len(threads) + 1,
+    }
+
+
+# ---------------- server ----------------
+
+def run_server(emulator: EmulatorProcess, rooms: list, args) -> dict:
+    """在临时工作目录中创建任务并并发执行 execute_recording_job，数据库和录制文件都写在该目录"""
+    from sqlmodel import Session, select
+    from database import engine, create_db_and_tables, Task, Record
+    from scheduler import execute_recording_job
+    from services.admission import AdmissionController
+
+    create_db_and_tables()
+    AdmissionController.configure({"record": args.record_slots})
+
+    with Session(engine) as session:
+        task_ids = []
+        for platform, room_id, url in rooms:
+            task = Task(url=url, platform=platform, anchor_id=room_id, duration=args.record_seconds,
+                        ai_enabled=False, is_active=True)
+            session.add(task)
+            session.commit()
+            session.refresh(task)
+            task_ids.append(task.id)
+
+    for platform, room_id, _ in rooms:
+        emulator.set_live(platform, room_id, True)
+
+    async def run_all():
+        await asyncio.gather(*(execute_recording_job(task_id) for task_id in task_ids))
+
+    asyncio.run(run_all())
+
+    resolve_seconds = []
+    record_seconds = []
+    statuses: dict[str, int] = {}
+    with Session(engine) as session:
+        for record in session.exec(select(Record).where(Record.task_id.in_(task_ids))).all():
+            statuses[record.status] = statuses.get(record.status, 0) + 1
+            stages = json.loads(record.timings) if record.timings else {}
+            if "resolve" in stages:
+                resolve_seconds.append(stages["resolve"]["seconds"])
+            if "record" in stages:
+                record_seconds.append(stages["record"]["seconds"])
+    return {
+        "jobs": len(task_ids),
+        "statuses": statuses,
+        "resolve_p50": percentile(resolve_seconds, 50),
+        "resolve_p90": percentile(resolve_seconds, 90),
+        "resolve_p99": percentile(resolve_seconds, 99),
+        # 录制阶段耗时减去录制时长即为 FFmpeg 启动与排队开销
+        "record_overhead_p50": percentile([s - args.record_seconds for s in record_seconds], 50),
+        "record_overhead_p99": percentile([s - args.record_seconds for s in record_seconds], 99),
+        "admission": AdmissionController.stats(),
+    }
+
+
+def run_scenario(mode: str, count: int, args) -> dict:
+    emulator = EmulatorProcess(args.media_dir)
+    try:
+        install_transport(emulator)
+        rooms = create_rooms(emulator, count)
+        requests_before = sum(emulator.stats()["requests"].values())
+        cpu_before = cpu_seconds()
+        started = time.perf_counter()
+
+        if mode == "monitor":
+            result = run_monitor(emulator, rooms, args)
+        else:
+            result = run_server(emulator, rooms, args)
+
+        elapsed = time.perf_counter() - started
+        stats = emulator.stats()
+        total_requests = sum(stats["requests"].values()) - requests_before
+        result.update({
+            "mode": mode,
+            "rooms": count,
+            "elapsed": round(elapsed, 2),
+            "cpu_seconds": round(cpu_seconds() - cpu_before, 2),
+            "cpu_percent": round((cpu_seconds() - cpu_before) / elapsed * 100, 1),
+            "rss_mb": current_rss_mb(),
+            "requests": stats["requests"],
+            "requests_per_second": round(total_requests / elapsed, 1),
+        })
+        return result
+    finally:
+        emulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recorder benchmark")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--mode", choices=["monitor", "server", "both"], default="monitor")
+    parser.add_argument("--duration", type=float, default=120, help="monitor 模式每轮运行秒数")
+    parser.add_argument("--interval", type=int, default=60, help="monitor 模式循环检测间隔（对应 delay_default）")
+    parser.add_argument("--max-request", type=int, default=3, help="同一时间访问网络的线程数（对应 max_request）")
+    parser.add_argument("--live-fraction", type=float, default=0.1, help="monitor 模式中途开播的房间比例")
+    parser.add_argument("--record-seconds", type=int, default=10, help="server 模式每个任务的录制时长")
+    parser.add_argument("--record-slots", type=int, default=8, help="server 模式 FFmpeg 录制并发上限")
+    parser.add_argument("--media-dir", default=None, help="复用已生成的合成媒体目录")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    modes = ["monitor", "server"] if args.mode == "both" else [args.mode]
+    if args.media_dir:
+        args.media_dir = os.path.abspath(args.media_dir)
+    sys.path.insert(0, BENCH_DIR)
+    sys.path.insert(0, ROOT_DIR)
+    if "server" in modes:
+        # 服务端代码以 server/ 为根目录导入，数据库路径相对于当前目录，切到临时目录避免污染 config/database.db
+        sys.path.insert(0, os.path.join(ROOT_DIR, "server"))
+        work_dir = tempfile.mkdtemp(prefix="dlr-bench-server-")
+        os.makedirs(os.path.join(work_dir, "config"), exist_ok=True)
+        os.chdir(work_dir)
+        print(f"server working directory: {work_dir}")
+
+    results = []
+    for mode in modes:
+        for count in args.rooms:
+            print(f"==> {mode} with {count} rooms")
+            result = run_scenario(mode, count, args)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
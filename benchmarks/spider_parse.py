@@ -0,0 +1,244 @@
+# -*- encoding: utf-8 -*-
+
+"""
+spider / stream 解析耗时基准测试，基于 src/http_clients/replay.py 的请求录制/回放。
+
+先对真实直播间录制一次响应（需要联网，URL 与 main.py 中支持的平台一致）:
+
+    python benchmarks/spider_parse.py record https://live.douyin.com/745964462470 https://www.huya.com/52333
+
+之后即可离线回放，统计每个 spider 函数和 stream 选择函数的耗时（不访问网络）:
+
+    python benchmarks/spider_parse.py replay --iterations 200
+
+fixture 与用例清单保存在 --fixtures 目录（默认 benchmarks/fixtures/spider），cases.json 记录每个 URL
+对应的函数与当次解析结果摘要；回放时结果与录制时不一致会标记为 mismatch，可作为解析回归检查。
+fixture 中包含平台返回的原始响应（可能带 Set-Cookie），默认目录已加入 .gitignore。
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from src import spider, stream  # noqa: E402
+from src.http_clients import async_http, replay  # noqa: E402
+
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, "fixtures", "spider")
+VIDEO_QUALITY = "HD"
+
+# (URL 特征, spider 函数, stream 选择函数, stream 额外参数)，与 main.start_record 中的分支对应
+PLATFORM_CASES = [
+    (("v.douyin.com/", "douyin.com/user/"), "get_douyin_app_stream_data", "get_douyin_stream_url", {}),
+    (("douyin.com/",), "get_douyin_web_stream_data", "get_douyin_stream_url", {}),
+    (("www.tiktok.com/",), "get_tiktok_stream_data", "get_tiktok_stream_url", {}),
+    (("live.kuaishou.com/",), "get_kuaishou_stream_data", "get_kuaishou_stream_url", {}),
+    (("www.huya.com/",), "get_huya_stream_data", "get_huya_stream_url", {}),
+    (("www.douyu.com/",), "get_douyu_info_data", "get_douyu_stream_url", {}),
+    (("www.yy.com/",), "get_yy_stream_data", "get_yy_stream_url", {}),
+    (("live.bilibili.com/",), "get_bilibili_room_info", "get_bilibili_stream_url", {}),
+    (("xhslink.com/", "www.xiaohongshu.com/"), "get_xhs_stream_url", None, {}),
+    (("www.bigo.tv/", "slink.bigovideo.tv/"), "get_bigo_stream_url", None, {}),
+    (("app.blued.cn/",), "get_blued_stream_url", None, {}),
+    (("sooplive.co.kr/", "sooplive.com/"), "get_sooplive_stream_data", "get_stream_url", {"spec": True}),
+    (("cc.163.com/",), "get_netease_stream_data", "get_netease_stream_url", {}),
+    (("qiandurebo.com/",), "get_qiandurebo_stream_data", None, {}),
+    (("www.pandalive.co.kr/",), "get_pandatv_stream_data", "get_stream_url", {"spec": True}),
+    (("fm.missevan.com/",), "get_maoerfm_stream_url", None, {}),
+    (("www.winktv.co.kr/",), "get_winktv_stream_data", "get_stream_url", {"spec": True}),
+    (("www.flextv.co.kr/", "www.ttinglive.com/"), "get_flextv_stream_data", "get_stream_url", {"spec": True}),
+    (("look.163.com/",), "get_looklive_stream_url", None, {}),
+    (("www.popkontv.com/",), "get_popkontv_stream_url", None, {}),
+    (("twitcasting.tv/",), "get_twitcasting_stream_url", "get_stream_url", {"spec": False}),
+    (("live.baidu.com/",), "get_baidu_stream_data", "get_stream_url", {}),
+    (("weibo.com/",), "get_weibo_stream_data", "get_stream_url", {"hls_extra_key": "m3u8_url"}),
+    (("kugou.com/",), "get_kugou_stream_url", None, {}),
+    (("www.twitch.tv/",), "get_twitchtv_stream_data", "get_stream_url", {"spec": True}),
+    (("www.liveme.com/",), "get_liveme_stream_url", None, {}),
+    (("www.huajiao.com/",), "get_huajiao_stream_url", None, {}),
+    (("7u66.com/",), "get_liuxing_stream_url", None, {}),
+    (("showroom-live.com/",), "get_showroom_stream_data", "get_stream_url", {"spec": True}),
+    (("live.acfun.cn/", "m.acfun.cn/"), "get_acfun_stream_data", "get_stream_url",
+     {"url_type": "flv", "flv_extra_key": "url"}),
+    (("live.tlclw.com/",), "get_changliao_stream_url", None, {}),
+    (("ybw1666.com/",), "get_yinbo_stream_url", None, {}),
+    (("www.inke.cn/",), "get_yingke_stream_url", None, {}),
+    (("www.zhihu.com/",), "get_zhihu_stream_url", None, {}),
+    (("chzzk.naver.com/",), "get_chzzk_stream_data", "get_stream_url", {"spec": True}),
+    (("www.haixiutv.com/", "lehaitv.com/"), "get_haixiu_stream_url", None, {}),
+    (("vvxqiu.com/",), "get_vvxqiu_stream_url", None, {}),
+    (("17.live/",), "get_17live_stream_url", None, {}),
+    (("www.lang.live/",), "get_langlive_stream_url", None, {}),
+    (("m.pp.weimipopo.com/", "h.catshow168.com/"), "get_pplive_stream_url", None, {}),
+    ((".6.cn/",), "get_6room_stream_url", None, {}),
+    (("live.shopee", "shp.ee/"), "get_shopee_stream_url", None, {}),
+    (("www.youtube.com/", "youtu.be/"), "get_youtube_stream_url", "get_stream_url", {"spec": True}),
+    (("tb.cn",), "get_taobao_stream_url", "get_stream_url",
+     {"url_type": "all", "hls_extra_key": "hlsUrl", "flv_extra_key": "flvUrl"}),
+    (("3.cn", "m.jd.com"), "get_jd_stream_url", None, {}),
+    (("faceit.com/",), "get_faceit_stream_data", "get_stream_url", {"spec": True}),
+    (("www.miguvideo.com", "m.miguvideo.com"), "get_migu_stream_url", None, {}),
+    (("show.lailianjie.com",), "get_lianjie_stream_url", None, {}),
+    (("www.imkktv.com",), "get_laixiu_stream_url", None, {}),
+    (("www.picarto.tv",), "get_picarto_stream_url", None, {}),
+]
+
+
+def match_case(url: str) -> dict | None:
+    for markers, spider_fn, stream_fn, stream_kwargs in PLATFORM_CASES:
+        if any(marker in url for marker in markers):
+            return {"url": url, "spider": spider_fn, "stream": stream_fn, "stream_kwargs": stream_kwargs}
+    return None
+
+
+def _call_kwargs(func, candidates: dict) -> dict:
+    params = inspect.signature(func).parameters
+    return {k: v for k, v in candidates.items() if k in params}
+
+
+async def run_spider(case: dict):
+    func = getattr(spider, case["spider"])
+    return await func(**_call_kwargs(func, {"url": case["url"], "video_quality": VIDEO_QUALITY}))
+
+
+async def run_stream(case: dict, json_data):
+    if not case["stream"]:
+        return json_data
+    func = getattr(stream, case["stream"])
+    kwargs = _call_kwargs(func, {"video_quality": VIDEO_QUALITY, "proxy_addr": None, "cookies": None})
+    return await func(json_data, **kwargs, **case["stream_kwargs"])
+
+
+def summarize_result(result) -> dict:
+    """只保留稳定字段用于回归比较，推流地址中的签名参数每次都会变化"""
+    if not isinstance(result, dict):
+        return {"type": type(result).__name__}
+    return {k: result.get(k) for k in ("anchor_name", "is_live", "title", "quality") if k in result}
+
+
+def load_cases(fixture_dir: str) -> list[dict]:
+    path = os.path.join(fixture_dir, "cases.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_cases(fixture_dir: str, cases: list[dict]):
+    path = os.path.join(fixture_dir, "cases.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(cases, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def record(args):
+    async_http.transport = replay.ReplayTransport(args.fixtures, mode="record", proxy=args.proxy)
+    cases = {case["url"]: case for case in load_cases(args.fixtures)}
+    for url in args.urls:
+        case = match_case(url)
+        if not case:
+            print(f"skip unsupported url: {url}")
+            continue
+        json_data = asyncio.run(run_spider(case))
+        result = asyncio.run(run_stream(case, json_data))
+        case["expected"] = summarize_result(result)
+        cases[url] = case
+        print(f"recorded {url}: {case['expected']}")
+    save_cases(args.fixtures, list(cases.values()))
+
+
+def _timed(coro_factory, iterations: int) -> tuple[list[float], object]:
+    timings = []
+    result = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = asyncio.run(coro_factory())
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, result
+
+
+def _stats(timings: list[float]) -> dict:
+    ordered = sorted(timings)
+    return {
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+    }
+
+
+def replay_cases(args):
+    transport = replay.ReplayTransport(args.fixtures, mode="replay")
+    async_http.transport = transport
+    cases = load_cases(args.fixtures)
+    if args.filter:
+        cases = [c for c in cases if args.filter in c["url"] or args.filter in c["spider"]]
+    if not cases:
+        print(f"no recorded cases in {args.fixtures}")
+        return 1
+
+    rows = []
+    failed = 0
+    for case in cases:
+        transport.reset()
+        transport.missing.clear()
+        try:
+            spider_timings, json_data = _timed(lambda: run_spider(case), args.iterations)
+            stream_timings, result = _timed(lambda: run_stream(case, json_data), args.iterations)
+        except replay.FixtureNotFound as e:
+            print(f"{case['url']}: {e}")
+            failed += 1
+            continue
+        if transport.missing:
+            status = "missing-fixture"
+        else:
+            status = "ok" if summarize_result(result) == case.get("expected") else "mismatch"
+        failed += status != "ok"
+        rows.append((case, status, _stats(spider_timings), _stats(stream_timings) if case["stream"] else None))
+
+    print(f"{'function':<34} {'mean_ms':>9} {'p50_ms':>9} {'p99_ms':>9}  status")
+    for case, status, spider_stats, stream_stats in rows:
+        print(f"{case['spider']:<34} {spider_stats['mean_ms']:>9} {spider_stats['p50_ms']:>9} "
+              f"{spider_stats['p99_ms']:>9}  {status}")
+        if stream_stats:
+            print(f"  {case['stream']:<32} {stream_stats['mean_ms']:>9} {stream_stats['p50_ms']:>9} "
+                  f"{stream_stats['p99_ms']:>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([{"url": c["url"], "spider": c["spider"], "stream": c["stream"], "status": s,
+                        "spider_timing": sp, "stream_timing": st} for c, s, sp, st in rows],
+                      f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="spider/stream parsing benchmark with recorded fixtures")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="fixture 目录")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = sub.add_parser("record", help="访问真实直播间并录制响应")
+    record_parser.add_argument("urls", nargs="+")
+    record_parser.add_argument("--proxy", default=None, help="录制时使用的代理地址")
+
+    replay_parser = sub.add_parser("replay", help="离线回放并统计解析耗时")
+    replay_parser.add_argument("--iterations", type=int, default=50)
+    replay_parser.add_argument("--filter", default=None, help="只运行 URL 或函数名包含该字符串的用例")
+    replay_parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+        return 0
+    return replay_cases(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+
+"""
+启动耗时基准：在全新的 Python 进程中分别导入 CLI 和服务端用到的模块，统计墙钟耗时（多次取中位数），
+并用 -X importtime 列出累计耗时最高的模块，用于确认 src 包导入时不再检测 Node.js、
+服务端启动时不加载 spider/execjs/httpx。
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 10 --top 15 --output startup.json
+    python benchmarks/startup.py --targets src src.spider server.stream_fetcher
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+SERVER_DIR = os.path.join(ROOT_DIR, "server")
+
+# 名称: (工作目录, 导入语句)
+TARGETS = {
+    "src": (ROOT_DIR, "import src"),
+    "src.fmp4": (ROOT_DIR, "from src import fmp4"),
+    "src.utils": (ROOT_DIR, "from src import utils"),
+    "src.spider": (ROOT_DIR, "from src import spider, stream"),
+    "server.stream_fetcher": (SERVER_DIR, "from services.stream_fetcher import StreamFetcher"),
+    "server.main": (SERVER_DIR, "import main"),
+}
+
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S.*)$")
+
+
+def run_once(cwd: str, statement: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], cwd=cwd, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def import_profile(cwd: str, statement: str, top: int) -> list[dict]:
+    """-X importtime 的输出中累计耗时最高的模块（微秒）"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=cwd,
+                            capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({"module": name, "cumulative_ms": int(cumulative_us) / 1000,
+                            "self_ms": int(self_us) / 1000, "depth": len(indent) // 2})
+    modules.sort(key=lambda item: item["cumulative_ms"], reverse=True)
+    return modules[:top]
+
+
+def baseline(repeat: int) -> float:
+    return statistics.median(run_once(ROOT_DIR, "pass") for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=list(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5, help="每个目标启动的进程数，取中位数")
+    parser.add_argument("--top", type=int, default=10, help="列出累计导入耗时最高的模块数，0 为不统计")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    interpreter = baseline(args.repeat)
+    results = {"python": sys.version.split()[0], "interpreter_seconds": round(interpreter, 4), "targets": []}
+    for name in args.targets:
+        cwd, statement = TARGETS[name]
+        entry = {"target": name, "statement": statement}
+        try:
+            samples = [run_once(cwd, statement) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError:
+            # 依赖未安装等导致导入失败时记录下来，继续其它目标
+            entry["error"] = "import failed"
+            results["targets"].append(entry)
+            continue
+        median = statistics.median(samples)
+        entry.update({
+            "median_seconds": round(median, 4),
+            "min_seconds": round(min(samples), 4),
+            "import_seconds": round(median - interpreter, 4),
+        })
+        if args.top:
+            entry["slowest_imports"] = import_profile(cwd, statement, args.top)
+        results["targets"].append(entry)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ import signal
 import threading
 import time
 import datetime
+import functools
 import re
 import shutil
 import random
@@ -25,9 +26,7 @@ from pathlib import Path
 import urllib.request
 from urllib.error import URLError, HTTPError
 from typing import Any
-import configparser
-import httpx
-from src import spider, stream
+from src import spider, stream, flv_downloader, hls, supervisor, postprocess, fmp4, subtitles, url_config, config_store, room_registry, status_server
 from src.proxy import ProxyDetector
 from src.utils import logger
 from src import utils
@@ -52,17 +51,12 @@ error_window = []
 error_window_size = 10
 error_threshold = 5
 monitoring = 0
-running_list = []
-url_tuples_list = []
-url_comments = []
-text_no_repeat_url = []
+rooms = room_registry.RoomRegistry()
 create_var = locals()
 first_start = True
-exit_recording = False
-need_update_line_list = []
 first_run = True
-not_record_list = []
 start_display_time = datetime.datetime.now()
+program_start_time = time.time()
 global_proxy = False
 recording_time_list = {}
 script_path = os.path.split(os.path.realpath(sys.argv[0]))[0]
@@ -70,10 +64,10 @@ config_file = f'{script_path}/config/config.ini'
 url_config_file = f'{script_path}/config/URL_config.ini'
 backup_dir = f'{script_path}/backup_config'
 text_encoding = 'utf-8-sig'
+url_watcher = url_config.UrlConfigWatcher(url_config_file, text_encoding)
 rstr = r"[\/\\\:\*\？?\"\<\>\|&#.。,， ~！· ]"
 default_path = f'{script_path}/downloads'
 os.makedirs(default_path, exist_ok=True)
-file_update_lock = threading.Lock()
 os_type = os.name
 clear_command = "cls" if os_type == 'nt' else "clear"
 color_obj = utils.Color()
@@ -108,6 +102,9 @@ def display_info() -> None:
             print(f"录制视频质量为: {video_record_quality}", end=" | ")
             print(f"录制视频格式为: {video_save_type}", end=" | ")
             print(f"目前瞬时错误数为: {error_count}", end=" | ")
+            post_status = post_queue.status()
+            if post_status['running'] or post_status['queued']:
+                print(f"后处理: {len(post_status['running'])}个进行中 {post_status['queued']}个等待", end=" | ")
             now = time.strftime("%H:%M:%S", time.localtime())
             print(f"当前时间: {now}")
 
@@ -127,6 +124,10 @@ def display_info() -> None:
                     have_record_time = now_time - rt
                     print(f"{recording_live}[{qa}] 正在录制中 {str(have_record_time).split('.')[0]}")
 
+                for job in post_queue.status()['running']:
+                    percent = f"{job['percent']}%" if job['percent'] is not None else f"{job['elapsed']}秒"
+                    print(f"后处理[{job['kind']}] {Path(job['source']).name} {percent}")
+
                 # print('\n本软件已运行：'+str(now_time - start_display_time).split('.')[0])
                 print("x" * 60)
                 start_display_time = now_time
@@ -134,49 +135,6 @@ def display_info() -> None:
             logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
 
 
-def update_file(file_path: str, old_str: str, new_str: str, start_str: str = None) -> str | None:
-    if old_str == new_str and start_str is None:
-        return old_str
-    with file_update_lock:
-        file_data = []
-        with open(file_path, "r", encoding=text_encoding) as f:
-            try:
-                for text_line in f:
-                    if old_str in text_line:
-                        text_line = text_line.replace(old_str, new_str)
-                        if start_str:
-                            text_line = f'{start_str}{text_line}'
-                    if text_line not in file_data:
-                        file_data.append(text_line)
-            except RuntimeError as e:
-                logger.error(f"错误信息: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
-                if ini_URL_content:
-                    with open(file_path, "w", encoding=text_encoding) as f2:
-                        f2.write(ini_URL_content)
-                    return old_str
-        if file_data:
-            with open(file_path, "w", encoding=text_encoding) as f:
-                f.write(''.join(file_data))
-        return new_str
-
-
-def delete_line(file_path: str, del_line: str, delete_all: bool = False) -> None:
-    with file_update_lock:
-        with open(file_path, 'r+', encoding=text_encoding) as f:
-            lines = f.readlines()
-            f.seek(0)
-            f.truncate()
-            skip_line = False
-            for txt_line in lines:
-                if del_line in txt_line:
-                    if delete_all or not skip_line:
-                        skip_line = True
-                        continue
-                else:
-                    skip_line = False
-                f.write(txt_line)
-
-
 def get_startup_info(system_type: str):
     if system_type == 'nt':
         startup_info = subprocess.STARTUPINFO()
@@ -188,111 +146,27 @@ def get_startup_info(system_type: str):
 
 def segment_video(converts_file_path: str, segment_save_file_path: str, segment_format: str, segment_time: str,
                   is_original_delete: bool = True) -> None:
-    try:
-        if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
-            ffmpeg_command = [
-                "ffmpeg",
-                "-i", converts_file_path,
-                "-c:v", "copy",
-                "-c:a", "copy",
-                "-map", "0",
-                "-f", "segment",
-                "-segment_time", segment_time,
-                "-segment_format", segment_format,
-                "-reset_timestamps", "1",
-                "-movflags", "+frag_keyframe+empty_moov",
-                segment_save_file_path,
-            ]
-            _output = subprocess.check_output(
-                ffmpeg_command, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
-            )
-            if is_original_delete:
-                time.sleep(1)
-                if os.path.exists(converts_file_path):
-                    os.remove(converts_file_path)
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Error occurred during conversion: {e}')
-    except Exception as e:
-        logger.error(f'An unknown error occurred: {e}')
+    post_queue.submit(
+        postprocess.KIND_SEGMENT, converts_file_path,
+        {'output': segment_save_file_path, 'segment_format': segment_format, 'segment_time': segment_time,
+         'delete_source': is_original_delete},
+        priority=postprocess.PRIORITY_SEGMENT
+    )
 
 
 def converts_mp4(converts_file_path: str, is_original_delete: bool = True) -> None:
-    try:
-        if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
-            if converts_to_h264:
-                color_obj.print_colored("正在转码为MP4格式并重新编码为h264\n", color_obj.YELLOW)
-                ffmpeg_command = [
-                    "ffmpeg", "-i", converts_file_path,
-                    "-c:v", "libx264",
-                    "-preset", "veryfast",
-                    "-crf", "23",
-                    "-vf", "format=yuv420p",
-                    "-c:a", "copy",
-                    "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
-                ]
-            else:
-                color_obj.print_colored("正在转码为MP4格式\n", color_obj.YELLOW)
-                ffmpeg_command = [
-                    "ffmpeg", "-i", converts_file_path,
-                    "-c:v", "copy",
-                    "-c:a", "copy",
-                    "-f", "mp4", converts_file_path.rsplit('.', maxsplit=1)[0] + ".mp4",
-                ]
-            _output = subprocess.check_output(
-                ffmpeg_command, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
-            )
-            if is_original_delete:
-                time.sleep(1)
-                if os.path.exists(converts_file_path):
-                    os.remove(converts_file_path)
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Error occurred during conversion: {e}')
-    except Exception as e:
-        logger.error(f'An unknown error occurred: {e}')
+    if converts_to_h264:
+        color_obj.print_colored("已加入转码队列: MP4格式并重新编码为h264\n", color_obj.YELLOW)
+    else:
+        color_obj.print_colored("已加入转码队列: MP4格式\n", color_obj.YELLOW)
+    post_queue.submit(
+        postprocess.KIND_MP4, converts_file_path, {'h264': converts_to_h264, 'delete_source': is_original_delete},
+        priority=postprocess.PRIORITY_ENCODE if converts_to_h264 else postprocess.PRIORITY_REMUX
+    )
 
 
 def converts_m4a(converts_file_path: str, is_original_delete: bool = True) -> None:
-    try:
-        if os.path.exists(converts_file_path) and os.path.getsize(converts_file_path) > 0:
-            _output = subprocess.check_output([
-                "ffmpeg", "-i", converts_file_path,
-                "-n", "-vn",
-                "-c:a", "aac", "-bsf:a", "aac_adtstoasc", "-ab", "320k",
-                converts_file_path.rsplit('.', maxsplit=1)[0] + ".m4a",
-            ], stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type))
-            if is_original_delete:
-                time.sleep(1)
-                if os.path.exists(converts_file_path):
-                    os.remove(converts_file_path)
-    except subprocess.CalledProcessError as e:
-        logger.error(f'Error occurred during conversion: {e}')
-    except Exception as e:
-        logger.error(f'An unknown error occurred: {e}')
-
-
-def generate_subtitles(record_name: str, ass_filename: str, sub_format: str = 'srt') -> None:
-    index_time = 0
-    today = datetime.datetime.now()
-    re_datatime = today.strftime('%Y-%m-%d %H:%M:%S')
-
-    def transform_int_to_time(seconds: int) -> str:
-        m, s = divmod(seconds, 60)
-        h, m = divmod(m, 60)
-        return f"{h:02d}:{m:02d}:{s:02d}"
-
-    while True:
-        index_time += 1
-        txt = str(index_time) + "\n" + transform_int_to_time(index_time) + ',000 --> ' + transform_int_to_time(
-            index_time + 1) + ',000' + "\n" + str(re_datatime) + "\n\n"
-
-        with open(f"{ass_filename}.{sub_format.lower()}", 'a', encoding=text_encoding) as f:
-            f.write(txt)
-
-        if record_name not in recording:
-            return
-        time.sleep(1)
-        today = datetime.datetime.now()
-        re_datatime = today.strftime('%Y-%m-%d %H:%M:%S')
+    post_queue.submit(postprocess.KIND_M4A, converts_file_path, {'delete_source': is_original_delete})
 
 
 def adjust_max_request() -> None:
@@ -373,80 +247,133 @@ def run_script(command: str) -> None:
         logger.error('Please add `#!/bin/bash` at the beginning of your bash script file.')
 
 
+def collect_status() -> dict:
+    """状态接口/状态文件的内容：监测的直播间、录制状态、时长、码率和错误数"""
+    now = time.time()
+    # 在状态接口/状态文件线程中调用：只读取监管器和登记表的快照，录制线程同时增删也不会出错
+    processes = {id(p.stop_event): p for p in supervisor.default_supervisor.active if p.stop_event}
+    room_list = []
+    for room in rooms.all():
+        stop_event, recording_since = room.stop_event, room.recording_since
+        item = {'url': room.url, 'name': room.name, 'quality': room.quality, 'cancelled': room.cancelled,
+                'recording': stop_event is not None}
+        if stop_event is not None:
+            item['record_name'] = room.record_name
+            item['duration'] = round(now - recording_since) if recording_since else None
+            process = processes.get(id(stop_event))
+            if process:
+                item['bitrate_kbps'] = process.progress.bitrate_kbps
+                item['speed'] = process.progress.speed
+                item['output_bytes'] = process.output_size
+                item['stalls'] = process.stalls
+        room_list.append(item)
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'uptime': round(now - program_start_time),
+        'ffmpeg': ffmpeg_version(),
+        'monitoring': len(room_list),
+        'recording': sum(1 for item in room_list if item['recording']),
+        'errors': {'recent': error_count, 'max_request': max_request},
+        'disk_free_gb': round(utils.check_disk_capacity(video_save_path or default_path), 2),
+        'post_processing': post_queue.status(),
+        'rooms': room_list,
+    }
+
+
 def clear_record_info(record_name: str, record_url: str) -> None:
     global monitoring
     recording.discard(record_name)
-    if record_url in url_comments and record_url in running_list:
-        running_list.remove(record_url)
+    room = rooms.get(record_url)
+    if room and room.cancelled:
+        rooms.discard(record_url)
         monitoring -= 1
         color_obj.print_colored(f"[{record_name}]已经从录制列表中移除\n", color_obj.YELLOW)
 
 
 def direct_download_stream(source_url: str, save_path: str, record_name: str, live_url: str, platform: str) -> bool:
+    headers = {}
+    header_params = get_record_headers(platform, live_url)
+    if header_params:
+        key, value = header_params.split(":", 1)
+        headers[key] = value
+
+    stop_event = rooms.attach_stop(live_url, record_name=record_name)
     try:
-        with open(save_path, 'wb') as f:
-            client = httpx.Client(timeout=None)
-
-            headers = {}
-            header_params = get_record_headers(platform, live_url)
-            if header_params:
-                key, value = header_params.split(":", 1)
-                headers[key] = value
-
-            with client.stream('GET', source_url, headers=headers, follow_redirects=True) as response:
-                if response.status_code != 200:
-                    logger.error(f"请求直播流失败，状态码: {response.status_code}")
-                    return False
-
-                downloaded = 0
-                chunk_size = 1024 * 16
-
-                for chunk in response.iter_bytes(chunk_size):
-                    if live_url in url_comments or exit_recording:
-                        color_obj.print_colored(f"[{record_name}]录制时已被注释或请求停止,下载中断", color_obj.YELLOW)
-                        clear_record_info(record_name, live_url)
-                        return False
-
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                print()
-                return True
+        stats = flv_downloader.download_flv(source_url, save_path, headers=headers, stop_event=stop_event)
     except Exception as e:
         logger.error(f"FLV下载错误: {e} 发生错误的行数: {e.__traceback__.tb_lineno}")
         return False
+    finally:
+        rooms.release_stop(live_url, stop_event)
+
+    if stats.stopped:
+        color_obj.print_colored(f"[{record_name}]录制时已被注释或请求停止,下载中断", color_obj.YELLOW)
+        clear_record_info(record_name, live_url)
+        return False
+    print()
+    return stats.bytes > 0
+
+
+def finalize_fmp4(save_file_path: str) -> None:
+    """整理直接录制的分片MP4（截掉不完整的末尾片段、写回时长），分段录制时整理所有分段文件"""
+    if '%' in save_file_path:
+        prefix = os.path.basename(save_file_path).rsplit('_', maxsplit=1)[0]
+        paths = [path for path in utils.get_file_paths(os.path.dirname(save_file_path))
+                 if prefix in path and path.endswith('.mp4')]
+    else:
+        paths = [save_file_path]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            fmp4.finalize(path)
+        except OSError as e:
+            logger.error(f"分片MP4整理失败 {path}: {e}")
 
 
 def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, save_type: str,
-                     script_command: str | None = None) -> bool:
+                     script_command: str | None = None, hls_input: hls.HlsFetcher | None = None) -> bool:
     save_file_path = ffmpeg_command[-1]
-    process = subprocess.Popen(
-        ffmpeg_command, stdin=subprocess.PIPE, stderr=subprocess.STDOUT, startupinfo=get_startup_info(os_type)
-    )
+    command = [ffmpeg_command[0], *supervisor.progress_args(), *ffmpeg_command[1:]]
+    if embed_record_time:
+        # 把录制开始的实际时间写入容器元数据，播放器和剪辑软件可据此还原时间线
+        creation_time = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        command[-1:-1] = ['-metadata', f'creation_time={creation_time}']
+
+    # 内置HLS下载器与FFmpeg共用停止信号，停止时下载器关闭输入，FFmpeg正常收尾
+    stop_event = rooms.attach_stop(record_url, hls_input.stop_event if hls_input else None, record_name)
 
-    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
-    subs_thread_name = f'subs_{Path(subs_file_path).name}'
+    stdin = subprocess.PIPE
+    if hls_input:
+        stdin, hls_write_fd = os.pipe()
+        threading.Thread(target=hls_input.fetch_to, args=(os.fdopen(hls_write_fd, 'wb'),), daemon=True).start()
+
+    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0] + '.srt'
     if create_time_file and not split_video_by_time and '音频' not in save_type:
-        create_var[subs_thread_name] = threading.Thread(
-            target=generate_subtitles, args=(record_name, subs_file_path)
+        subtitles.default_writer.start(subs_file_path, text_encoding)
+
+    try:
+        process = supervisor.default_supervisor.run_sync(
+            command, output_path=save_file_path, stall_timeout=ffmpeg_stall_timeout or None, stop_event=stop_event,
+            stdin=stdin, startupinfo=get_startup_info(os_type)
         )
-        create_var[subs_thread_name].daemon = True
-        create_var[subs_thread_name].start()
-
-    while process.poll() is None:
-        if record_url in url_comments or exit_recording:
-            color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
-            clear_record_info(record_name, record_url)
-            # process.terminate()
-            if os.name == 'nt':
-                if process.stdin:
-                    process.stdin.write(b'q')
-                    process.stdin.close()
-            else:
-                process.send_signal(signal.SIGINT)
-            process.wait()
-            return True
-        time.sleep(1)
+    finally:
+        rooms.release_stop(record_url, stop_event)
+        subtitles.default_writer.finish(subs_file_path)
+        if hls_input:
+            os.close(stdin)
+
+    if save_type == 'MP4' and finalize_fragmented_mp4:
+        finalize_fmp4(save_file_path)
+
+    if process.stopped:
+        color_obj.print_colored(f"[{record_name}]录制时已被注释,本条线程将会退出", color_obj.YELLOW)
+        clear_record_info(record_name, record_url)
+        return True
+
+    if process.stalls:
+        color_obj.print_colored(
+            f"[{record_name}]录制文件 {ffmpeg_stall_timeout} 秒未增长，已结束本次录制并重新检测", color_obj.YELLOW)
 
     return_code = process.returncode
     stop_time = time.strftime('%Y-%m-%d %H:%M:%S')
@@ -457,9 +384,9 @@ def check_subprocess(record_name: str, record_url: str, ffmpeg_command: list, sa
                 prefix = os.path.basename(save_file_path).rsplit('_', maxsplit=1)[0]
                 for path in file_paths:
                     if prefix in path:
-                        threading.Thread(target=converts_mp4, args=(path, delete_origin_file)).start()
+                        converts_mp4(path, delete_origin_file)
             else:
-                threading.Thread(target=converts_mp4, args=(save_file_path, delete_origin_file)).start()
+                converts_mp4(save_file_path, delete_origin_file)
         print(f"\n{record_name} {stop_time} 直播录制完成\n")
 
         if script_command:
@@ -542,8 +469,9 @@ def select_source_url(link, stream_info):
     return stream_info.get('record_url')
 
 
-def start_record(url_data: tuple, count_variable: int = -1) -> None:
+def start_record(room: room_registry.RoomState, count_variable: int = -1) -> None:
     global error_count
+    url_data = room.as_tuple()
 
     while True:
         try:
@@ -575,6 +503,10 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
             # print(f'\r代理地址:{proxy_address}')
             # print(f'\r全局代理:{global_proxy}')
             while True:
+                if room.cancelled:
+                    print(f"[{anchor_name or record_url}]已被注释,本条线程将会退出")
+                    clear_record_info(f'序号{count_variable} {anchor_name}', record_url)
+                    return
                 try:
                     port_info = []
                     if record_url.find("douyin.com/") > -1:
@@ -1058,18 +990,17 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                         anchor_name = clean_name(anchor_name)
                         record_name = f'序号{count_variable} {anchor_name}'
 
-                        if record_url in url_comments:
+                        if room.cancelled:
                             print(f"[{anchor_name}]已被注释,本条线程将会退出")
                             clear_record_info(record_name, record_url)
                             return
 
                         if not url_data[-1] and run_once is False:
                             if new_record_url:
-                                need_update_line_list.append(
-                                    f'{record_url}|{new_record_url},主播: {anchor_name.strip()}')
-                                not_record_list.append(new_record_url)
+                                url_watcher.queue_edit(record_url, f'{new_record_url},主播: {anchor_name.strip()}')
+                                rooms.alias(record_url, new_record_url)
                             else:
-                                need_update_line_list.append(f'{record_url}|{record_url},主播: {anchor_name.strip()}')
+                                url_watcher.queue_edit(record_url, f'{record_url},主播: {anchor_name.strip()}')
                             run_once = True
 
                         push_at = datetime.datetime.today().strftime('%Y-%m-%d %H:%M:%S')
@@ -1111,7 +1042,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 start_pushed = True
 
                             if disable_record:
-                                time.sleep(push_check_seconds)
+                                room.wait(push_check_seconds)
                                 continue
 
                             real_url = select_source_url(record_url, port_info)
@@ -1163,7 +1094,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                 probesize = "10000000"
                                 bufsize = "8000k"
                                 max_muxing_queue_size = "1024"
-                                for pt_host in overseas_platform_host:
+                                for pt_host in url_config.OVERSEAS_PLATFORM_HOSTS:
                                     if pt_host in record_url:
                                         rw_timeout = "50000000"
                                         analyzeduration = "40000000"
@@ -1203,6 +1134,17 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     ffmpeg_command.insert(1, "-http_proxy")
                                     ffmpeg_command.insert(2, proxy_address)
 
+                                hls_input = None
+                                if use_hls_fetcher and '.m3u8' in real_url:
+                                    hls_headers = {'User-Agent': user_agent}
+                                    if headers:
+                                        key, value = headers.split(":", 1)
+                                        hls_headers[key] = value
+                                    hls_input = hls.HlsFetcher(
+                                        real_url, headers=hls_headers, proxy=proxy_address, prefetch=hls_prefetch
+                                    )
+                                    ffmpeg_command = hls.pipe_input_command(ffmpeg_command)
+
                                 recording.add(record_name)
                                 start_record_time = datetime.datetime.now()
                                 recording_time_list[record_name] = [start_record_time, record_quality_zh]
@@ -1235,6 +1177,11 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                         logger.warning("FLV is not supported for h265 codec, use TS format instead")
                                         record_save_type = "TS"
 
+                                # 直接录制为分片MP4，省去录制完成后的转封装
+                                if record_fragmented_mp4 and converts_to_mp4 and not converts_to_h264 \
+                                        and record_save_type == "TS":
+                                    record_save_type = "MP4"
+
                                 if only_audio_record or any(i in record_save_type for i in ['MP3', 'M4A']):
                                     try:
                                         now = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
@@ -1294,7 +1241,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             record_url,
                                             ffmpeg_command,
                                             record_save_type,
-                                            custom_script
+                                            custom_script,
+                                            hls_input=hls_input
                                         )
                                         if comment_end:
                                             return
@@ -1311,14 +1259,9 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                     save_file_path = f'{full_path}/{filename}'
                                     print(f'{rec_info}/{filename}')
 
-                                    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0]
-                                    subs_thread_name = f'subs_{Path(subs_file_path).name}'
+                                    subs_file_path = save_file_path.rsplit('.', maxsplit=1)[0] + '.srt'
                                     if create_time_file:
-                                        create_var[subs_thread_name] = threading.Thread(
-                                            target=generate_subtitles, args=(record_name, subs_file_path)
-                                        )
-                                        create_var[subs_thread_name].daemon = True
-                                        create_var[subs_thread_name].start()
+                                        subtitles.default_writer.start(subs_file_path, text_encoding)
 
                                     try:
                                         flv_url = port_info.get('flv_url')
@@ -1348,6 +1291,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                         with max_request_lock:
                                             error_count += 1
                                             error_window.append(1)
+                                    finally:
+                                        subtitles.default_writer.finish(subs_file_path)
 
                                 elif record_save_type == "FLV":
                                     filename = anchor_name + f'_{title_in_name}' + now + ".flv"
@@ -1386,7 +1331,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             record_url,
                                             ffmpeg_command,
                                             record_save_type,
-                                            custom_script
+                                            custom_script,
+                                            hls_input=hls_input
                                         )
                                         if comment_end:
                                             return
@@ -1407,10 +1353,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                     is_original_delete=delete_origin_file
                                                 )
                                             else:
-                                                threading.Thread(
-                                                    target=converts_mp4,
-                                                    args=(save_file_path, delete_origin_file)
-                                                ).start()
+                                                converts_mp4(save_file_path, delete_origin_file)
 
                                         else:
                                             seg_file_path = f"{full_path}/{anchor_name}_{title_in_name}{now}_%03d.flv"
@@ -1460,7 +1403,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             record_url,
                                             ffmpeg_command,
                                             record_save_type,
-                                            custom_script
+                                            custom_script,
+                                            hls_input=hls_input
                                         )
                                         if comment_end:
                                             return
@@ -1488,7 +1432,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 "-segment_time", split_time,
                                                 "-segment_format", "mp4",
                                                 "-reset_timestamps", "1",
-                                                "-movflags", "+frag_keyframe+empty_moov",
+                                                *fmp4.movflags_args(),
                                                 save_file_path,
                                             ]
 
@@ -1497,6 +1441,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 "-map", "0",
                                                 "-c:v", "copy",
                                                 "-c:a", "copy",
+                                                *fmp4.movflags_args(),
                                                 "-f", "mp4",
                                                 save_file_path,
                                             ]
@@ -1507,7 +1452,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                             record_url,
                                             ffmpeg_command,
                                             record_save_type,
-                                            custom_script
+                                            custom_script,
+                                            hls_input=hls_input
                                         )
                                         if comment_end:
                                             return
@@ -1543,7 +1489,8 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 record_url,
                                                 ffmpeg_command,
                                                 record_save_type,
-                                                custom_script
+                                                custom_script,
+                                                hls_input=hls_input
                                             )
                                             if comment_end:
                                                 if converts_to_mp4:
@@ -1552,10 +1499,7 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                     for path in file_paths:
                                                         if prefix in path:
                                                             try:
-                                                                threading.Thread(
-                                                                    target=converts_mp4,
-                                                                    args=(path, delete_origin_file)
-                                                                ).start()
+                                                                converts_mp4(path, delete_origin_file)
                                                             except subprocess.CalledProcessError as e:
                                                                 logger.error(f"转码失败: {e} ")
                                                 return
@@ -1587,12 +1531,11 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                                                 record_url,
                                                 ffmpeg_command,
                                                 record_save_type,
-                                                custom_script
+                                                custom_script,
+                                                hls_input=hls_input
                                             )
                                             if comment_end:
-                                                threading.Thread(
-                                                    target=converts_mp4, args=(save_file_path, delete_origin_file)
-                                                ).start()
+                                                converts_mp4(save_file_path, delete_origin_file)
                                                 return
 
                                         except subprocess.CalledProcessError as e:
@@ -1634,7 +1577,9 @@ def start_record(url_data: tuple, count_variable: int = -1) -> None:
                     x = x - 1
                     if loop_time:
                         print(f'\r{anchor_name}循环等待{x}秒 ', end="")
-                    time.sleep(1)
+                    # 直播间被注释或删除时立即结束等待
+                    if room.wait(1):
+                        break
                 if loop_time:
                     print('\r检测直播间中...', end="")
         except Exception as e:
@@ -1691,6 +1636,9 @@ def backup_file_start() -> None:
 
 
 def check_ffmpeg_existence() -> bool:
+    # 能在 PATH 中找到 ffmpeg 时直接继续，不再在启动时运行 ffmpeg -version（版本号见 ffmpeg_version）
+    if shutil.which('ffmpeg'):
+        return True
     try:
         result = subprocess.run(['ffmpeg', '-version'], check=True, capture_output=True, text=True)
         if result.returncode == 0:
@@ -1710,6 +1658,16 @@ def check_ffmpeg_existence() -> bool:
     return False
 
 
+@functools.lru_cache(maxsize=1)
+def ffmpeg_version() -> str | None:
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = result.stdout.splitlines()
+    return lines[0] if lines else None
+
+
 # --------------------------初始化程序-------------------------------------
 print("-----------------------------------------------------")
 print("|                DouyinLiveRecorder                 |")
@@ -1725,34 +1683,24 @@ if not check_ffmpeg_existence():
 os.makedirs(os.path.dirname(config_file), exist_ok=True)
 t3 = threading.Thread(target=backup_file_start, args=(), daemon=True)
 t3.start()
+post_queue = postprocess.PostProcessQueue(
+    f'{script_path}/config/postprocess_journal.json', startupinfo=get_startup_info(os_type)
+)
 utils.remove_duplicate_lines(url_config_file)
 
 
-def read_config_value(config_parser: configparser.RawConfigParser, section: str, option: str, default_value: Any) \
-        -> Any:
-    try:
-
-        config_parser.read(config_file, encoding=text_encoding)
-        if '录制设置' not in config_parser.sections():
-            config_parser.add_section('录制设置')
-        if '推送配置' not in config_parser.sections():
-            config_parser.add_section('推送配置')
-        if 'Cookie' not in config_parser.sections():
-            config_parser.add_section('Cookie')
-        if 'Authorization' not in config_parser.sections():
-            config_parser.add_section('Authorization')
-        if '账号密码' not in config_parser.sections():
-            config_parser.add_section('账号密码')
-        return config_parser.get(section, option)
-    except (configparser.NoSectionError, configparser.NoOptionError):
-        config_parser.set(section, option, str(default_value))
-        with open(config_file, 'w', encoding=text_encoding) as f:
-            config_parser.write(f)
+def read_config_value(store: config_store.ConfigStore, section: str, option: str, default_value: Any) -> Any:
+    """从缓存的配置中读取，不存在时写入默认值"""
+    value = store.get(section, option)
+    if value is None:
+        store.set(section, option, str(default_value))
         return default_value
+    return value
 
 
 options = {"是": True, "否": False}
-config = configparser.RawConfigParser()
+config = config_store.get_store(config_file, text_encoding)
+config.on_change(lambda changed: logger.info(f"配置已更新: {', '.join(key for _, key in sorted(changed))}"))
 language = read_config_value(config, '录制设置', 'language(zh_cn/en)', "zh_cn")
 skip_proxy_check = options.get(read_config_value(config, '录制设置', '是否跳过代理检测(是/否)', "否"), False)
 if language and 'en' not in language.lower():
@@ -1787,15 +1735,16 @@ while True:
             with open(config_file, 'w', encoding=text_encoding) as file:
                 pass
 
-        ini_URL_content = ''
-        if os.path.isfile(url_config_file):
-            with open(url_config_file, 'r', encoding=text_encoding) as file:
-                ini_URL_content = file.read().strip()
+        if url_watcher.changed():
+            ini_URL_content = ''
+            if os.path.isfile(url_config_file):
+                with open(url_config_file, 'r', encoding=text_encoding) as file:
+                    ini_URL_content = file.read().strip()
 
-        if not ini_URL_content.strip():
-            input_url = input('请输入要录制的主播直播间网址（尽量使用PC网页端的直播间地址）:\n')
-            with open(url_config_file, 'w', encoding=text_encoding) as file:
-                file.write(input_url)
+            if not ini_URL_content.strip():
+                input_url = input('请输入要录制的主播直播间网址（尽量使用PC网页端的直播间地址）:\n')
+                with open(url_config_file, 'w', encoding=text_encoding) as file:
+                    file.write(input_url)
     except OSError as err:
         logger.error(f"发生 I/O 错误: {err}")
 
@@ -1824,6 +1773,18 @@ while True:
     converts_to_h264 = options.get(read_config_value(config, '录制设置', 'mp4格式重新编码为h264', "否"), False)
     delete_origin_file = options.get(read_config_value(config, '录制设置', '追加格式后删除原文件', "否"), False)
     create_time_file = options.get(read_config_value(config, '录制设置', '生成时间字幕文件', "否"), False)
+    embed_record_time = options.get(read_config_value(config, '录制设置', '录制文件写入开始时间元数据(是/否)', "否"), False)
+    record_fragmented_mp4 = options.get(read_config_value(config, '录制设置', '直接录制为分片MP4(是/否)', "否"), False)
+    finalize_fragmented_mp4 = options.get(
+        read_config_value(config, '录制设置', '分片MP4录制完成后整理文件(是/否)', "是"), False)
+    use_hls_fetcher = options.get(read_config_value(config, '录制设置', '使用内置HLS分片下载器(是/否)', "否"), False)
+    hls_prefetch = int(read_config_value(config, '录制设置', 'HLS并发下载分片数', 4))
+    ffmpeg_stall_timeout = int(read_config_value(config, '录制设置', '录制卡顿超时(秒)', 60))
+    post_workers = int(read_config_value(config, '录制设置', '转码/分段同时进行的任务数', 2))
+    post_niceness = int(read_config_value(config, '录制设置', '转码/分段进程nice值', 10))
+    post_queue.configure(workers=post_workers, niceness=post_niceness)
+    # 首次读取配置后恢复上次未完成的后处理任务
+    post_queue.start()
     is_run_script = options.get(read_config_value(config, '录制设置', '是否录制完成后执行自定义脚本', "否"), False)
     custom_script = read_config_value(config, '录制设置', '自定义脚本执行命令', "") if is_run_script else None
     enable_proxy_platform = read_config_value(
@@ -1831,6 +1792,10 @@ while True:
         'tiktok, soop, pandalive, winktv, flextv, popkontv, twitch, liveme, showroom, chzzk, shopee, shp, youtu, faceit'
     )
     enable_proxy_platform_list = enable_proxy_platform.replace('，', ',').split(',') if enable_proxy_platform else None
+    show_console_status = options.get(read_config_value(config, '录制设置', '控制台显示录制状态(是/否)', "是"), True)
+    status_port = int(read_config_value(config, '录制设置', '状态接口端口(0为关闭)', 0))
+    status_host = read_config_value(config, '录制设置', '状态接口监听地址', "127.0.0.1")
+    status_file_path = read_config_value(config, '录制设置', '状态文件路径(不填则不写入)', "")
     extra_enable_proxy = read_config_value(config, '录制设置', '额外使用代理录制的平台(逗号分隔)', '')
     extra_enable_proxy_platform_list = extra_enable_proxy.replace('，', ',').split(',') if extra_enable_proxy else None
     live_status_push = read_config_value(config, '推送配置', '直播状态推送渠道', "")
@@ -1932,222 +1897,41 @@ while True:
 
     check_path = video_save_path or default_path
     if utils.check_disk_capacity(check_path, show=first_run) < disk_space_limit:
-        exit_recording = True
+        rooms.stop_all()
         if not recording:
             logger.warning(f"Disk space remaining is below {disk_space_limit} GB. "
                            f"Exiting program due to the disk space limit being reached.")
             sys.exit(-1)
 
 
-    def contains_url(string: str) -> bool:
-        pattern = r"(https?://)?(www\.)?[a-zA-Z0-9-]+(\.[a-zA-Z0-9-]+)+(:\d+)?(/.*)?"
-        return re.search(pattern, string) is not None
-
-
     try:
-        url_comments, line_list, url_line_list = [[] for _ in range(3)]
-        with (open(url_config_file, "r", encoding=text_encoding, errors='ignore') as file):
-            for origin_line in file:
-                if origin_line in line_list:
-                    delete_line(url_config_file, origin_line)
-                line_list.append(origin_line)
-                line = origin_line.strip()
-                if len(line) < 18:
-                    continue
-
-                line_spilt = line.split('主播: ')
-                if len(line_spilt) > 2:
-                    line = update_file(url_config_file, line, f'{line_spilt[0]}主播: {line_spilt[-1]}')
-
-                is_comment_line = line.startswith("#")
-                if is_comment_line:
-                    line = line.lstrip('#')
-
-                if re.search('[,，]', line):
-                    split_line = re.split('[,，]', line)
-                else:
-                    split_line = [line, '']
-
-                if len(split_line) == 1:
-                    url = split_line[0]
-                    quality, name = [video_record_quality, '']
-                elif len(split_line) == 2:
-                    if contains_url(split_line[0]):
-                        quality = video_record_quality
-                        url, name = split_line
-                    else:
-                        quality, url = split_line
-                        name = ''
-                else:
-                    quality, url, name = split_line
-
-                if quality not in ("原画", "蓝光", "超清", "高清", "标清", "流畅"):
-                    quality = '原画'
-
-                if url not in url_line_list:
-                    url_line_list.append(url)
-                else:
-                    delete_line(url_config_file, origin_line)
-
-                url = 'https://' + url if '://' not in url else url
-                url_host = url.split('/')[2]
-
-                platform_host = [
-                    'live.douyin.com',
-                    'v.douyin.com',
-                    'www.douyin.com',
-                    'live.kuaishou.com',
-                    'www.huya.com',
-                    'www.douyu.com',
-                    'www.yy.com',
-                    'live.bilibili.com',
-                    'www.redelight.cn',
-                    'www.xiaohongshu.com',
-                    'xhslink.com',
-                    'www.bigo.tv',
-                    'slink.bigovideo.tv',
-                    'app.blued.cn',
-                    'cc.163.com',
-                    'qiandurebo.com',
-                    'fm.missevan.com',
-                    'look.163.com',
-                    'twitcasting.tv',
-                    'live.baidu.com',
-                    'weibo.com',
-                    'fanxing.kugou.com',
-                    'fanxing2.kugou.com',
-                    'mfanxing.kugou.com',
-                    'www.huajiao.com',
-                    'www.7u66.com',
-                    'wap.7u66.com',
-                    'live.acfun.cn',
-                    'm.acfun.cn',
-                    'live.tlclw.com',
-                    'wap.tlclw.com',
-                    'live.ybw1666.com',
-                    'wap.ybw1666.com',
-                    'www.inke.cn',
-                    'www.zhihu.com',
-                    'www.haixiutv.com',
-                    "h5webcdnp.vvxqiu.com",
-                    "17.live",
-                    'www.lang.live',
-                    "m.pp.weimipopo.com",
-                    "v.6.cn",
-                    "m.6.cn",
-                    'www.lehaitv.com',
-                    'h.catshow168.com',
-                    'e.tb.cn',
-                    'huodong.m.taobao.com',
-                    '3.cn',
-                    'eco.m.jd.com',
-                    'www.miguvideo.com',
-                    'm.miguvideo.com',
-                    'show.lailianjie.com',
-                    'www.imkktv.com',
-                    'www.picarto.tv'
-                ]
-                overseas_platform_host = [
-                    'www.tiktok.com',
-                    'play.sooplive.co.kr',
-                    'm.sooplive.co.kr',
-                    'www.sooplive.com',
-                    'm.sooplive.com',
-                    'www.pandalive.co.kr',
-                    'www.winktv.co.kr',
-                    'www.flextv.co.kr',
-                    'www.ttinglive.com',
-                    'www.popkontv.com',
-                    'www.twitch.tv',
-                    'www.liveme.com',
-                    'www.showroom-live.com',
-                    'chzzk.naver.com',
-                    'm.chzzk.naver.com',
-                    'live.shopee.',
-                    '.shp.ee',
-                    'www.youtube.com',
-                    'youtu.be',
-                    'www.faceit.com'
-                ]
-
-                platform_host.extend(overseas_platform_host)
-                clean_url_host_list = (
-                    "live.douyin.com",
-                    "live.bilibili.com",
-                    "www.huajiao.com",
-                    "www.zhihu.com",
-                    "www.huya.com",
-                    "chzzk.naver.com",
-                    "www.liveme.com",
-                    "www.haixiutv.com",
-                    "v.6.cn",
-                    "m.6.cn",
-                    'www.lehaitv.com'
-                )
-
-                if 'live.shopee.' in url_host or '.shp.ee' in url_host:
-                    url_host = 'live.shopee.' if 'live.shopee.' in url_host else '.shp.ee'
-
-                if url_host in platform_host or any(ext in url for ext in (".flv", ".m3u8")):
-                    if url_host in clean_url_host_list:
-                        url = update_file(url_config_file, old_str=url, new_str=url.split('?')[0])
-
-                    if 'xiaohongshu' in url:
-                        host_id = re.search('&host_id=(.*?)(?=&|$)', url)
-                        if host_id:
-                            new_url = url.split('?')[0] + f'?host_id={host_id.group(1)}'
-                            url = update_file(url_config_file, old_str=url, new_str=new_url)
-
-                    url_comments = [i for i in url_comments if url not in i]
-                    if is_comment_line:
-                        url_comments.append(url)
-                    else:
-                        new_line = (quality, url, name)
-                        url_tuples_list.append(new_line)
-                else:
-                    if not origin_line.startswith('#'):
-                        color_obj.print_colored(f"\r{origin_line.strip()} 本行包含未知链接.此条跳过", color_obj.YELLOW)
-                        update_file(url_config_file, old_str=origin_line, new_str=origin_line, start_str='#')
-
-        while len(need_update_line_list):
-            a = need_update_line_list.pop()
-            replace_words = a.split('|')
-            if replace_words[0] != replace_words[1]:
-                if replace_words[1].startswith("#"):
-                    start_with = '#'
-                    new_word = replace_words[1][1:]
-                else:
-                    start_with = None
-                    new_word = replace_words[1]
-                update_file(url_config_file, old_str=replace_words[0], new_str=new_word, start_str=start_with)
-
-        text_no_repeat_url = list(set(url_tuples_list))
-
-        if len(text_no_repeat_url) > 0:
-            for url_tuple in text_no_repeat_url:
-                monitoring = len(running_list)
-
-                if url_tuple[1] in not_record_list:
-                    continue
-
-                if url_tuple[1] not in running_list:
-                    print(f"\r{'新增' if not first_start else '传入'}地址: {url_tuple[1]}")
-                    monitoring += 1
-                    args = [url_tuple, monitoring]
-                    create_var[f'thread_{monitoring}'] = threading.Thread(target=start_record, args=args)
-                    create_var[f'thread_{monitoring}'].daemon = True
-                    create_var[f'thread_{monitoring}'].start()
-                    running_list.append(url_tuple[1])
-                    time.sleep(local_delay_default)
-        url_tuples_list = []
+        # 只在 URL_config.ini 变化（或有待写入的主播名）时重新解析
+        if url_watcher.poll(video_record_quality):
+            # 被注释或已从配置中删除的地址：立即取消对应的监测和录制
+            rooms.retain({entry.url for entry in url_watcher.entries})
+
+        for url_entry in url_watcher.entries:
+            room = rooms.add(url_entry.url, url_entry.quality, url_entry.name)
+            if room is None:
+                continue
+            monitoring = len(rooms)
+            print(f"\r{'新增' if not first_start else '传入'}地址: {url_entry.url}")
+            args = [room, monitoring]
+            create_var[f'thread_{monitoring}'] = threading.Thread(target=start_record, args=args)
+            create_var[f'thread_{monitoring}'].daemon = True
+            create_var[f'thread_{monitoring}'].start()
+            time.sleep(local_delay_default)
         first_start = False
 
     except Exception as err:
         logger.error(f"错误信息: {err} 发生错误的行数: {err.__traceback__.tb_lineno}")
 
     if first_run:
-        t = threading.Thread(target=display_info, args=(), daemon=True)
-        t.start()
+        if show_console_status:
+            t = threading.Thread(target=display_info, args=(), daemon=True)
+            t.start()
+        if status_port or status_file_path:
+            status_server.StatusServer(collect_status, status_host, status_port, status_file_path).start()
         t2 = threading.Thread(target=adjust_max_request, args=(), daemon=True)
         t2.start()
         first_run = False
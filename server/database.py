@@ -1,7 +1,10 @@
 from typing import Optional, List
 from datetime import datetime
+from sqlalchemy import inspect, text
 from sqlmodel import Field, SQLModel, create_engine, Session, Relationship
 
+RECORD_MODES = ("interval", "continuous")
+
 class TaskBase(SQLModel):
     url: str
     platform: str = "unknown"
@@ -12,6 +15,15 @@ class TaskBase(SQLModel):
     loop_count: int = 1  # Number of times to loop
     max_recordings: int = 0  # 最大录制段数，0表示无限制
     audio_only: bool = False
+    record_mode: str = "interval"  # interval: 每次调度重新连接录制 duration 秒; continuous: 保持一个会话按 duration 切段
+
+    # Scheduling policy
+    max_instances: int = 1  # 同一任务允许同时运行的实例数
+    coalesce: bool = True  # 错过的多次执行合并为一次
+    misfire_grace_time: int = 60  # 错过执行时间后仍允许补跑的秒数
+
+    # Storage
+    storage_quota_mb: int = 0  # 该任务录制文件的空间上限，0表示不限制；超出时按保留策略删除旧视频
     
     # AI Configuration
     ai_enabled: bool = True
@@ -49,11 +61,43 @@ class RecordBase(SQLModel):
     # Analysis Results (JSON stored as string)
     transcript_path: Optional[str] = None
     analysis_result: Optional[str] = None # JSON string
+    timings: Optional[str] = None  # 各阶段耗时 JSON: {stage: {start, end, seconds, bytes, ...}}
 
 class Record(RecordBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     task: Optional[Task] = Relationship(back_populates="records")
 
+class QueuedJob(SQLModel, table=True):
+    """分布式模式下的任务队列，worker 通过租约(lease)认领任务"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = "recording"  # recording, analysis
+    task_id: Optional[int] = Field(default=None, index=True)
+    payload: Optional[str] = None  # JSON string
+    priority: int = 0
+    status: str = Field(default="queued", index=True)  # queued, leased, done, failed
+    attempts: int = 0
+    max_attempts: int = 3
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+class StorageEntry(SQLModel, table=True):
+    """录制产生的文件索引（每条录制的产物清单），用于按任务/主播/平台统计空间占用和执行保留策略，避免遍历目录"""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    path: str = Field(index=True, unique=True)
+    kind: str = "video"  # video, audio, transcript, frame, hls, thumbs
+    bytes: int = 0
+    duration: Optional[float] = None  # 秒，仅音视频
+    sha256: Optional[str] = None
+    task_id: Optional[int] = Field(default=None, index=True)
+    record_id: Optional[int] = Field(default=None, index=True)
+    anchor_id: str = "unknown"
+    platform: str = "unknown"
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+    last_access: datetime = Field(default_factory=datetime.now)
+
 class Settings(SQLModel, table=True):
     key: str = Field(primary_key=True)
     value: str
@@ -64,8 +108,29 @@ sqlite_url = f"sqlite:///{sqlite_file_name}"
 
 engine = create_engine(sqlite_url)
 
+def _add_missing_columns():
+    """为旧数据库补齐新增字段（create_all 不会修改已存在的表）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                default = ""
+                if column.default is not None and column.default.is_scalar:
+                    value = column.default.arg
+                    if isinstance(value, bool):
+                        value = int(value)
+                    default = f" DEFAULT {value!r}" if isinstance(value, str) else f" DEFAULT {value}"
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}{default}'))
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
 
 def get_session():
     with Session(engine) as session:
@@ -1,22 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from typing import Optional
 from contextlib import asynccontextmanager
 from sqlmodel import Session, select
-from database import create_db_and_tables, get_session, Task, TaskBase, Record, Settings, engine
-from scheduler import start_scheduler, add_task_job, remove_task_job
+from database import create_db_and_tables, get_session, Task, TaskBase, Record, Settings, engine, RECORD_MODES
+from scheduler import start_scheduler, add_task_job, remove_task_job, restore_task_jobs
+from services.admission import AdmissionController
+from services.media_processor import MediaProcessor
+from services.job_queue import get_job_queue
+from services import metrics, stage_timer
+from services.stream_fetcher import StreamFetcher
+from services.url_cache import ResolvedUrlCache
+from services.storage_manager import StorageManager
+from services.media_server import MediaServer
+import json
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+    AdmissionController.configure_from_settings()
+    MediaProcessor.configure_from_settings()
     start_scheduler()
     # Restore active tasks on startup
     with Session(engine) as session:
         tasks = session.exec(select(Task).where(Task.is_active == True)).all()
-        for task in tasks:
-            add_task_job(task)
+        restore_task_jobs(tasks)
     yield
 
 app = FastAPI(lifespan=lifespan)
+metrics.instrument_db_commits()
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -40,6 +51,8 @@ elif os.path.exists("../storage"):
 
 @app.post("/tasks/", response_model=Task)
 def create_task(task: TaskBase, session: Session = Depends(get_session)):
+    if task.record_mode not in RECORD_MODES:
+        raise HTTPException(status_code=400, detail=f"record_mode must be one of {RECORD_MODES}")
     db_task = Task.model_validate(task)
     session.add(db_task)
     session.commit()
@@ -69,12 +82,16 @@ def update_task(task_id: int, task_update: TaskBase, session: Session = Depends(
         raise HTTPException(status_code=404, detail="Task not found")
     
     task_data = task_update.model_dump(exclude_unset=True)
+    if task_data.get("record_mode", db_task.record_mode) not in RECORD_MODES:
+        raise HTTPException(status_code=400, detail=f"record_mode must be one of {RECORD_MODES}")
     for key, value in task_data.items():
         setattr(db_task, key, value)
         
     session.add(db_task)
     session.commit()
     session.refresh(db_task)
+    if "url" in task_data:
+        ResolvedUrlCache.invalidate(task_id, "task url changed")
     
     # Update scheduler
     if db_task.is_active:
@@ -91,6 +108,8 @@ def delete_task(task_id: int, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Task not found")
     
     remove_task_job(task_id)
+    ResolvedUrlCache.invalidate(task_id, "task deleted")
+    StorageManager.remove_task(session, task_id)
     session.delete(task)
     session.commit()
     return {"ok": True}
@@ -169,17 +188,113 @@ def read_record(record_id: int, session: Session = Depends(get_session)):
     record = session.get(Record, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
+    StorageManager.touch_record(session, record_id)
     return record
 
+@app.get("/records/{record_id}/artifacts")
+def read_record_artifacts(record_id: int, session: Session = Depends(get_session)):
+    """单条录制的产物清单（路径、类型、大小、时长、sha256），来自 StorageEntry 索引"""
+    record = session.get(Record, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return {"record_id": record.id, "artifacts": StorageManager.artifacts(session, record_id)}
+
+def _get_record(session: Session, record_id: int) -> Record:
+    record = session.get(Record, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return record
+
+@app.get("/records/{record_id}/media/video")
+def read_record_video(record_id: int, request: Request, session: Session = Depends(get_session)):
+    """录像文件，支持 Range 请求（拖动进度条时只读取需要的部分）"""
+    return MediaServer.video(_get_record(session, record_id), request.headers.get("range"))
+
+@app.get("/records/{record_id}/media/hls/{name}")
+async def read_record_hls(record_id: int, name: str, session: Session = Depends(get_session)):
+    """按需打包的 HLS 播放列表和分片，首次请求时生成并缓存"""
+    return await MediaServer.hls(session, _get_record(session, record_id), name)
+
+@app.get("/records/{record_id}/media/thumbnail.webp")
+async def read_record_thumbnail(record_id: int, session: Session = Depends(get_session)):
+    """列表用的小尺寸 WebP 缩略图"""
+    return await MediaServer.thumbnail(session, _get_record(session, record_id))
+
+@app.get("/records/{record_id}/media/sprite")
+async def read_record_sprite(record_id: int, session: Session = Depends(get_session)):
+    """拖动预览雪碧图的排列信息（首次请求时生成雪碧图）"""
+    return await MediaServer.sprite(session, _get_record(session, record_id))
+
+@app.get("/records/{record_id}/media/sprite.webp")
+def read_record_sprite_image(record_id: int, session: Session = Depends(get_session)):
+    return MediaServer.sprite_image(_get_record(session, record_id))
+
+@app.get("/records/{record_id}/timings")
+def read_record_timings(record_id: int, session: Session = Depends(get_session)):
+    """单条录制各阶段耗时"""
+    record = session.get(Record, record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return {"record_id": record.id, "status": record.status, "stages": json.loads(record.timings or "{}")}
+
+@app.get("/timings/summary")
+def read_timings_summary(group_by: str = "task", limit: int = 500, session: Session = Depends(get_session)):
+    """按任务或平台汇总最近 limit 条录制的各阶段耗时百分位"""
+    if group_by not in ("task", "platform"):
+        raise HTTPException(status_code=400, detail="group_by must be 'task' or 'platform'")
+
+    rows = session.exec(
+        select(Record, Task)
+        .join(Task, Record.task_id == Task.id)
+        .where(Record.timings != None)
+        .order_by(Record.start_time.desc())
+        .limit(limit)
+    ).all()
+
+    groups: dict[str, list[dict]] = {}
+    for record, task in rows:
+        if group_by == "task":
+            key = str(task.id)
+        else:
+            key = task.platform if task.platform != "unknown" else StreamFetcher.get_platform(task.url)
+        groups.setdefault(key, []).append(json.loads(record.timings))
+    return {"group_by": group_by, "records": len(rows), "groups": stage_timer.summarize(groups)}
+
 @app.delete("/records/{record_id}")
 def delete_record(record_id: int, session: Session = Depends(get_session)):
     record = session.get(Record, record_id)
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
+    StorageManager.remove_record(session, record)
     session.delete(record)
     session.commit()
     return {"ok": True}
 
+@app.get("/admission/")
+def read_admission_stats():
+    """FFmpeg 准入队列状态（各类槽位占用、排队数、等待时间）"""
+    return AdmissionController.stats()
+
+@app.get("/url-cache/")
+def read_url_cache():
+    """已缓存的直播流地址（按任务ID），以及距离过期的秒数"""
+    return ResolvedUrlCache.stats()
+
+@app.get("/storage-usage/")
+def read_storage_usage():
+    """录制文件空间占用（按类型/任务/主播/平台）、配额、保留策略和按当前写入速率估算的写满时间"""
+    return StorageManager.stats()
+
+@app.get("/metrics")
+def read_metrics():
+    """Prometheus 文本格式的运行指标"""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/queue/")
+def read_queue_stats():
+    """分布式任务队列状态"""
+    return get_job_queue().stats()
+
 # Settings API
 from database import Settings
 from services.prompt_manager import PromptManager
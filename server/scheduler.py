@@ -1,24 +1,137 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.triggers.interval import IntervalTrigger
 from sqlmodel import Session, select
 from database import engine, Task, Record
 from services.stream_fetcher import StreamFetcher
-from services.recorder import RecorderService
+from services.recorder import RecorderService, StreamUrlRejected, StreamStalled
 from services.ai_service import AIService
 from services.media_processor import MediaProcessor
 from services.prompt_manager import PromptManager
+from services.job_queue import get_job_queue, is_distributed
+from services.metrics import RECORDING_JOB_SECONDS
+from services.stage_timer import StageTimings, file_size
+from services.storage_manager import StorageManager, STORAGE_ROOT
+from services.url_cache import ResolvedUrlCache
+import asyncio
+import json
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 import os
 
 logger = logging.getLogger(__name__)
 
-scheduler = AsyncIOScheduler()
+# 任务持久化到同一个 SQLite 数据库，重启后无需重建全部调度任务
+scheduler = AsyncIOScheduler(
+    jobstores={"default": SQLAlchemyJobStore(engine=engine, tablename="apscheduler_jobs")},
+    job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 60},
+)
+
+# 首次执行时间的最大错峰窗口（秒），避免重启后所有任务同时触发
+STAGGER_WINDOW = 300
+# 分布式模式下分析任务的优先级：排在录制任务之后认领（priority 越小越先执行），不耽误开播录制
+ANALYSIS_PRIORITY = 10
 
 async def recording_job(task_id: int):
+    """
+    调度入口：单机模式下直接执行录制，分布式模式下只把任务放入队列，由 worker 进程认领执行
+    """
+    if not is_distributed():
+        await execute_recording_job(task_id)
+        return
+
+    with Session(engine) as session:
+        task = session.get(Task, task_id)
+        if not task or not task.is_active:
+            logger.info(f"Task {task_id} is inactive or deleted.")
+            return
+        max_pending = task.max_instances
+
+    # 入队很快，APScheduler 的 max_instances 无法限制 worker 侧的并发，因此在入队时去重
+    get_job_queue().enqueue("recording", task_id=task_id, max_pending=max_pending)
+
+
+async def execute_recording_job(task_id: int):
     """
     录制任务主函数 - 作为后台任务运行
     """
+    started = time.perf_counter()
+    status = "skipped"
+    try:
+        status = await _run_recording_job(task_id) or "skipped"
+    finally:
+        RECORDING_JOB_SECONDS.observe(time.perf_counter() - started, status=status)
+
+
+def _enqueue_analysis(task: Task, record: Record) -> bool:
+    """分布式模式下把 AI 处理放入队列由任意 worker 执行，录制 worker 可以立即认领下一个录制；已入队返回 True"""
+    if not task.ai_enabled or not is_distributed():
+        return False
+    get_job_queue().enqueue("analysis", task_id=task.id, payload={"record_id": record.id},
+                            priority=ANALYSIS_PRIORITY)
+    logger.info(f"[Task {task.id}] Queued AI processing for record {record.id}")
+    return True
+
+
+async def execute_analysis_job(record_id: int):
+    """对已录制完成的录像执行 AI 流水线（worker 认领 analysis 任务后调用）"""
+    with Session(engine) as session:
+        record = session.get(Record, record_id)
+        task = session.get(Task, record.task_id) if record else None
+        if not record or not task:
+            logger.info(f"Record {record_id} or its task no longer exists, skip analysis")
+            return
+        if not record.video_path or not os.path.isfile(record.video_path):
+            raise Exception(f"Video of record {record_id} not found")
+
+        timings = StageTimings()
+        timings.stages = json.loads(record.timings) if record.timings else {}
+        try:
+            if task.ai_enabled and not _load_api_key(session):
+                raise Exception(API_KEY_ERROR)
+            frames_dir = os.path.join(StorageManager.record_dir(task.id, record.id), "frames")
+            await _process_record(session, task, record, timings, frames_dir)
+        except Exception as e:
+            record.status = "failed"
+            record.analysis_result = str(e)
+            record.timings = timings.to_json()
+            session.add(record)
+            session.commit()
+            raise
+        finally:
+            await _track_storage(session, task, record)
+        _check_max_recordings(session, task)
+
+
+API_KEY_ERROR = "DashScope API Key not configured. Please go to Settings to input your API Key."
+
+
+def _load_api_key(session: Session) -> bool:
+    from database import Settings
+    db_setting = session.get(Settings, "DASHSCOPE_API_KEY")
+    if not db_setting:
+        # Fallback to lowercase key if uppercase not found
+        db_setting = session.get(Settings, "dashscope_api_key")
+
+    if not db_setting or not db_setting.value:
+        logger.error(API_KEY_ERROR)
+        return False
+
+    AIService.set_api_key(db_setting.value)
+    logger.info("API key loaded successfully")
+    return True
+
+
+def _invalidate_reason(error: Exception) -> str:
+    if isinstance(error, StreamStalled):
+        return "stream stalled"
+    if isinstance(error, StreamUrlRejected):
+        return "rejected by CDN"
+    return "recording failed"
+
+
+async def _run_recording_job(task_id: int) -> str | None:
     logger.info(f"========== Starting recording job for task {task_id} ==========")
     with Session(engine) as session:
         task = session.get(Task, task_id)
@@ -26,6 +139,9 @@ async def recording_job(task_id: int):
             logger.info(f"Task {task_id} is inactive or deleted.")
             return
 
+        if task.record_mode == "continuous":
+            return await _run_continuous_job(session, task)
+
         # Create Record
         record = Record(task_id=task.id, anchor_id=task.anchor_id, anchor_name=task.anchor_name, status="recording")
         session.add(record)
@@ -33,168 +149,416 @@ async def recording_job(task_id: int):
         session.refresh(record)
         
         logger.info(f"Created record {record.id} for task {task_id}")
+        timings = StageTimings()
         
         try:
             # 0. Load API Key (DB Only)
             if task.ai_enabled:
                 logger.info(f"AI enabled for task {task_id}, loading API key")
-                
-                from database import Settings
-                db_setting = session.get(Settings, "DASHSCOPE_API_KEY")
-                if not db_setting:
-                     # Fallback to lowercase key if uppercase not found
-                     db_setting = session.get(Settings, "dashscope_api_key")
-                
-                if not db_setting or not db_setting.value:
-                    error_msg = "DashScope API Key not configured. Please go to Settings to input your API Key."
-                    logger.error(error_msg)
+                if not _load_api_key(session):
                     record.status = "failed"
-                    record.analysis_result = error_msg
+                    record.analysis_result = API_KEY_ERROR
                     session.add(record)
                     session.commit()
-                    return
-
-                AIService.set_api_key(db_setting.value)
-                logger.info("API key loaded successfully")
-            
-            # 1. Get Stream URL
-            logger.info(f"[Task {task_id}] Step 1/5: Fetching stream URL for {task.url}")
-            stream_info = await StreamFetcher.get_stream_url(task.url)
-            
-            if not stream_info.get('is_live'):
-                 logger.info(f"Stream {task.url} is not live.")
-                 record.status = "failed"
-                 record.analysis_result = "Stream is not live"
-                 session.add(record)
-                 session.commit()
-                 return
-
-            real_url = stream_info.get('record_url')
-            if not real_url:
-                raise Exception("No stream URL found")
+                    return record.status
             
-            logger.info(f"[Task {task_id}] Stream URL obtained: {real_url[:50]}...")
-                
-            # 2. Record
-            logger.info(f"[Task {task_id}] Step 2/5: Starting recording (duration: {task.duration}s)")
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}.mp4"
-            # storage/task_id/filename
-            save_dir = os.path.join("storage", str(task.id))
+            extension = MediaProcessor.audio_extension() if task.audio_only else "mp4"
+            filename = f"{timestamp}.{extension}"
+            # storage/task_id/record_id/filename，每条录制的产物放在各自目录下
+            save_dir = StorageManager.record_dir(task.id, record.id)
             save_path = os.path.join(save_dir, filename)
-            
-            logger.info(f"Recording to {save_path}")
-            await RecorderService.record_stream(real_url, save_path, task.duration, task.audio_only)
+
+            # 录制失败或卡顿时丢弃缓存的地址（缓存命中时 is_live 总是 True，可能已下播或签名失效），
+            # 用的是缓存地址时重新解析后再录一次
+            for attempt in range(2):
+                # 1. Get Stream URL
+                logger.info(f"[Task {task_id}] Step 1/5: Fetching stream URL for {task.url}")
+                with timings.stage("resolve") as stage:
+                    stream_info = await StreamFetcher.get_stream_url(task.url, cache_key=task.id)
+                    stage["cached"] = bool(stream_info.get("cached"))
+
+                if not stream_info.get('is_live'):
+                     logger.info(f"Stream {task.url} is not live.")
+                     record.status = "failed"
+                     record.analysis_result = "Stream is not live"
+                     record.timings = timings.to_json()
+                     session.add(record)
+                     session.commit()
+                     return record.status
+
+                real_url = stream_info.get('record_url')
+                if not real_url:
+                    raise Exception("No stream URL found")
+
+                logger.info(f"[Task {task_id}] Stream URL obtained: {real_url[:50]}...")
+
+                # 2. Record
+                logger.info(f"[Task {task_id}] Step 2/5: Starting recording (duration: {task.duration}s)")
+                logger.info(f"Recording to {save_path}")
+                try:
+                    with timings.stage("record") as stage:
+                        await RecorderService.record_stream(real_url, save_path, task.duration, task.audio_only,
+                                                            candidates=stream_info.get("candidate_urls"),
+                                                            on_stall=lambda: ResolvedUrlCache.invalidate(
+                                                                task.id, "stream stalled"))
+                        stage["bytes"] = file_size(save_path)
+                    break
+                except Exception as e:
+                    ResolvedUrlCache.invalidate(task.id, _invalidate_reason(e))
+                    if not stream_info.get("cached") or attempt:
+                        raise
+                    logger.warning(f"[Task {task_id}] Recording from cached stream URL failed, re-resolving: {e}")
             
             logger.info(f"[Task {task_id}] Recording completed successfully")
             record.video_path = save_path
             record.end_time = datetime.now()
             record.status = "processing"
+            record.timings = timings.to_json()
             session.add(record)
             session.commit()
             
-            # 3. AI Processing
-            if task.ai_enabled:
-                logger.info(f"[Task {task_id}] Step 3/5: Starting AI processing")
-                
-                # Extract Audio
-                logger.info(f"[Task {task_id}] Extracting audio...")
-                audio_path = os.path.join(save_dir, f"{timestamp}.wav")
+            # 3. AI Processing（分布式模式下放入队列）
+            if not _enqueue_analysis(task, record):
+                await _process_record(session, task, record, timings, os.path.join(save_dir, "frames"))
+            logger.info(f"========== Task {task_id} completed successfully ==========")
+            _check_max_recordings(session, task)
+            
+        except Exception as e:
+            logger.error(f"========== Task {task_id} failed: {e} ==========", exc_info=True)
+            record.status = "failed"
+            record.analysis_result = str(e)
+            record.timings = timings.to_json()
+            session.add(record)
+            session.commit()
+
+        await _track_storage(session, task, record)
+        return record.status
+
+
+async def _process_record(session: Session, task: Task, record: Record, timings: StageTimings, frames_dir: str):
+    """
+    对一段已录制完成的视频执行 AI 流水线（抽音频、抽帧、转写、视觉分析、生成报告），
+    按段录制和连续录制的每个分段共用。
+    """
+    task_id = task.id
+    save_path = record.video_path
+    if task.ai_enabled:
+        logger.info(f"[Task {task_id}] Step 3/5: Starting AI processing")
+        base_path = os.path.splitext(save_path)[0]
+        
+        # Extract Audio
+        logger.info(f"[Task {task_id}] Extracting audio...")
+        audio_path = f"{base_path}.{MediaProcessor.audio_extension()}"
+        if audio_path == save_path:
+            # 仅音频的录制本身就是音频中间文件
+            with timings.stage("extract_audio") as stage:
+                stage["bytes"] = file_size(audio_path)
+        else:
+            with timings.stage("extract_audio") as stage:
                 await MediaProcessor.extract_audio(save_path, audio_path)
-                record.audio_path = audio_path
-                
-                # Extract Frames
-                logger.info(f"[Task {task_id}] Extracting frames...")
-                frames_dir = os.path.join(save_dir, "frames")
-                frames = await MediaProcessor.extract_frames(save_path, frames_dir, interval=30) # Every 10s
-                # Use first frame as cover
-                if frames:
-                    record.cover_path = frames[0]
-                    logger.info(f"[Task {task_id}] Extracted {len(frames)} frames")
-                
-                # Transcribe
-                logger.info(f"[Task {task_id}] Step 4/5: Transcribing audio...")
-                transcript = await AIService.transcribe_audio(audio_path)
-                # Let's save transcript to file
-                transcript_file = os.path.join(save_dir, f"{timestamp}_transcript.json")
-                with open(transcript_file, "w", encoding="utf-8") as f:
-                    f.write(transcript)
-                record.transcript_path = transcript_file
-                logger.info(f"[Task {task_id}] Transcription completed")
-                
-                # Analyze Images
-                logger.info(f"[Task {task_id}] Step 5/5: Analyzing images...")
-                # Limit frames to avoid token limit (e.g., max 10 frames)
-                selected_frames = frames[:10]
-                # 使用任务配置的prompt，如果没有则使用系统默认
-                vision_prompt = task.prompt_vision or PromptManager.get_prompt('prompt_vision')
-                visual_analysis = await AIService.analyze_images(selected_frames, vision_prompt)
-
-                # Generate Report
-                logger.info(f"[Task {task_id}] Generating final report...")
-                summary_prompt = task.prompt_summary or PromptManager.get_prompt('prompt_summary')
-                report = await AIService.generate_report(
-                    transcript,
-                    visual_analysis,
-                    summary_prompt
-                )
-                record.analysis_result = report
-                record.status = "analyzed"
-                logger.info(f"[Task {task_id}] AI analysis completed")
-            else:
-                record.status = "recorded"
-                
+                stage["bytes"] = file_size(audio_path)
+        record.audio_path = audio_path
+        
+        # Extract Frames
+        logger.info(f"[Task {task_id}] Extracting frames...")
+        with timings.stage("extract_frames") as stage:
+            frames = await MediaProcessor.extract_frames(save_path, frames_dir, interval=30) # Every 10s
+            stage["bytes"] = file_size(*frames)
+            stage["count"] = len(frames)
+        StorageManager.track(session, task, record.id, frames, "frame")
+        # Use first frame as cover
+        if frames:
+            record.cover_path = frames[0]
+            logger.info(f"[Task {task_id}] Extracted {len(frames)} frames")
+        
+        # Transcribe
+        logger.info(f"[Task {task_id}] Step 4/5: Transcribing audio...")
+        with timings.stage("transcribe") as stage:
+            stage["bytes"] = file_size(audio_path)
+            transcript = await AIService.transcribe_audio(audio_path)
+        # Let's save transcript to file
+        transcript_file = f"{base_path}_transcript.json"
+        with open(transcript_file, "w", encoding="utf-8") as f:
+            f.write(transcript)
+        record.transcript_path = transcript_file
+        logger.info(f"[Task {task_id}] Transcription completed")
+        
+        # Analyze Images
+        logger.info(f"[Task {task_id}] Step 5/5: Analyzing images...")
+        # Limit frames to avoid token limit (e.g., max 10 frames)
+        selected_frames = frames[:10]
+        # 使用任务配置的prompt，如果没有则使用系统默认
+        vision_prompt = task.prompt_vision or PromptManager.get_prompt('prompt_vision')
+        with timings.stage("vision") as stage:
+            stage["bytes"] = file_size(*selected_frames)
+            visual_analysis = await AIService.analyze_images(selected_frames, vision_prompt, usage=stage)
+
+        # Generate Report
+        logger.info(f"[Task {task_id}] Generating final report...")
+        summary_prompt = task.prompt_summary or PromptManager.get_prompt('prompt_summary')
+        with timings.stage("report") as stage:
+            report = await AIService.generate_report(
+                transcript,
+                visual_analysis,
+                summary_prompt,
+                usage=stage
+            )
+        record.analysis_result = report
+        record.status = "analyzed"
+        logger.info(f"[Task {task_id}] AI analysis completed")
+    else:
+        record.status = "recorded"
+        
+    record.timings = timings.to_json()
+    session.add(record)
+    session.commit()
+
+
+async def _track_storage(session: Session, task: Task, record: Record):
+    """登记录制产生的文件（大小、时长、sha256）并执行空间保留策略，失败不影响录制结果"""
+    try:
+        digests = await StorageManager.digests(record.video_path, record.audio_path)
+        StorageManager.track_record(session, task, record, digests)
+        StorageManager.enforce(session, task)
+    except Exception as e:
+        logger.error(f"[Task {task.id}] Storage bookkeeping failed: {e}", exc_info=True)
+
+
+def _check_max_recordings(session: Session, task: Task) -> bool:
+    """检查是否达到最大录制段数，达到时停用任务并移除调度，返回 True"""
+    if task.max_recordings <= 0:
+        return False
+
+    # 统计该任务已完成的录制数量
+    completed_count = session.exec(
+        select(Record).where(
+            Record.task_id == task.id,
+            Record.status.in_(['recorded', 'analyzed'])
+        )
+    ).all()
+    
+    if len(completed_count) < task.max_recordings:
+        return False
+
+    logger.info(f"[Task {task.id}] Reached max recordings limit ({task.max_recordings}), stopping task...")
+    task.is_active = False
+    session.add(task)
+    session.commit()
+
+    # 移除调度任务
+    remove_task_job(task.id)
+    logger.info(f"[Task {task.id}] Task stopped automatically")
+    return True
+
+
+async def _run_continuous_job(session: Session, task: Task) -> str | None:
+    """
+    连续录制模式：直播期间保持一个 FFmpeg 会话，按 task.duration 切段，每个分段关闭后
+    生成一条 Record 并立即进入 AI 流水线。直播结束后返回，下一次调度触发时重新检测开播。
+    """
+    task_id = task.id
+    if task.ai_enabled and not _load_api_key(session):
+        record = Record(task_id=task.id, anchor_id=task.anchor_id, anchor_name=task.anchor_name,
+                        status="failed", analysis_result=API_KEY_ERROR)
+        session.add(record)
+        session.commit()
+        return record.status
+
+    # 分段先写到任务目录，生成 Record 后再移入该录制的目录
+    save_dir = os.path.join(STORAGE_ROOT, str(task.id))
+    stop_event = asyncio.Event()
+    processing: set[asyncio.Task] = set()
+    resolve_stage = None
+
+    async def on_segment(path: str, start_time: datetime, end_time: datetime):
+        nonlocal resolve_stage
+        segment_timings = StageTimings()
+        # 解析耗时只计入第一个分段
+        if resolve_stage:
+            segment_timings.stages["resolve"] = resolve_stage
+            resolve_stage = None
+        segment_timings.stages["record"] = {
+            "start": start_time.isoformat(timespec="milliseconds"),
+            "end": end_time.isoformat(timespec="milliseconds"),
+            "seconds": round((end_time - start_time).total_seconds(), 3),
+            "bytes": file_size(path),
+            "ok": True,
+        }
+        job = asyncio.create_task(_process_segment(task_id, path, start_time, end_time, segment_timings, stop_event))
+        processing.add(job)
+        job.add_done_callback(processing.discard)
+
+    try:
+        for attempt in range(2):
+            timings = StageTimings()
+            logger.info(f"[Task {task_id}] Fetching stream URL for {task.url} (continuous mode)")
+            with timings.stage("resolve") as stage:
+                stream_info = await StreamFetcher.get_stream_url(task.url, cache_key=task.id)
+                stage["cached"] = bool(stream_info.get("cached"))
+            if not stream_info.get('is_live'):
+                logger.info(f"Stream {task.url} is not live.")
+                return "offline"
+
+            real_url = stream_info.get('record_url')
+            if not real_url:
+                raise Exception("No stream URL found")
+            resolve_stage = timings.stages["resolve"]
+
+            logger.info(f"[Task {task_id}] Starting continuous recording (segment: {task.duration}s)")
+            try:
+                segments = await RecorderService.record_segments(
+                    real_url, save_dir, task.duration, on_segment, task.audio_only, stop_event,
+                    on_stall=lambda: ResolvedUrlCache.invalidate(task.id, "stream stalled"))
+                break
+            except Exception as e:
+                ResolvedUrlCache.invalidate(task.id, _invalidate_reason(e))
+                if not stream_info.get("cached") or attempt:
+                    raise
+                logger.warning(f"[Task {task_id}] Recording from cached stream URL failed, re-resolving: {e}")
+    finally:
+        if processing:
+            logger.info(f"[Task {task_id}] Waiting for {len(processing)} segment(s) to finish processing")
+            await asyncio.gather(*processing, return_exceptions=True)
+
+    # 会话结束通常意味着下播，旧地址不再可用
+    ResolvedUrlCache.invalidate(task.id, "continuous session ended")
+    logger.info(f"========== Task {task_id} continuous session ended ({len(segments)} segments) ==========")
+    return "recorded" if segments else "failed"
+
+
+async def _process_segment(task_id: int, path: str, start_time: datetime, end_time: datetime,
+                           timings: StageTimings, stop_event: asyncio.Event):
+    with Session(engine) as session:
+        task = session.get(Task, task_id)
+        if not task:
+            stop_event.set()
+            return
+
+        record = Record(task_id=task.id, anchor_id=task.anchor_id, anchor_name=task.anchor_name,
+                        start_time=start_time, end_time=end_time, video_path=path,
+                        status="processing", timings=timings.to_json())
+        session.add(record)
+        session.commit()
+        session.refresh(record)
+
+        record_dir = StorageManager.record_dir(task.id, record.id)
+        try:
+            # 把分段移到这条录制自己的目录下（移动失败时分段仍留在原处，记录标记为失败）
+            os.makedirs(record_dir, exist_ok=True)
+            path = os.path.join(record_dir, os.path.basename(path))
+            os.replace(record.video_path, path)
+            record.video_path = path
             session.add(record)
             session.commit()
-            logger.info(f"========== Task {task_id} completed successfully ==========")
-            
-            # 检查是否达到最大录制段数
-            if task.max_recordings > 0:
-                # 统计该任务已完成的录制数量
-                completed_count = session.exec(
-                    select(Record).where(
-                        Record.task_id == task_id,
-                        Record.status.in_(['recorded', 'analyzed'])
-                    )
-                ).all()
-                
-                if len(completed_count) >= task.max_recordings:
-                    logger.info(f"[Task {task_id}] Reached max recordings limit ({task.max_recordings}), stopping task...")
-                    task.is_active = False
-                    session.add(task)
-                    session.commit()
+            logger.info(f"Created record {record.id} for task {task_id} segment {path}")
 
-                    # 移除调度任务
-                    remove_task_job(task_id)
-                    logger.info(f"[Task {task_id}] Task stopped automatically")
-            
+            if not _enqueue_analysis(task, record):
+                await _process_record(session, task, record, timings, os.path.join(record_dir, "frames"))
         except Exception as e:
-            logger.error(f"========== Task {task_id} failed: {e} ==========", exc_info=True)
+            logger.error(f"[Task {task_id}] Segment {path} failed: {e}", exc_info=True)
             record.status = "failed"
             record.analysis_result = str(e)
+            record.timings = timings.to_json()
             session.add(record)
             session.commit()
 
+        await _track_storage(session, task, record)
+        if not task.is_active or _check_max_recordings(session, task):
+            stop_event.set()
+
+
 def start_scheduler():
     scheduler.start()
     logger.info("Scheduler started")
 
-def add_task_job(task: Task):
+def _stagger_offset(task: Task) -> int:
+    """按任务ID确定性地分散首次执行时间"""
+    window = max(1, min(task.interval, STAGGER_WINDOW))
+    return (task.id * 7919) % window
+
+
+def _job_matches(job, task: Task) -> bool:
+    """已持久化的调度任务是否与当前任务配置一致"""
+    trigger = job.trigger
+    if not isinstance(trigger, IntervalTrigger):
+        return False
+    # 只有尚未到达的计划开始时间才会影响调度：有则必须与 trigger 的开始时间一致，
+    # 没有时 trigger 的开始时间最多是错峰窗口内的时间（之前设置过、后来取消的计划开始时间需要重新添加）
+    now = datetime.now()
+    start_date = trigger.start_date.replace(tzinfo=None) if trigger.start_date else None
+    if task.scheduled_start_time and task.scheduled_start_time > now:
+        start_matches = start_date == task.scheduled_start_time
+    else:
+        start_matches = start_date is None or start_date <= now + timedelta(seconds=STAGGER_WINDOW)
+    return (
+        start_matches
+        and int(trigger.interval.total_seconds()) == task.interval
+        and job.max_instances == task.max_instances
+        and job.coalesce == task.coalesce
+        and job.misfire_grace_time == task.misfire_grace_time
+    )
+
+
+def _stagger_kept_job(job, task: Task):
+    """保留原计划的任务如果在停机期间错过执行或马上就要执行，同样按任务ID错峰，避免重启后同时触发"""
+    next_run = job.next_run_time
+    if next_run is None:
+        return
+    earliest = datetime.now(next_run.tzinfo) + timedelta(seconds=_stagger_offset(task))
+    if next_run < earliest:
+        job.modify(next_run_time=earliest)
+
+
+def add_task_job(task: Task, stagger: bool = True):
     trigger_args = {"seconds": task.interval}
     
     # Handle Scheduled Start
     if task.scheduled_start_time and task.scheduled_start_time > datetime.now():
         trigger_args["start_date"] = task.scheduled_start_time
         logger.info(f"Task {task.id} scheduled to start at {task.scheduled_start_time}")
+    elif stagger:
+        offset = _stagger_offset(task)
+        trigger_args["start_date"] = datetime.now() + timedelta(seconds=offset)
+        logger.info(f"Task {task.id} first run staggered by {offset}s")
     
     scheduler.add_job(
         recording_job,
         IntervalTrigger(**trigger_args),
         id=str(task.id),
         args=[task.id],
-        replace_existing=True
+        replace_existing=True,
+        max_instances=task.max_instances,
+        coalesce=task.coalesce,
+        misfire_grace_time=task.misfire_grace_time,
     )
-    logger.info(f"Added job for task {task.id}")
+    logger.info(f"Added job for task {task.id} (max_instances={task.max_instances}, "
+                f"coalesce={task.coalesce}, misfire_grace_time={task.misfire_grace_time}s)")
+
+
+def restore_task_jobs(tasks: list[Task]):
+    """
+    启动时同步调度任务：持久化存储中配置未变的任务保持原有执行计划（已错过的执行同样错峰），
+    新增或修改过的任务重新添加，已失效的任务移除。
+    """
+    active_ids = set()
+    kept = added = 0
+    for task in tasks:
+        active_ids.add(str(task.id))
+        job = scheduler.get_job(str(task.id))
+        if job and _job_matches(job, task):
+            _stagger_kept_job(job, task)
+            kept += 1
+            continue
+        add_task_job(task)
+        added += 1
+
+    removed = 0
+    for job in scheduler.get_jobs():
+        if job.id not in active_ids:
+            scheduler.remove_job(job.id)
+            removed += 1
+    logger.info(f"Restored scheduler jobs: kept {kept}, added {added}, removed {removed}")
 
 def remove_task_job(task_id: int):
     if scheduler.get_job(str(task_id)):
@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import shutil
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class _SlotPool:
+    """单类FFmpeg进程的槽位池，等待者按 (priority, 入队顺序) 出队"""
+
+    def __init__(self, kind: str, limit: int):
+        self.kind = kind
+        self.limit = limit
+        self.active = 0
+        self.waiters: list = []
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class AdmissionController:
+    """
+    全局FFmpeg准入控制器。
+
+    录制(record)、抽取(extract)、转码(transcode)分别有独立的并发上限，
+    超出上限的请求进入优先级队列等待（priority 越小越先执行）。
+    开启 dynamic 后会根据负载、剩余磁盘和实测入口带宽临时收紧上限。
+    """
+
+    DEFAULT_LIMITS = {"record": 8, "extract": 2, "transcode": 1}
+
+    # Settings 表中的配置项
+    SETTING_KEYS = {
+        "record": "admission_record_slots",
+        "extract": "admission_extract_slots",
+        "transcode": "admission_transcode_slots",
+    }
+
+    dynamic = False
+    max_load_per_cpu = 1.5
+    min_free_disk_gb = 2.0
+    max_ingress_mbps = 0.0  # 0 表示不限制
+    disk_path = "storage"
+
+    _pools: dict[str, _SlotPool] = {}
+    _seq = itertools.count()
+    _ingress: deque = deque()  # (开始时间, 结束时间, 字节数)，按结束时间排序
+    _ingress_window = 60.0
+
+    @classmethod
+    def _pool(cls, kind: str) -> _SlotPool:
+        pool = cls._pools.get(kind)
+        if pool is None:
+            pool = _SlotPool(kind, cls.DEFAULT_LIMITS.get(kind, 1))
+            cls._pools[kind] = pool
+        return pool
+
+    @classmethod
+    def configure(cls, limits: dict | None = None, dynamic: bool | None = None,
+                  max_load_per_cpu: float | None = None, min_free_disk_gb: float | None = None,
+                  max_ingress_mbps: float | None = None):
+        for kind, limit in (limits or {}).items():
+            cls._pool(kind).limit = max(1, int(limit))
+        if dynamic is not None:
+            cls.dynamic = dynamic
+        if max_load_per_cpu is not None:
+            cls.max_load_per_cpu = max_load_per_cpu
+        if min_free_disk_gb is not None:
+            cls.min_free_disk_gb = min_free_disk_gb
+        if max_ingress_mbps is not None:
+            cls.max_ingress_mbps = max_ingress_mbps
+        for kind in list(cls._pools):
+            cls._wake(cls._pools[kind])
+
+    @classmethod
+    def configure_from_settings(cls):
+        """从数据库 Settings 表读取并发上限配置（不存在则使用默认值）"""
+        from sqlmodel import Session
+        from database import engine, Settings
+
+        def _get(session, key):
+            setting = session.get(Settings, key)
+            return setting.value if setting and setting.value else None
+
+        limits = {}
+        with Session(engine) as session:
+            for kind, key in cls.SETTING_KEYS.items():
+                value = _get(session, key)
+                if value:
+                    limits[kind] = int(value)
+            dynamic = _get(session, "admission_dynamic")
+            max_load = _get(session, "admission_max_load_per_cpu")
+            min_disk = _get(session, "admission_min_free_disk_gb")
+            max_ingress = _get(session, "admission_max_ingress_mbps")
+
+        cls.configure(
+            limits=limits,
+            dynamic=dynamic.lower() in ("1", "true", "yes") if dynamic else None,
+            max_load_per_cpu=float(max_load) if max_load else None,
+            min_free_disk_gb=float(min_disk) if min_disk else None,
+            max_ingress_mbps=float(max_ingress) if max_ingress else None,
+        )
+        logger.info(f"Admission limits: { {k: p.limit for k, p in cls._pools.items()} }, dynamic={cls.dynamic}")
+
+    @classmethod
+    def _trim_ingress(cls, now: float):
+        while cls._ingress and now - cls._ingress[0][1] > cls._ingress_window:
+            cls._ingress.popleft()
+
+    @classmethod
+    def report_ingress(cls, nbytes: int, duration: float = 0.0):
+        """
+        上报刚写入的字节数，用于估算入口带宽。
+        录制进行中按 FFmpeg 进度的 total_size 增量上报；duration 为这些字节实际写入所用的秒数，
+        估算时按时间均摊到窗口内，一次上报整个分段不会造成瞬时的带宽尖峰。
+        """
+        if nbytes <= 0:
+            return
+        now = time.monotonic()
+        cls._ingress.append((now - max(0.0, duration), now, nbytes))
+        cls._trim_ingress(now)
+
+    @classmethod
+    def ingress_mbps(cls) -> float:
+        now = time.monotonic()
+        cls._trim_ingress(now)
+        window_start = now - cls._ingress_window
+        total = 0.0
+        for start, end, nbytes in cls._ingress:
+            if end <= start:
+                total += nbytes
+            else:
+                # 只计入落在统计窗口内的那部分时长
+                total += nbytes * (end - max(start, window_start)) / (end - start)
+        return total * 8 / cls._ingress_window / 1_000_000
+
+    @staticmethod
+    def _load_per_cpu() -> float | None:
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (OSError, AttributeError):
+            return None
+
+    @classmethod
+    def _free_disk_gb(cls) -> float | None:
+        try:
+            return shutil.disk_usage(cls.disk_path if os.path.exists(cls.disk_path) else ".").free / (1024 ** 3)
+        except OSError:
+            return None
+
+    @classmethod
+    def effective_limit(cls, kind: str) -> int:
+        pool = cls._pool(kind)
+        if not cls.dynamic:
+            return pool.limit
+
+        limit = pool.limit
+        load = cls._load_per_cpu()
+        if load is not None and load > cls.max_load_per_cpu:
+            limit = max(1, limit // 2)
+
+        free_disk = cls._free_disk_gb()
+        if kind == "record" and free_disk is not None and free_disk < cls.min_free_disk_gb:
+            # 磁盘快满时不再启动新的录制，已在运行的不受影响
+            limit = 0
+
+        if kind == "record" and cls.max_ingress_mbps and cls.ingress_mbps() > cls.max_ingress_mbps:
+            limit = min(limit, max(1, pool.active))
+        return limit
+
+    @classmethod
+    def _wake(cls, pool: _SlotPool):
+        limit = cls.effective_limit(pool.kind)
+        while pool.waiters and pool.active < limit:
+            _, _, future = heapq.heappop(pool.waiters)
+            if future.done():
+                continue
+            pool.active += 1
+            future.set_result(None)
+
+    @classmethod
+    async def acquire(cls, kind: str, priority: int = 0):
+        pool = cls._pool(kind)
+        if not pool.waiters and pool.active < cls.effective_limit(kind):
+            pool.active += 1
+            pool.admitted += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(pool.waiters, (priority, next(cls._seq), future))
+        logger.info(f"FFmpeg {kind} slot busy ({pool.active}/{cls.effective_limit(kind)}), "
+                    f"queued with priority {priority}, queue size {len(pool.waiters)}")
+        started = time.monotonic()
+        while True:
+            try:
+                # 动态上限可能随负载恢复而放宽，因此定期重新检查
+                await asyncio.wait_for(asyncio.shield(future), timeout=5)
+                break
+            except asyncio.TimeoutError:
+                cls._wake(pool)
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    pool.active -= 1
+                    cls._wake(pool)
+                else:
+                    future.cancel()
+                raise
+
+        waited = time.monotonic() - started
+        pool.admitted += 1
+        pool.total_wait += waited
+        pool.max_wait = max(pool.max_wait, waited)
+
+    @classmethod
+    def release(cls, kind: str):
+        pool = cls._pool(kind)
+        pool.active = max(0, pool.active - 1)
+        cls._wake(pool)
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, kind: str, priority: int = 0):
+        await cls.acquire(kind, priority)
+        try:
+            yield
+        finally:
+            cls.release(kind)
+
+    @classmethod
+    def stats(cls) -> dict:
+        for kind in cls.DEFAULT_LIMITS:
+            cls._pool(kind)
+        pools = {}
+        for kind, pool in cls._pools.items():
+            pools[kind] = {
+                "limit": pool.limit,
+                "effective_limit": cls.effective_limit(kind),
+                "active": pool.active,
+                "queued": sum(1 for _, _, f in pool.waiters if not f.done()),
+                "admitted": pool.admitted,
+                "avg_wait_seconds": round(pool.total_wait / pool.admitted, 3) if pool.admitted else 0.0,
+                "max_wait_seconds": round(pool.max_wait, 3),
+            }
+        free_disk = cls._free_disk_gb()
+        return {
+            "dynamic": cls.dynamic,
+            "pools": pools,
+            "load_per_cpu": cls._load_per_cpu(),
+            "free_disk_gb": round(free_disk, 2) if free_disk is not None else None,
+            "ingress_mbps": round(cls.ingress_mbps(), 3),
+        }
@@ -1,9 +1,12 @@
 import os
 import logging
 import json
+import time
 from http import HTTPStatus
 import dashscope
 from dashscope.audio.asr import Transcription, Recognition
+from services.media_processor import MediaProcessor, AUDIO_SAMPLE_RATE
+from services.metrics import AI_REQUEST_SECONDS, record_usage
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +21,13 @@ class AIService:
     def set_api_key(api_key: str):
         dashscope.api_key = api_key
 
+    @staticmethod
+    def _add_usage(usage: dict | None, tokens: tuple[int, int]):
+        if usage is None:
+            return
+        usage["input_tokens"] = usage.get("input_tokens", 0) + tokens[0]
+        usage["output_tokens"] = usage.get("output_tokens", 0) + tokens[1]
+
     @staticmethod
     async def verify_api_key(api_key: str) -> bool:
         """
@@ -41,7 +51,7 @@ class AIService:
     async def transcribe_audio(audio_path: str) -> str:
         """
         Transcribe audio using DashScope Recognition (paraformer-realtime-v1).
-        This supports local files directly.
+        This supports local files directly; wav/opus/mp3 intermediates are passed as-is.
         """
         logger.info(f"Transcribing audio: {audio_path}")
         
@@ -54,8 +64,8 @@ class AIService:
 
         recognition = Recognition(
             model='paraformer-realtime-v1',
-            format='wav',
-            sample_rate=16000,
+            format=MediaProcessor.format_of(audio_path),
+            sample_rate=AUDIO_SAMPLE_RATE,
             callback=None,
             language_hints=['zh', 'en']
         )
@@ -63,7 +73,12 @@ class AIService:
         try:
             # Run synchronous call in thread pool
             import asyncio
+            started = time.perf_counter()
             response = await asyncio.to_thread(recognition.call, audio_path)
+            AI_REQUEST_SECONDS.observe(
+                time.perf_counter() - started, stage="asr", model="paraformer-realtime-v1",
+                result="ok" if response.status_code == HTTPStatus.OK else "error"
+            )
             
             if response.status_code == HTTPStatus.OK:
                 # The output format for Recognition is different from Transcription
@@ -82,9 +97,11 @@ class AIService:
             raise e
 
     @staticmethod
-    async def analyze_images(image_paths: list[str], prompt: str = "Describe this image") -> list[str]:
+    async def analyze_images(image_paths: list[str], prompt: str = "Describe this image",
+                             usage: dict | None = None) -> list[str]:
         """
         Analyze images using Qwen-VL-Plus.
+        If `usage` is given, token counts are accumulated into it.
         """
         results = []
         import asyncio
@@ -106,7 +123,13 @@ class AIService:
                     )
                 
                 # Run synchronous call in thread pool
+                started = time.perf_counter()
                 response = await asyncio.to_thread(_call_vl)
+                AI_REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, stage="vision", model="qwen-vl-plus",
+                    result="ok" if response.status_code == HTTPStatus.OK else "error"
+                )
+                AIService._add_usage(usage, record_usage("qwen-vl-plus", response))
                 
                 if response.status_code == HTTPStatus.OK:
                     content = response.output.choices[0].message.content
@@ -120,9 +143,11 @@ class AIService:
         return results
 
     @staticmethod
-    async def generate_report(transcript: str, visual_analysis: list[str], prompt: str) -> str:
+    async def generate_report(transcript: str, visual_analysis: list[str], prompt: str,
+                              usage: dict | None = None) -> str:
         """
         Generate comprehensive report using Qwen-Max.
+        If `usage` is given, token counts are accumulated into it.
         """
         visual_text = "\n".join(visual_analysis)
         full_prompt = f"""
@@ -149,7 +174,13 @@ class AIService:
             )
 
         # Run synchronous call in thread pool
+        started = time.perf_counter()
         response = await asyncio.to_thread(_call_generation)
+        AI_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, stage="report", model="qwen-max",
+            result="ok" if response.status_code == HTTPStatus.OK else "error"
+        )
+        AIService._add_usage(usage, record_usage("qwen-max", response))
         
         if response.status_code == HTTPStatus.OK:
             return response.output.choices[0].message.content
@@ -1,25 +1,28 @@
 import os
 import sys
-import importlib.util
 
-# 动态导入utils模块以避免循环依赖
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-from src.utils import read_config_value
+from src.config_store import get_store
 
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'config.ini')
 
 class ConfigManager:
-    @staticmethod
-    def get_cookie(key: str) -> str:
-        return read_config_value(CONFIG_FILE, 'Cookie', key)
+    """config.ini 只解析一次，文件修改后自动重新读取（见 src/config_store.py）"""
+    store = get_store(CONFIG_FILE)
 
-    @staticmethod
-    def get_proxy() -> str:
-        # Implement proxy reading logic if needed, or return None
-        # Based on original main.py, it reads 'proxy_addr' from 'Global' or similar
-        # Let's check config.ini structure later. For now, return None or read specific key.
-        return read_config_value(CONFIG_FILE, 'Global', 'proxy_addr')
-    
-    @staticmethod
-    def get_value(section: str, key: str) -> str:
-        return read_config_value(CONFIG_FILE, section, key)
+    @classmethod
+    def get_cookie(cls, key: str) -> str:
+        return cls.store.get('Cookie', key, raw=False)
+
+    @classmethod
+    def get_proxy(cls) -> str:
+        return cls.store.get('Global', 'proxy_addr', raw=False)
+
+    @classmethod
+    def get_value(cls, section: str, key: str) -> str:
+        return cls.store.get(section, key, raw=False)
+
+    @classmethod
+    def on_change(cls, callback):
+        """注册配置变化回调，参数为变化的 {(section, key)}"""
+        cls.store.on_change(callback)
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import logging
+import os
+from contextlib import nullcontext
+from services.admission import AdmissionController
+from services.metrics import STREAM_FAILOVER_TOTAL, FFMPEG_EXIT_TOTAL, FFMPEG_ACTIVE
+from src import fmp4
+
+logger = logging.getLogger(__name__)
+
+
+class FailoverManager:
+    """
+    录制中途的候选地址切换。候选地址来自 stream.get_*_stream_url 返回的 candidate_urls（同一画质的其他格式/CDN），
+    每次切换后录制到新的分片文件，结束后用 concat 拼接为一个文件。
+    各分片编码参数一致时直接复制流拼接，不一致时（如 CDN 下发的编码不同）重新编码拼接。
+    """
+
+    def __init__(self, candidates: list[str]):
+        self.candidates = list(dict.fromkeys(url for url in candidates if url))
+        self.index = 0
+        self.switches = 0
+
+    @property
+    def current(self) -> str | None:
+        return self.candidates[self.index] if self.index < len(self.candidates) else None
+
+    def advance(self, reason: str) -> str | None:
+        """当前地址卡顿或出错时切换到下一个候选地址，没有可用地址时返回 None"""
+        self.index += 1
+        if self.current is None:
+            logger.warning(f"No more candidate stream URLs after {reason}")
+            return None
+        self.switches += 1
+        STREAM_FAILOVER_TOTAL.inc(reason=reason)
+        logger.warning(f"Switching to candidate stream URL {self.index + 1}/{len(self.candidates)} after {reason}")
+        return self.current
+
+    @staticmethod
+    async def probe(path: str) -> list[tuple] | None:
+        """分片中各路流的编码参数，用于判断能否直接复制流拼接；探测失败返回 None"""
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-show_entries",
+            "stream=codec_type,codec_name,profile,width,height,pix_fmt,sample_rate,channels",
+            "-of", "json", path,
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        if process.returncode != 0:
+            return None
+        try:
+            streams = json.loads(stdout).get("streams", [])
+        except ValueError:
+            return None
+        keys = ("codec_type", "codec_name", "profile", "width", "height", "pix_fmt", "sample_rate", "channels")
+        return sorted(tuple(str(stream.get(key)) for key in keys) for stream in streams)
+
+    @staticmethod
+    def _reencode_args(parts: list[str], first: list[tuple]) -> list[str]:
+        """用 concat 滤镜重新编码拼接，视频统一缩放到第一个分片的分辨率"""
+        has_video = any(stream[0] == "video" for stream in first)
+        has_audio = any(stream[0] == "audio" for stream in first)
+        args = []
+        for part in parts:
+            args.extend(["-i", part])
+        filters = []
+        labels = ""
+        if has_video:
+            video = next(stream for stream in first if stream[0] == "video")
+            width, height = video[3], video[4]
+            for i in range(len(parts)):
+                filters.append(f"[{i}:v:0]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                               f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1[v{i}]")
+        for i in range(len(parts)):
+            labels += (f"[v{i}]" if has_video else "") + (f"[{i}:a:0]" if has_audio else "")
+        outputs = ("[v]" if has_video else "") + ("[a]" if has_audio else "")
+        filters.append(f"{labels}concat=n={len(parts)}:v={int(has_video)}:a={int(has_audio)}{outputs}")
+        args.extend(["-filter_complex", ";".join(filters)])
+        if has_video:
+            args.extend(["-map", "[v]", "-c:v", "libx264", "-preset", "veryfast", "-crf", "23"])
+        if has_audio:
+            args.extend(["-map", "[a]", "-c:a", "aac", "-b:a", "128k"])
+        return args
+
+    @staticmethod
+    async def concat(parts: list[str], output_path: str, delete_parts: bool = True) -> str:
+        """
+        拼接分片：编码参数（编码器、分辨率、采样率等）一致时用 concat demuxer 复制流无损拼接，
+        否则复制流拼接会得到无法播放的文件，改为重新编码拼接。
+        """
+        list_path = None
+        reencode = False
+        probes = [await FailoverManager.probe(part) for part in parts]
+        if probes[0] and all(probe == probes[0] for probe in probes):
+            list_path = f"{output_path}.concat.txt"
+            with open(list_path, "w", encoding="utf-8") as f:
+                for part in parts:
+                    escaped = os.path.abspath(part).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            cmd = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy"]
+        elif probes[0]:
+            logger.warning(f"Parts have different codec parameters, re-encoding while concatenating: {output_path}")
+            cmd = ["ffmpeg", "-y", *FailoverManager._reencode_args(parts, probes[0])]
+            reencode = True
+        else:
+            raise Exception(f"Cannot probe recording part {parts[0]}")
+        if output_path.endswith(".mp4"):
+            cmd.extend(fmp4.movflags_args())
+        cmd.append(output_path)
+
+        logger.info(f"Concatenating {len(parts)} parts into {output_path}")
+        # 重新编码拼接与 HLS 转码共用 transcode 名额，复制流拼接开销很小，不占用名额
+        slot = AdmissionController.slot("transcode") if reencode else nullcontext()
+        async with slot:
+            with FFMPEG_ACTIVE.track_inprogress(kind="concat"):
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await process.communicate()
+        FFMPEG_EXIT_TOTAL.inc(kind="concat", code=process.returncode)
+        if list_path:
+            os.remove(list_path)
+
+        if process.returncode != 0:
+            raise Exception(f"Concat failed: {stderr.decode(errors='ignore')[-500:]}")
+        if output_path.endswith(".mp4"):
+            fmp4.finalize(output_path)
+        if delete_parts:
+            for part in parts:
+                os.remove(part)
+        return output_path
@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import update, func, or_, and_
+from sqlmodel import Session, select
+from database import engine, QueuedJob
+
+logger = logging.getLogger(__name__)
+
+# standalone: API 进程内直接执行录制；distributed: API 只入队，由 worker 进程执行
+RUN_MODE = os.getenv("RUN_MODE", "standalone").lower()
+# 默认使用数据库中的 queuedjob 表，设置为 redis://host:port/db 时使用 Redis
+JOB_QUEUE_URL = os.getenv("JOB_QUEUE_URL", "")
+LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+PENDING_STATUSES = ("queued", "leased")
+
+
+def is_distributed() -> bool:
+    return RUN_MODE == "distributed"
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class ClaimedJob:
+    """worker 认领到的任务"""
+
+    def __init__(self, job_id, kind: str, task_id: Optional[int], payload: Optional[dict], attempts: int):
+        self.id = job_id
+        self.kind = kind
+        self.task_id = task_id
+        self.payload = payload or {}
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"ClaimedJob(id={self.id}, kind={self.kind}, task_id={self.task_id}, attempts={self.attempts})"
+
+
+class SQLiteJobQueue:
+    """
+    基于数据库表的租约队列。
+    认领使用条件更新（只有仍处于可认领状态时才会成功），多个 worker 并发认领同一任务时只有一个能拿到；
+    租约过期的任务会被重新认领，超过 max_attempts 后标记为 failed。
+    """
+
+    def enqueue(self, kind: str, task_id: Optional[int] = None, payload: Optional[dict] = None,
+                priority: int = 0, max_pending: int = 0) -> Optional[int]:
+        with Session(engine) as session:
+            if max_pending and task_id is not None:
+                pending = session.exec(
+                    select(func.count()).select_from(QueuedJob).where(
+                        QueuedJob.kind == kind,
+                        QueuedJob.task_id == task_id,
+                        QueuedJob.status.in_(PENDING_STATUSES),
+                    )
+                ).one()
+                if pending >= max_pending:
+                    logger.info(f"Skip enqueue {kind} for task {task_id}: {pending} job(s) still pending")
+                    return None
+
+            job = QueuedJob(
+                kind=kind,
+                task_id=task_id,
+                payload=json.dumps(payload, ensure_ascii=False) if payload else None,
+                priority=priority,
+            )
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            logger.info(f"Enqueued {kind} job {job.id} for task {task_id}")
+            return job.id
+
+    @staticmethod
+    def _claimable(now: datetime):
+        return or_(
+            QueuedJob.status == "queued",
+            and_(QueuedJob.status == "leased", QueuedJob.lease_expires_at < now),
+        )
+
+    def claim(self, worker_id: str, kinds: Optional[list[str]] = None,
+              lease_seconds: int = LEASE_SECONDS) -> Optional[ClaimedJob]:
+        with Session(engine) as session:
+            for _ in range(5):
+                now = datetime.now()
+                query = select(QueuedJob).where(self._claimable(now))
+                if kinds:
+                    query = query.where(QueuedJob.kind.in_(kinds))
+                candidate = session.exec(query.order_by(QueuedJob.priority, QueuedJob.id).limit(1)).first()
+                if not candidate:
+                    return None
+
+                if candidate.attempts >= candidate.max_attempts:
+                    candidate.status = "failed"
+                    candidate.last_error = candidate.last_error or "lease expired too many times"
+                    candidate.updated_at = now
+                    session.add(candidate)
+                    session.commit()
+                    continue
+
+                result = session.execute(
+                    update(QueuedJob)
+                    .where(QueuedJob.id == candidate.id, self._claimable(now))
+                    .values(
+                        status="leased",
+                        lease_owner=worker_id,
+                        lease_expires_at=now + timedelta(seconds=lease_seconds),
+                        attempts=QueuedJob.attempts + 1,
+                        updated_at=now,
+                    )
+                )
+                session.commit()
+                if result.rowcount == 1:
+                    session.refresh(candidate)
+                    return ClaimedJob(
+                        candidate.id, candidate.kind, candidate.task_id,
+                        json.loads(candidate.payload) if candidate.payload else None, candidate.attempts
+                    )
+                # 被其他 worker 抢先认领，重试下一个
+                session.expire_all()
+        return None
+
+    def heartbeat(self, job_id, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+        """续约，返回 False 表示租约已丢失（已被其他 worker 接管）"""
+        with Session(engine) as session:
+            now = datetime.now()
+            result = session.execute(
+                update(QueuedJob)
+                .where(QueuedJob.id == job_id, QueuedJob.lease_owner == worker_id, QueuedJob.status == "leased")
+                .values(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def _finish(self, job_id, worker_id: str, status: str, error: Optional[str] = None):
+        with Session(engine) as session:
+            session.execute(
+                update(QueuedJob)
+                .where(QueuedJob.id == job_id, QueuedJob.lease_owner == worker_id)
+                .values(status=status, last_error=error, lease_expires_at=None, updated_at=datetime.now())
+            )
+            session.commit()
+
+    def complete(self, job_id, worker_id: str):
+        self._finish(job_id, worker_id, "done")
+
+    def fail(self, job_id, worker_id: str, error: str, retry: bool = True):
+        with Session(engine) as session:
+            job = session.get(QueuedJob, job_id)
+            retry = retry and job is not None and job.attempts < job.max_attempts
+        self._finish(job_id, worker_id, "queued" if retry else "failed", error)
+
+    def requeue_expired(self) -> int:
+        with Session(engine) as session:
+            now = datetime.now()
+            result = session.execute(
+                update(QueuedJob)
+                .where(QueuedJob.status == "leased", QueuedJob.lease_expires_at < now)
+                .values(status="queued", lease_owner=None, lease_expires_at=None, updated_at=now)
+            )
+            session.commit()
+            if result.rowcount:
+                logger.warning(f"Re-queued {result.rowcount} job(s) with expired leases")
+            return result.rowcount
+
+    def stats(self) -> dict:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(QueuedJob.status, func.count()).group_by(QueuedJob.status)
+            ).all()
+        counts = {status: count for status, count in rows}
+        return {"backend": "sqlite", "mode": RUN_MODE, "counts": counts}
+
+
+class RedisJobQueue:
+    """
+    Redis 兼容的租约队列（需要安装 redis 包）。
+    queue 有序集合按优先级保存待执行任务ID，leases 有序集合以租约过期时间为分数记录已认领任务。
+    入队时的分数（priority * 1e13 + 入队时间）保存在任务中，失败重试和租约过期重新入队时沿用，不会丢掉优先级。
+    """
+
+    def __init__(self, url: str, prefix: str = "dlr:jobs"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("JOB_QUEUE_URL points to Redis but the `redis` package is not installed")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    def enqueue(self, kind: str, task_id: Optional[int] = None, payload: Optional[dict] = None,
+                priority: int = 0, max_pending: int = 0) -> Optional[str]:
+        if max_pending and task_id is not None:
+            pending_key = self._key(f"pending:{kind}:{task_id}")
+            if int(self.client.scard(pending_key)) >= max_pending:
+                logger.info(f"Skip enqueue {kind} for task {task_id}: job(s) still pending")
+                return None
+
+        job_id = uuid.uuid4().hex
+        score = priority * 1e13 + time.time()
+        self.client.hset(self._key(f"job:{job_id}"), mapping={
+            "kind": kind,
+            "task_id": "" if task_id is None else str(task_id),
+            "payload": json.dumps(payload or {}, ensure_ascii=False),
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": 3,
+            "score": repr(score),
+        })
+        if task_id is not None:
+            self.client.sadd(self._key(f"pending:{kind}:{task_id}"), job_id)
+        self.client.zadd(self._key("queue"), {job_id: score})
+        logger.info(f"Enqueued {kind} job {job_id} for task {task_id}")
+        return job_id
+
+    def claim(self, worker_id: str, kinds: Optional[list[str]] = None,
+              lease_seconds: int = LEASE_SECONDS) -> Optional[ClaimedJob]:
+        self.requeue_expired()
+        job_id = self._pop(kinds)
+        if job_id is None:
+            return None
+        job_key = self._key(f"job:{job_id}")
+        data = self.client.hgetall(job_key)
+        if not data:
+            return None
+
+        attempts = self.client.hincrby(job_key, "attempts", 1)
+        if attempts > int(data.get("max_attempts") or 3):
+            self._finish(job_id, "failed", "lease expired too many times")
+            return None
+        self.client.hset(job_key, mapping={"status": "leased", "lease_owner": worker_id})
+        self.client.zadd(self._key("leases"), {job_id: time.time() + lease_seconds})
+        task_id = int(data["task_id"]) if data.get("task_id") else None
+        return ClaimedJob(job_id, data["kind"], task_id, json.loads(data.get("payload") or "{}"), attempts)
+
+    def _pop(self, kinds: Optional[list[str]], scan: int = 100) -> Optional[str]:
+        """取出分数最小的任务；指定 kinds 时跳过其他类型（留在队列中原位），zrem 成功才算认领到"""
+        if not kinds:
+            popped = self.client.zpopmin(self._key("queue"))
+            return popped[0][0] if popped else None
+        for job_id in self.client.zrange(self._key("queue"), 0, scan - 1):
+            if self.client.hget(self._key(f"job:{job_id}"), "kind") in kinds \
+                    and self.client.zrem(self._key("queue"), job_id):
+                return job_id
+        return None
+
+    def _requeue(self, job_id):
+        """按入队时的分数放回队列"""
+        score = self.client.hget(self._key(f"job:{job_id}"), "score")
+        self.client.zadd(self._key("queue"), {job_id: float(score) if score else time.time()})
+
+    def heartbeat(self, job_id, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> bool:
+        if self.client.hget(self._key(f"job:{job_id}"), "lease_owner") != worker_id:
+            return False
+        self.client.zadd(self._key("leases"), {job_id: time.time() + lease_seconds}, xx=True)
+        return self.client.zscore(self._key("leases"), job_id) is not None
+
+    def _finish(self, job_id, status: str, error: Optional[str] = None):
+        job_key = self._key(f"job:{job_id}")
+        self.client.zrem(self._key("leases"), job_id)
+        self.client.hset(job_key, mapping={"status": status, "last_error": error or ""})
+        data = self.client.hgetall(job_key)
+        if status in ("done", "failed") and data.get("task_id"):
+            self.client.srem(self._key(f"pending:{data['kind']}:{data['task_id']}"), job_id)
+
+    def complete(self, job_id, worker_id: str):
+        self._finish(job_id, "done")
+
+    def fail(self, job_id, worker_id: str, error: str, retry: bool = True):
+        job_key = self._key(f"job:{job_id}")
+        attempts = int(self.client.hget(job_key, "attempts") or 0)
+        max_attempts = int(self.client.hget(job_key, "max_attempts") or 3)
+        if retry and attempts < max_attempts:
+            self._finish(job_id, "queued", error)
+            self._requeue(job_id)
+        else:
+            self._finish(job_id, "failed", error)
+
+    def requeue_expired(self) -> int:
+        expired = self.client.zrangebyscore(self._key("leases"), 0, time.time())
+        requeued = 0
+        for job_id in expired:
+            # zrem 成功才说明是本次操作接管，避免多个 worker 重复入队
+            if self.client.zrem(self._key("leases"), job_id):
+                self.client.hset(self._key(f"job:{job_id}"), mapping={"status": "queued", "lease_owner": ""})
+                self._requeue(job_id)
+                requeued += 1
+        if requeued:
+            logger.warning(f"Re-queued {requeued} job(s) with expired leases")
+        return requeued
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "mode": RUN_MODE,
+            "counts": {
+                "queued": self.client.zcard(self._key("queue")),
+                "leased": self.client.zcard(self._key("leases")),
+            },
+        }
+
+
+_queue = None
+
+
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        if JOB_QUEUE_URL.startswith(("redis://", "rediss://")):
+            _queue = RedisJobQueue(JOB_QUEUE_URL)
+        else:
+            _queue = SQLiteJobQueue()
+    return _queue
@@ -2,34 +2,92 @@ import asyncio
 import logging
 import os
 import math
+import re
+from services.admission import AdmissionController
+from services.metrics import MEDIA_EXTRACT_SECONDS, FFMPEG_EXIT_TOTAL, FFMPEG_ACTIVE
 
 logger = logging.getLogger(__name__)
 
+# -progress 输出中的已输出帧数
+PROGRESS_FRAME_PATTERN = re.compile(rb"^frame=(\d+)", re.MULTILINE)
+
+# 转写用音频中间文件的格式，统一为 16 kHz 单声道。
+# wav 每小时约 115 MB；opus/mp3 使用语音码率，体积约为 wav 的 1/20~1/30，DashScope 识别均可直接读取
+AUDIO_FORMATS = {
+    "wav": {"extension": "wav", "muxer": "wav", "codec": ["-acodec", "pcm_s16le"]},
+    "opus": {"extension": "opus", "muxer": "opus", "codec": ["-acodec", "libopus", "-b:a", "24k", "-application", "voip"]},
+    "mp3": {"extension": "mp3", "muxer": "mp3", "codec": ["-acodec", "libmp3lame", "-b:a", "32k"]},
+}
+AUDIO_SAMPLE_RATE = 16000
+DEFAULT_AUDIO_FORMAT = "wav"
+
+
 class MediaProcessor:
+    # Settings 表中的 audio_intermediate_format
+    audio_format = DEFAULT_AUDIO_FORMAT
+
+    @classmethod
+    def configure_from_settings(cls):
+        """从数据库 Settings 表读取音频中间文件格式（不存在或无效时使用 wav）"""
+        from sqlmodel import Session
+        from database import engine, Settings
+
+        with Session(engine) as session:
+            setting = session.get(Settings, "audio_intermediate_format")
+        value = (setting.value if setting and setting.value else DEFAULT_AUDIO_FORMAT).lower()
+        if value not in AUDIO_FORMATS:
+            logger.warning(f"Unknown audio_intermediate_format '{value}', using {DEFAULT_AUDIO_FORMAT}")
+            value = DEFAULT_AUDIO_FORMAT
+        cls.audio_format = value
+        logger.info(f"Audio intermediate format: {value}")
+
+    @classmethod
+    def audio_extension(cls, audio_format: str | None = None) -> str:
+        return AUDIO_FORMATS[audio_format or cls.audio_format]["extension"]
+
+    @classmethod
+    def audio_muxer(cls, audio_format: str | None = None) -> str:
+        return AUDIO_FORMATS[audio_format or cls.audio_format]["muxer"]
+
+    @classmethod
+    def audio_args(cls, audio_format: str | None = None) -> list[str]:
+        """FFmpeg 输出音频参数：去掉视频、按格式编码、16 kHz 单声道"""
+        return ["-vn", *AUDIO_FORMATS[audio_format or cls.audio_format]["codec"],
+                "-ar", str(AUDIO_SAMPLE_RATE), "-ac", "1"]
+
+    @staticmethod
+    def format_of(path: str) -> str:
+        """按扩展名判断音频中间文件的格式"""
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        for name, spec in AUDIO_FORMATS.items():
+            if spec["extension"] == extension:
+                return name
+        raise Exception(f"Unsupported audio intermediate: {path}")
+
     @staticmethod
     async def extract_audio(video_path: str, output_path: str) -> str:
         """
-        Extract audio from video file.
+        Extract audio from video file. The format follows output_path's extension (see AUDIO_FORMATS).
         """
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
         cmd = [
             "ffmpeg", "-y",
             "-i", video_path,
-            "-vn",
-            "-acodec", "pcm_s16le",
-            "-ar", "16000",
-            "-ac", "1",
+            *MediaProcessor.audio_args(MediaProcessor.format_of(output_path)),
             output_path
         ]
         
         logger.info(f"Extracting audio: {' '.join(cmd)}")
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        async with AdmissionController.slot("extract", priority=10):
+            with MEDIA_EXTRACT_SECONDS.time(kind="audio"), FFMPEG_ACTIVE.track_inprogress(kind="extract"):
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                stdout, stderr = await process.communicate()
+        FFMPEG_EXIT_TOTAL.inc(kind="extract", code=process.returncode)
         
         if process.returncode != 0:
             raise Exception(f"Audio extraction failed: {stderr.decode()}")
@@ -49,6 +107,7 @@ class MediaProcessor:
         
         cmd = [
             "ffmpeg", "-y",
+            "-progress", "pipe:1", "-nostats",
             "-i", video_path,
             "-vf", f"fps=1/{interval}",
             "-q:v", "2",
@@ -57,20 +116,95 @@ class MediaProcessor:
         ]
         
         logger.info(f"Extracting frames: {' '.join(cmd)}")
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        async with AdmissionController.slot("extract", priority=20):
+            with MEDIA_EXTRACT_SECONDS.time(kind="frames"), FFMPEG_ACTIVE.track_inprogress(kind="extract"):
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                stdout, stderr = await process.communicate()
+        FFMPEG_EXIT_TOTAL.inc(kind="extract", code=process.returncode)
         
         if process.returncode != 0:
             raise Exception(f"Frame extraction failed: {stderr.decode()}")
             
-        # Return list of generated files
-        frames = sorted([
-            os.path.join(output_dir, f) 
-            for f in os.listdir(output_dir) 
-            if f.endswith('.jpg')
-        ])
-        return frames
+        # 帧数取自 FFmpeg 的进度输出，按输出文件名模板生成路径，不需要列目录
+        counts = PROGRESS_FRAME_PATTERN.findall(stdout)
+        count = int(counts[-1]) if counts else 0
+        frames = [os.path.join(output_dir, f"frame_{i:04d}.jpg") for i in range(1, count + 1)]
+        return [frame for frame in frames if os.path.exists(frame)]
+
+    @staticmethod
+    async def _run(cmd: list, kind: str, slot: str, priority: int) -> None:
+        logger.info(f"Running FFmpeg ({kind}): {' '.join(cmd)}")
+        async with AdmissionController.slot(slot, priority=priority):
+            with MEDIA_EXTRACT_SECONDS.time(kind=kind), FFMPEG_ACTIVE.track_inprogress(kind=slot):
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                _, stderr = await process.communicate()
+        FFMPEG_EXIT_TOTAL.inc(kind=slot, code=process.returncode)
+        if process.returncode != 0:
+            raise Exception(f"FFmpeg {kind} failed: {stderr.decode(errors='ignore')[-500:]}")
+
+    @staticmethod
+    async def package_hls(video_path: str, output_dir: str, segment_seconds: int = 6) -> str:
+        """
+        不重新编码，把录像切成 HLS 分片（VOD 播放列表），返回播放列表路径。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        playlist = os.path.join(output_dir, "index.m3u8")
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", video_path,
+            "-map", "0:v?", "-map", "0:a?",
+            "-c", "copy",
+            "-f", "hls",
+            "-hls_time", str(segment_seconds),
+            "-hls_playlist_type", "vod",
+            "-hls_segment_filename", os.path.join(output_dir, "seg_%05d.ts"),
+            playlist
+        ]
+        await MediaProcessor._run(cmd, "hls", "transcode", priority=5)
+        return playlist
+
+    @staticmethod
+    async def make_thumbnail(source_path: str, output_path: str, width: int = 320) -> str:
+        """
+        从封面帧（或录像的第一个关键帧）生成小尺寸 WebP 缩略图。
+        """
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cmd = [
+            "ffmpeg", "-y",
+            "-skip_frame", "nokey",
+            "-i", source_path,
+            "-frames:v", "1",
+            "-vf", f"scale={width}:-2",
+            "-c:v", "libwebp", "-quality", "70",
+            output_path
+        ]
+        await MediaProcessor._run(cmd, "thumbnail", "extract", priority=5)
+        return output_path
+
+    @staticmethod
+    async def make_sprite(video_path: str, output_path: str, interval: int, columns: int, rows: int,
+                          tile_width: int = 160) -> str:
+        """
+        生成拖动预览用的 WebP 雪碧图：每 interval 秒一格，columns x rows 排列。只解码关键帧。
+        """
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        cmd = [
+            "ffmpeg", "-y",
+            "-skip_frame", "nokey",
+            "-i", video_path,
+            "-vf", f"fps=1/{interval},scale={tile_width}:-2,tile={columns}x{rows}",
+            "-frames:v", "1",
+            "-c:v", "libwebp", "-quality", "60",
+            output_path
+        ]
+        await MediaProcessor._run(cmd, "sprite", "extract", priority=15)
+        return output_path
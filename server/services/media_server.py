@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlmodel import Session
+from database import Record, Task
+from services.media_processor import MediaProcessor, AUDIO_FORMATS
+from services.storage_manager import StorageManager, STORAGE_ROOT
+
+logger = logging.getLogger(__name__)
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+HLS_FILE_PATTERN = re.compile(r"^(index\.m3u8|seg_\d{5}\.ts)$")
+CHUNK_SIZE = 256 * 1024
+# 生成后不再变化的缓存文件（缩略图、雪碧图、HLS 分片）
+IMMUTABLE_CACHE = "public, max-age=86400"
+# 雪碧图最多的格数和每行格数
+SPRITE_MAX_TILES = 100
+SPRITE_COLUMNS = 10
+SPRITE_MIN_INTERVAL = 10
+# 只录音频时录像文件的扩展名，没有画面可截取
+AUDIO_EXTENSIONS = tuple(f".{spec['extension']}" for spec in AUDIO_FORMATS.values()) + (".m4a", ".aac")
+
+# 设置后由 nginx 通过 X-Accel-Redirect 发送录像（sendfile + Range），值为 nginx 中 internal location 的前缀
+ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT", "")
+
+
+def _probe_duration(path: str) -> float | None:
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30
+        ).stdout.strip()
+        return float(output) if output else None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class MediaServer:
+    """
+    录像播放相关接口：支持 Range 的录像下载、按需打包的 HLS、缩略图和拖动预览雪碧图。
+    生成的文件缓存在每条录制的产物目录下（hls/、thumbs/），只生成一次，并登记到 StorageEntry。
+    """
+
+    _locks: dict[tuple, list] = {}
+
+    @staticmethod
+    def _video(record: Record) -> str:
+        if not record.video_path or not os.path.isfile(record.video_path):
+            raise HTTPException(status_code=404, detail="Video not found")
+        return record.video_path
+
+    @staticmethod
+    def _is_audio(record: Record) -> bool:
+        return bool(record.video_path) and record.video_path.lower().endswith(AUDIO_EXTENSIONS)
+
+    @staticmethod
+    def _cache_dir(record: Record, name: str) -> str:
+        return os.path.join(StorageManager.record_dir(record.task_id, record.id), name)
+
+    @staticmethod
+    def _track(session: Session, record: Record, path: str, kind: str):
+        """登记生成的缓存文件，计入空间占用，删除录制时一并清理"""
+        task = session.get(Task, record.task_id)
+        if task:
+            StorageManager.track(session, task, record.id, [path], kind)
+
+    @classmethod
+    async def _once(cls, key: tuple, target: str, build):
+        """target 不存在时生成，同一条录制的同一产物同时只生成一次"""
+        if os.path.exists(target):
+            return
+        # [锁, 持有或等待该锁的请求数]，最后一个请求离开时才移除，避免新请求另建一把锁同时生成
+        entry = cls._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if not os.path.exists(target):
+                    await build()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and cls._locks.get(key) is entry:
+                del cls._locks[key]
+
+    @staticmethod
+    def send_file(path: str, range_header: str | None, media_type: str) -> Response:
+        """支持单个 Range 的文件响应；配置了 MEDIA_ACCEL_REDIRECT 时交给 nginx 发送"""
+        if ACCEL_REDIRECT_PREFIX:
+            relative = os.path.relpath(path, STORAGE_ROOT).replace(os.sep, "/")
+            return Response(headers={"X-Accel-Redirect": ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative},
+                            media_type=media_type)
+
+        size = os.path.getsize(path)
+        match = RANGE_PATTERN.match(range_header.strip()) if range_header else None
+        if not match or match.groups() == ("", ""):
+            # 没有 Range 或是多段 Range 时返回整个文件
+            return FileResponse(path, media_type=media_type, headers={"Accept-Ranges": "bytes"})
+
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # bytes=-N 表示最后 N 个字节
+            start = max(0, size - int(last))
+            end = size - 1
+        if start >= size or start > end:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+        length = end - start + 1
+        return StreamingResponse(
+            _iter_file(path, start, length),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                "Accept-Ranges": "bytes",
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(length),
+            },
+        )
+
+    @classmethod
+    def video(cls, record: Record, range_header: str | None) -> Response:
+        path = cls._video(record)
+        media_type = "video/mp4" if path.endswith(".mp4") else "application/octet-stream"
+        return cls.send_file(path, range_header, media_type)
+
+    @classmethod
+    async def hls(cls, session: Session, record: Record, name: str) -> Response:
+        """按需把录像打包成 HLS（只复制流，不转码），打包结果缓存在 hls/ 下"""
+        if not HLS_FILE_PATTERN.match(name):
+            raise HTTPException(status_code=404, detail="Not found")
+        cache_dir = cls._cache_dir(record, "hls")
+        playlist = os.path.join(cache_dir, "index.m3u8")
+
+        async def build():
+            video = cls._video(record)
+            # 先打包到临时目录再整体改名，打包中途失败不会留下不完整的播放列表
+            tmp_dir = f"{cache_dir}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            await MediaProcessor.package_hls(video, tmp_dir)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            os.replace(tmp_dir, cache_dir)
+            cls._track(session, record, cache_dir, "hls")
+            logger.info(f"Packaged record {record.id} as HLS: {cache_dir}")
+
+        await cls._once((record.id, "hls"), playlist, build)
+        path = os.path.join(cache_dir, name)
+        if not os.path.isfile(path):
+            raise HTTPException(status_code=404, detail="Not found")
+        if name.endswith(".m3u8"):
+            return FileResponse(path, media_type="application/vnd.apple.mpegurl")
+        return FileResponse(path, media_type="video/mp2t", headers={"Cache-Control": IMMUTABLE_CACHE})
+
+    @classmethod
+    async def thumbnail(cls, session: Session, record: Record) -> Response:
+        thumbs_dir = cls._cache_dir(record, "thumbs")
+        output = os.path.join(thumbs_dir, "thumbnail.webp")
+        source = record.cover_path if record.cover_path and os.path.isfile(record.cover_path) else None
+        if source is None and cls._is_audio(record):
+            raise HTTPException(status_code=404, detail="Audio-only record has no thumbnail")
+
+        async def build():
+            await MediaProcessor.make_thumbnail(source or cls._video(record), output)
+            cls._track(session, record, thumbs_dir, "thumbs")
+
+        await cls._once((record.id, "thumbnail"), output, build)
+        return FileResponse(output, media_type="image/webp", headers={"Cache-Control": IMMUTABLE_CACHE})
+
+    @classmethod
+    async def sprite(cls, session: Session, record: Record) -> dict:
+        """生成（或读取缓存的）雪碧图，返回格子间隔和排列信息，前端据此计算每格的位置"""
+        thumbs_dir = cls._cache_dir(record, "thumbs")
+        image = os.path.join(thumbs_dir, "sprite.webp")
+        meta_path = os.path.join(thumbs_dir, "sprite.json")
+        if cls._is_audio(record):
+            raise HTTPException(status_code=404, detail="Audio-only record has no sprite")
+
+        async def build():
+            video = cls._video(record)
+            duration = None
+            if record.end_time and record.start_time:
+                duration = (record.end_time - record.start_time).total_seconds()
+            duration = duration or await asyncio.to_thread(_probe_duration, video) or SPRITE_MIN_INTERVAL
+            interval = max(SPRITE_MIN_INTERVAL, math.ceil(duration / SPRITE_MAX_TILES))
+            count = max(1, math.ceil(duration / interval))
+            columns = min(SPRITE_COLUMNS, count)
+            rows = math.ceil(count / columns)
+            await MediaProcessor.make_sprite(video, image, interval, columns, rows)
+            meta = {"interval": interval, "count": count, "columns": columns, "rows": rows}
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            cls._track(session, record, thumbs_dir, "thumbs")
+
+        await cls._once((record.id, "sprite"), meta_path, build)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta
+
+    @classmethod
+    def sprite_image(cls, record: Record) -> Response:
+        image = os.path.join(cls._cache_dir(record, "thumbs"), "sprite.webp")
+        if not os.path.isfile(image):
+            raise HTTPException(status_code=404, detail="Sprite not generated")
+        return FileResponse(image, media_type="image/webp", headers={"Cache-Control": IMMUTABLE_CACHE})
@@ -0,0 +1,255 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus 文本格式的轻量实现，避免额外依赖
+
+
+def _format_labels(names: tuple, values: tuple, extra: dict | None = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    escaped = []
+    for key, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{key}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), collect=None):
+        """collect: 可选回调，抓取时返回 {labels_tuple: value}，用于队列深度等实时值"""
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        values = dict(self._values)
+        if self._collect:
+            try:
+                values.update(self._collect())
+            except Exception:
+                pass
+        for key, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        with self._lock:
+            for key, state in self._values.items():
+                for bound, count in zip(self.buckets, state["counts"]):
+                    labels = _format_labels(self.labelnames, key, {"le": bound})
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {state['count']}")
+                plain = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{plain} {state['sum']}")
+                lines.append(f"{self.name}_count{plain} {state['count']}")
+        return lines
+
+
+class _Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = _Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _admission_collect(field: str):
+    def collect():
+        from services.admission import AdmissionController
+        return {(kind,): pool[field] for kind, pool in AdmissionController.stats()["pools"].items()}
+    return collect
+
+
+def _job_queue_collect():
+    from services.job_queue import get_job_queue
+    return {(status,): count for status, count in get_job_queue().stats()["counts"].items()}
+
+
+def _storage_collect():
+    from services.storage_manager import StorageManager
+    return {(kind,): group["bytes"] for kind, group in StorageManager.stats()["by_kind"].items()}
+
+
+# ---- Stream resolution ----
+STREAM_RESOLVE_SECONDS = Histogram(
+    "stream_resolve_seconds", "Time to resolve a live room URL into a stream URL", ("platform", "result"))
+URL_CACHE_TOTAL = Counter(
+    "stream_url_cache_total", "Resolved stream URL cache lookups", ("result",))
+STREAM_FAILOVER_TOTAL = Counter(
+    "stream_failover_total", "Mid-recording switches to another candidate stream URL", ("reason",))
+
+# ---- Recording ----
+RECORDING_START_DELAY_SECONDS = Histogram(
+    "recording_start_delay_seconds", "Delay between record request and FFmpeg process start (includes admission wait)")
+FFMPEG_EXIT_TOTAL = Counter(
+    "ffmpeg_exit_total", "FFmpeg process exits by job kind and exit code", ("kind", "code"))
+FFMPEG_ACTIVE = Gauge(
+    "ffmpeg_active_processes", "FFmpeg processes currently running", ("kind",))
+FFMPEG_STALL_TOTAL = Counter(
+    "ffmpeg_stall_total", "FFmpeg processes stopped because output stopped growing", ("kind",))
+
+# ---- Media processing ----
+MEDIA_EXTRACT_SECONDS = Histogram(
+    "media_extract_seconds", "Audio/frame extraction time", ("kind",))
+
+# ---- AI ----
+AI_REQUEST_SECONDS = Histogram(
+    "ai_request_seconds", "Latency of AI calls", ("stage", "model", "result"))
+AI_TOKENS_TOTAL = Counter(
+    "ai_tokens_total", "Tokens consumed by AI calls", ("model", "direction"))
+
+# ---- Pipeline ----
+RECORDING_JOB_SECONDS = Histogram(
+    "recording_job_seconds", "End-to-end duration of recording jobs", ("status",))
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_seconds", "Database commit latency",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+# ---- Storage ----
+STORAGE_BYTES = Gauge(
+    "storage_bytes", "Bytes of indexed recording files by kind", ("kind",), collect=_storage_collect)
+STORAGE_DELETED_BYTES_TOTAL = Counter(
+    "storage_deleted_bytes_total", "Bytes deleted by storage retention", ("reason",))
+
+# ---- Queues ----
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "FFmpeg requests waiting for a slot", ("kind",), collect=_admission_collect("queued"))
+ADMISSION_ACTIVE_SLOTS = Gauge(
+    "admission_active_slots", "FFmpeg slots currently held", ("kind",), collect=_admission_collect("active"))
+JOB_QUEUE_DEPTH = Gauge(
+    "job_queue_jobs", "Distributed job queue entries by status", ("status",), collect=_job_queue_collect)
+
+
+def record_usage(model: str, response):
+    """从 DashScope 响应中统计 token 用量，返回 (input_tokens, output_tokens)"""
+    usage = getattr(response, "usage", None) or {}
+    try:
+        input_tokens = int(usage.get("input_tokens", 0) or 0)
+        output_tokens = int(usage.get("output_tokens", 0) or 0)
+    except (AttributeError, TypeError, ValueError):
+        return 0, 0
+    if input_tokens:
+        AI_TOKENS_TOTAL.inc(input_tokens, model=model, direction="input")
+    if output_tokens:
+        AI_TOKENS_TOTAL.inc(output_tokens, model=model, direction="output")
+    return input_tokens, output_tokens
+
+
+def instrument_db_commits():
+    """通过 SQLAlchemy Session 事件统计提交耗时"""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session as OrmSession
+
+    @event.listens_for(OrmSession, "before_commit")
+    def _before_commit(session):
+        session.info["_commit_started"] = time.perf_counter()
+
+    @event.listens_for(OrmSession, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("_commit_started", None)
+        if started is not None:
+            DB_COMMIT_SECONDS.observe(time.perf_counter() - started)
@@ -1,70 +1,287 @@
 import asyncio
 import logging
+import math
 import os
+import re
 import subprocess
+import time
+from collections import deque
+from datetime import datetime
+from services.admission import AdmissionController
+from services.failover import FailoverManager
+from services.media_processor import MediaProcessor, AUDIO_FORMATS
+from services.metrics import RECORDING_START_DELAY_SECONDS, FFMPEG_EXIT_TOTAL, FFMPEG_ACTIVE, FFMPEG_STALL_TOTAL
+from src import fmp4
+from src.supervisor import FfmpegSupervisor, progress_args
 
 logger = logging.getLogger(__name__)
 
+# FFmpeg 输出中表示流地址被拒绝/已失效的错误
+URL_REJECTED_PATTERN = re.compile(r"Server returned (403|404|410|4XX)|HTTP error (403|404|410)")
+# segment muxer 写到 stdout 的分段列表行
+SEGMENT_LIST_PATTERN = re.compile(
+    r"^(.+\.(?:mp4|%s)),([\d.]+),([\d.]+)$" % "|".join(spec["extension"] for spec in AUDIO_FORMATS.values()))
+# 输出大小超过该秒数不增长视为卡顿
+STALL_TIMEOUT = 60
+# 有候选地址可切换时更早判定卡顿，减少丢失的时长
+FAILOVER_STALL_TIMEOUT = 15
+# 小于该大小的分片只有文件头，丢弃
+MIN_PART_BYTES = 1024
+
+SUPERVISOR = FfmpegSupervisor()
+
+
+class StreamUrlRejected(Exception):
+    """流地址返回 403/404，通常是签名过期或直播已结束，需要重新解析"""
+    pass
+
+
+class StreamStalled(StreamUrlRejected):
+    """FFmpeg 长时间没有写出数据，按地址失效处理，换用重新解析的地址"""
+    pass
+
+
 class RecorderService:
     @staticmethod
-    async def record_stream(stream_url: str, output_path: str, duration: int, audio_only: bool = False) -> str:
+    async def record_stream(stream_url: str, output_path: str, duration: int, audio_only: bool = False,
+                            priority: int = 0, candidates: list[str] | None = None, on_stall=None) -> str:
         """
         Record stream using FFmpeg with timeout control.
+        The FFmpeg process only starts once the admission controller grants a record slot.
+        candidates 为解析得到的其他候选地址，录制中途卡顿或出错时切换过去继续录制剩余时长。
+        on_stall 在发生卡顿时调用（保留了已录制部分、没有抛出异常时也会调用），供调用方丢弃缓存的地址。
         """
+        requested_at = time.perf_counter()
+        async with AdmissionController.slot("record", priority):
+            failover = FailoverManager([stream_url, *(candidates or [])])
+            if len(failover.candidates) > 1:
+                await RecorderService._record_with_failover(failover, output_path, duration, audio_only, requested_at,
+                                                            on_stall)
+            else:
+                await RecorderService._run_ffmpeg(stream_url, output_path, duration, audio_only, requested_at,
+                                                  on_stall=on_stall)
+
+        return output_path
+
+    @staticmethod
+    async def _record_with_failover(failover: FailoverManager, output_path: str, duration: int, audio_only: bool,
+                                    requested_at: float, on_stall=None):
+        """依次录制到 output.partN 分片，出错或卡顿后立即换下一个候选地址录制剩余时长，最后拼接"""
+        base, ext = os.path.splitext(output_path)
+        parts = []
+        remaining = duration
+        last_error = None
+        while failover.current and remaining >= 1:
+            part_path = f"{base}.part{len(parts)}{ext}"
+            attempt_started = time.monotonic()
+            supervised = None
+            try:
+                supervised = await RecorderService._run_ffmpeg(
+                    failover.current, part_path, int(math.ceil(remaining)), audio_only, requested_at,
+                    stall_timeout=FAILOVER_STALL_TIMEOUT, on_stall=on_stall)
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Recording from candidate {failover.index + 1} failed: {e}")
+            # 后续分片的启动延迟即切换耗时
+            requested_at = time.perf_counter()
+
+            if os.path.exists(part_path) and os.path.getsize(part_path) > MIN_PART_BYTES:
+                parts.append(part_path)
+                recorded = supervised.progress.out_time if supervised else 0
+                remaining -= recorded or time.monotonic() - attempt_started
+            elif os.path.exists(part_path):
+                os.remove(part_path)
+
+            if supervised and not supervised.stalls and supervised.returncode == 0:
+                # 正常录满或直播结束
+                break
+            failover.advance("stall" if supervised and supervised.stalls else "error")
+
+        if not parts:
+            raise last_error or Exception("All candidate stream URLs failed")
+        if len(parts) == 1:
+            os.replace(parts[0], output_path)
+        else:
+            await FailoverManager.concat(parts, output_path)
+            logger.info(f"Recording stitched from {len(parts)} parts after {failover.switches} switch(es)")
+
+    @staticmethod
+    async def _run_ffmpeg(stream_url: str, output_path: str, duration: int, audio_only: bool, requested_at: float,
+                          stall_timeout: float | None = None, on_stall=None):
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
         cmd = [
             "ffmpeg",
             "-y",
+            *progress_args(),
             "-i", stream_url,
             "-t", str(duration),
         ]
         
         if audio_only:
-            # Save as WAV
-            cmd.extend(["-vn", "-acodec", "pcm_s16le", "-ar", "16000", "-ac", "1"])
+            # Save as the configured audio intermediate (format follows output_path's extension)
+            cmd.extend(MediaProcessor.audio_args(MediaProcessor.format_of(output_path)))
         else:
-            # Save as MP4 (Copy stream)
+            # Save as fragmented MP4 (Copy stream): no faststart rewrite at the end, and a killed
+            # FFmpeg still leaves a playable file
             # Note: Some streams (like FLV) might need aac_adtstoasc filter when putting into MP4
-            cmd.extend(["-c", "copy", "-bsf:a", "aac_adtstoasc", "-movflags", "+faststart"])
+            cmd.extend(["-c", "copy", "-bsf:a", "aac_adtstoasc", *fmp4.movflags_args()])
             
         cmd.append(output_path)
         
         logger.info(f"Executing FFmpeg: {' '.join(cmd)}")
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        try:
-            # 添加超时控制：录制时长 + 30秒缓冲时间
-            timeout = duration + 30
-            logger.info(f"Recording with timeout: {timeout}s")
-            
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=timeout
-            )
-            
-            if process.returncode != 0:
-                error_msg = stderr.decode()
-                logger.error(f"FFmpeg Error: {error_msg}")
-                raise Exception(f"FFmpeg failed: {error_msg}")
-            
-            logger.info(f"Recording completed successfully: {output_path}")
-            
-        except asyncio.TimeoutError:
-            logger.error(f"Recording timeout after {timeout}s, terminating FFmpeg")
-            process.kill()
-            await process.wait()
+
+        # 添加超时控制：录制时长 + 30秒缓冲时间
+        timeout = duration + 30
+        stderr_tail = deque(maxlen=50)
+        stall_timeout = stall_timeout or STALL_TIMEOUT
+        supervised = await RecorderService._supervise(
+            cmd, requested_at, output_path=output_path, timeout=timeout, stall_timeout=stall_timeout,
+            on_line=stderr_tail.append)
+
+        if not audio_only and os.path.exists(output_path):
+            # 截掉被中断时写了一半的片段并写回时长，只改动文件头和末尾
+            fmp4.finalize(output_path)
+
+        if supervised.timed_out:
+            logger.error(f"Recording timeout after {timeout}s, FFmpeg stopped")
             raise Exception(f"Recording timeout after {timeout}s")
-            
-        except asyncio.CancelledError:
-            logger.warning("Recording cancelled, terminating FFmpeg")
-            process.terminate()
-            await process.wait()
-            raise
-            
-        return output_path
+
+        if supervised.stalls:
+            if on_stall:
+                on_stall()
+            # 卡顿时监管器已让 FFmpeg 收尾；有数据则保留已录制部分，否则按地址失效处理，由调用方重新解析
+            if supervised.last_size:
+                logger.warning(f"Stream stalled, keeping partial recording: {output_path}")
+                return supervised
+            raise StreamStalled(f"Stream stalled for {stall_timeout}s without data: {stream_url}")
+
+        if supervised.returncode != 0:
+            error_msg = "\n".join(stderr_tail)
+            logger.error(f"FFmpeg Error: {error_msg}")
+            if URL_REJECTED_PATTERN.search(error_msg):
+                raise StreamUrlRejected(f"Stream URL rejected: {error_msg[-500:]}")
+            raise Exception(f"FFmpeg failed: {error_msg}")
+
+        progress = supervised.progress
+        logger.info(f"Recording completed successfully: {output_path} "
+                    f"(bitrate {progress.bitrate_kbps} kbps, speed {progress.speed}x, dropped {progress.drop_frames})")
+        return supervised
+
+    @staticmethod
+    async def _supervise(cmd: list, requested_at: float, **kwargs):
+        """交给进程监管器运行 FFmpeg（stdout 用于进度，stderr 合并后交给 on_line），并记录指标"""
+        started = False
+        reported_size = 0
+        reported_at = time.monotonic()
+
+        def on_start(_):
+            nonlocal started
+            started = True
+            RECORDING_START_DELAY_SECONDS.observe(time.perf_counter() - requested_at)
+            FFMPEG_ACTIVE.inc(kind="record")
+
+        def on_progress(progress):
+            # 录制过程中按 total_size 的增量上报入口流量（segment muxer 的 total_size 为 N/A，由分段关闭时上报）
+            nonlocal reported_size, reported_at
+            now = time.monotonic()
+            if progress.total_size > reported_size:
+                AdmissionController.report_ingress(progress.total_size - reported_size, now - reported_at)
+                reported_size = progress.total_size
+            reported_at = now
+
+        kwargs.setdefault("stall_timeout", STALL_TIMEOUT)
+        try:
+            supervised = await SUPERVISOR.run(
+                cmd, on_start=on_start, on_progress=on_progress,
+                stdin=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE, **kwargs)
+        finally:
+            if started:
+                FFMPEG_ACTIVE.dec(kind="record")
+        FFMPEG_EXIT_TOTAL.inc(kind="record", code=supervised.returncode)
+        if supervised.stalls:
+            FFMPEG_STALL_TOTAL.inc(kind="record")
+        return supervised
+
+    @staticmethod
+    async def record_segments(stream_url: str, output_dir: str, segment_seconds: int, on_segment,
+                              audio_only: bool = False, stop_event: asyncio.Event | None = None,
+                              priority: int = 0, on_stall=None) -> list[str]:
+        """
+        连续录制：整个直播期间只保持一个 FFmpeg 会话，通过 segment muxer 按 segment_seconds 切段。
+        每个分段关闭时调用 await on_segment(path, start_time, end_time)，直到直播结束、stop_event 被设置或任务取消。
+        会话期间一直占用一个录制名额。
+        """
+        requested_at = time.perf_counter()
+        async with AdmissionController.slot("record", priority):
+            return await RecorderService._run_segmenter(
+                stream_url, output_dir, segment_seconds, on_segment, audio_only, stop_event, requested_at, on_stall)
+
+    @staticmethod
+    async def _run_segmenter(stream_url: str, output_dir: str, segment_seconds: int, on_segment,
+                             audio_only: bool, stop_event: asyncio.Event | None, requested_at: float,
+                             on_stall=None) -> list[str]:
+        os.makedirs(output_dir, exist_ok=True)
+
+        cmd = ["ffmpeg", "-y", *progress_args(), "-i", stream_url]
+        if audio_only:
+            cmd.extend(MediaProcessor.audio_args())
+            segment_format = MediaProcessor.audio_muxer()
+            extension = MediaProcessor.audio_extension()
+        else:
+            cmd.extend(["-c", "copy", "-bsf:a", "aac_adtstoasc",
+                        "-segment_format_options", f"movflags={fmp4.FRAGMENT_MOVFLAGS}"])
+            segment_format = extension = "mp4"
+        cmd.extend([
+            "-f", "segment",
+            "-segment_time", str(segment_seconds),
+            "-reset_timestamps", "1",
+            "-segment_format", segment_format,
+            # 分段关闭时把 "文件名,开始时间,结束时间" 写到 stdout，据此触发后续处理
+            "-segment_list", "pipe:1",
+            "-segment_list_type", "csv",
+            "-strftime", "1",
+            os.path.join(output_dir, f"%Y%m%d_%H%M%S.{extension}"),
+        ])
+
+        logger.info(f"Executing FFmpeg (continuous): {' '.join(cmd)}")
+
+        stderr_tail = deque(maxlen=20)
+        segments = []
+        session_started = datetime.now()
+
+        async def on_line(line: str):
+            # stdout 上同时有进度、分段列表和合并进来的 stderr
+            match = SEGMENT_LIST_PATTERN.match(line)
+            if not match:
+                stderr_tail.append(line)
+                return
+            filename, start, end = match.groups()
+            path = os.path.join(output_dir, os.path.basename(filename))
+            if not audio_only and os.path.exists(path):
+                fmp4.finalize(path)
+            segments.append(path)
+            if os.path.exists(path):
+                AdmissionController.report_ingress(os.path.getsize(path), float(end) - float(start))
+            start_time = datetime.fromtimestamp(session_started.timestamp() + float(start))
+            end_time = datetime.fromtimestamp(session_started.timestamp() + float(end))
+            logger.info(f"Segment closed: {path} ({float(end) - float(start):.1f}s)")
+            await on_segment(path, start_time, end_time)
+
+        # stop_event 被设置后监管器发送 SIGINT，FFmpeg 会正常收尾并写出最后一个分段
+        supervised = await RecorderService._supervise(cmd, requested_at, stop_event=stop_event, on_line=on_line)
+
+        if supervised.stalls and on_stall:
+            on_stall()
+        # 主动停止时返回码为 255，属于正常结束
+        if supervised.stalls and not segments:
+            raise StreamStalled(f"Stream stalled for {STALL_TIMEOUT}s without data: {stream_url}")
+        if supervised.returncode != 0 and not supervised.stopped and not supervised.stalls and not segments:
+            error_msg = "\n".join(stderr_tail)
+            logger.error(f"FFmpeg Error: {error_msg}")
+            if URL_REJECTED_PATTERN.search(error_msg):
+                raise StreamUrlRejected(f"Stream URL rejected: {error_msg[-500:]}")
+            raise Exception(f"FFmpeg failed: {error_msg}")
+
+        logger.info(f"Continuous recording ended with {len(segments)} segment(s), exit code {supervised.returncode}")
+        return segments
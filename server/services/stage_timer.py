@@ -0,0 +1,81 @@
+import json
+import math
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# 录制流水线的各个阶段，按执行顺序排列
+STAGES = ("resolve", "record", "extract_audio", "extract_frames", "transcribe", "vision", "report")
+
+
+class StageTimings:
+    """
+    记录一次录制各阶段的起止时间、耗时以及字节数/token数，序列化后保存到 Record.timings。
+    """
+
+    def __init__(self):
+        self.stages: dict[str, dict] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        计时上下文，yield 出的 dict 可写入 bytes / input_tokens / output_tokens 等附加信息。
+        阶段抛出异常时同样会记录耗时，并标记 ok=False。
+        """
+        info = {"start": datetime.now().isoformat(timespec="milliseconds")}
+        started = time.perf_counter()
+        self.stages[name] = info
+        try:
+            yield info
+            info["ok"] = True
+        except BaseException:
+            info["ok"] = False
+            raise
+        finally:
+            info["end"] = datetime.now().isoformat(timespec="milliseconds")
+            info["seconds"] = round(time.perf_counter() - started, 3)
+
+    def to_json(self) -> str:
+        return json.dumps(self.stages, ensure_ascii=False)
+
+
+def file_size(*paths: str) -> int:
+    return sum(os.path.getsize(p) for p in paths if p and os.path.exists(p))
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[index], 3)
+
+
+def summarize(groups: dict[str, list[dict]]) -> dict:
+    """
+    按分组汇总各阶段耗时百分位。
+    groups: {分组名: [stages dict, ...]}
+    """
+    summary = {}
+    for group, stage_list in groups.items():
+        per_stage: dict[str, list[float]] = {}
+        for stages in stage_list:
+            for name, info in stages.items():
+                if "seconds" in info:
+                    per_stage.setdefault(name, []).append(info["seconds"])
+        summary[group] = {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": round(max(values), 3),
+            }
+            for name, values in sorted(per_stage.items(), key=lambda kv: _stage_order(kv[0]))
+        }
+    return summary
+
+
+def _stage_order(name: str) -> int:
+    return STAGES.index(name) if name in STAGES else len(STAGES)
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+from database import engine, Record, Settings, StorageEntry, Task
+from services.metrics import STORAGE_DELETED_BYTES_TOTAL
+from services.stream_fetcher import StreamFetcher
+
+logger = logging.getLogger(__name__)
+
+RETENTION_POLICIES = ("lru", "age")
+# 保留策略只删除视频和按需生成的 HLS 缓存，音频、转写和报告保留
+DELETABLE_KINDS = ("video", "hls")
+# 仍在录制或处理中的录制不参与清理
+BUSY_STATUSES = ("pending", "recording", "processing")
+# 估算写入速率的时间窗口
+INGEST_WINDOW = timedelta(hours=1)
+STORAGE_ROOT = "storage"
+
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """文件的 sha256，大文件请在线程中调用"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StorageManager:
+    """
+    录制文件的空间管理。
+
+    文件在生成时登记到 StorageEntry 索引，统计和清理都只查询索引，不遍历 storage 目录。
+    任务超出 storage_quota_mb 或全部录制超出 storage_quota_gb 时，按保留策略删除视频：
+    lru 先删最久未查看的，age 先删最早录制的；storage_max_age_days 大于 0 时超期视频直接删除。
+    """
+
+    SETTING_KEYS = {
+        "quota_gb": "storage_quota_gb",
+        "retention": "storage_retention",
+        "max_age_days": "storage_max_age_days",
+    }
+
+    disk_path = STORAGE_ROOT
+
+    @staticmethod
+    def record_dir(task_id: int, record_id: int) -> str:
+        """每条录制的产物目录：storage/<task_id>/<record_id>/（视频、音频、转写、frames/）"""
+        return os.path.join(STORAGE_ROOT, str(task_id), str(record_id))
+
+    @classmethod
+    def _settings(cls, session: Session) -> dict:
+        def _get(key):
+            setting = session.get(Settings, key)
+            return setting.value if setting and setting.value else None
+
+        quota_gb = _get(cls.SETTING_KEYS["quota_gb"])
+        retention = (_get(cls.SETTING_KEYS["retention"]) or "lru").lower()
+        max_age_days = _get(cls.SETTING_KEYS["max_age_days"])
+        if retention not in RETENTION_POLICIES:
+            logger.warning(f"Unknown storage_retention '{retention}', using lru")
+            retention = "lru"
+        return {
+            "quota_bytes": int(float(quota_gb) * 1024 ** 3) if quota_gb else 0,
+            "retention": retention,
+            "max_age_days": float(max_age_days) if max_age_days else 0,
+        }
+
+    @staticmethod
+    def _platform(task: Task) -> str:
+        return task.platform if task.platform != "unknown" else StreamFetcher.get_platform(task.url)
+
+    @classmethod
+    def track(cls, session: Session, task: Task, record_id: int | None, paths: list[str], kind: str,
+              duration: float | None = None, digests: dict | None = None):
+        """
+        登记（或更新）文件大小、时长和哈希，同一路径只保留一条；digests 为 {路径: sha256}，缺省时在此计算。
+        path 为目录（如 HLS 缓存）时登记整个目录的大小，不计算哈希。
+        """
+        platform = None
+        for path in paths:
+            if not path or not os.path.exists(path):
+                continue
+            is_dir = os.path.isdir(path)
+            if is_dir:
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+            else:
+                size = os.path.getsize(path)
+            entry = session.exec(select(StorageEntry).where(StorageEntry.path == path)).first()
+            if entry is None:
+                platform = platform or cls._platform(task)
+                entry = StorageEntry(path=path, kind=kind, task_id=task.id, record_id=record_id,
+                                     anchor_id=task.anchor_id, platform=platform)
+            entry.bytes = size
+            entry.kind = kind
+            entry.record_id = record_id
+            entry.duration = duration
+            entry.sha256 = None if is_dir else (digests or {}).get(path) or file_digest(path)
+            session.add(entry)
+        session.commit()
+
+    @classmethod
+    def track_record(cls, session: Session, task: Task, record: Record, digests: dict | None = None):
+        """登记一条录制的视频、音频和转写文件，音视频时长取录制起止时间"""
+        duration = None
+        if record.end_time and record.start_time:
+            duration = round((record.end_time - record.start_time).total_seconds(), 3)
+        if record.video_path and record.video_path != record.audio_path:
+            cls.track(session, task, record.id, [record.video_path], "video", duration, digests)
+        cls.track(session, task, record.id, [record.audio_path], "audio", duration, digests)
+        cls.track(session, task, record.id, [record.transcript_path], "transcript", digests=digests)
+
+    @staticmethod
+    async def digests(*paths: str | None) -> dict:
+        """在线程中计算音视频文件的 sha256，避免阻塞事件循环"""
+        result = {}
+        for path in paths:
+            if path and os.path.isfile(path):
+                result[path] = await asyncio.to_thread(file_digest, path)
+        return result
+
+    @staticmethod
+    def artifacts(session: Session, record_id: int) -> list[StorageEntry]:
+        return list(session.exec(
+            select(StorageEntry).where(StorageEntry.record_id == record_id).order_by(StorageEntry.id)
+        ).all())
+
+    @staticmethod
+    def _remove(session: Session, entries: list[StorageEntry], directory: str) -> int:
+        """删除登记的文件和所在目录，并移除索引，避免已删除录制的文件继续计入空间占用"""
+        removed = 0
+        for entry in entries:
+            try:
+                if os.path.isdir(entry.path):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to delete {entry.path}: {e}")
+            removed += entry.bytes
+            session.delete(entry)
+        shutil.rmtree(directory, ignore_errors=True)
+        return removed
+
+    @classmethod
+    def remove_record(cls, session: Session, record: Record) -> int:
+        """删除录制时调用：删除产物目录和登记的文件，返回释放的字节数（由调用方提交）"""
+        entries = list(session.exec(select(StorageEntry).where(StorageEntry.record_id == record.id)).all())
+        removed = cls._remove(session, entries, cls.record_dir(record.task_id, record.id))
+        logger.info(f"Removed files of record {record.id} ({removed / 1024 / 1024:.1f} MB)")
+        return removed
+
+    @classmethod
+    def remove_task(cls, session: Session, task_id: int) -> int:
+        """删除任务时调用：删除 storage/<task_id>/ 和该任务登记的全部文件（由调用方提交）"""
+        entries = list(session.exec(select(StorageEntry).where(StorageEntry.task_id == task_id)).all())
+        removed = cls._remove(session, entries, os.path.join(STORAGE_ROOT, str(task_id)))
+        logger.info(f"Removed files of task {task_id} ({removed / 1024 / 1024:.1f} MB)")
+        return removed
+
+    @staticmethod
+    def touch_record(session: Session, record_id: int):
+        """录制被查看时更新访问时间，供 lru 策略使用"""
+        entries = session.exec(select(StorageEntry).where(StorageEntry.record_id == record_id)).all()
+        now = datetime.now()
+        for entry in entries:
+            entry.last_access = now
+            session.add(entry)
+        if entries:
+            session.commit()
+
+    @staticmethod
+    def _used_bytes(session: Session, task_id: int | None = None) -> int:
+        query = select(func.coalesce(func.sum(StorageEntry.bytes), 0))
+        if task_id is not None:
+            query = query.where(StorageEntry.task_id == task_id)
+        return int(session.exec(query).one())
+
+    @staticmethod
+    def _candidates(session: Session, retention: str, task_id: int | None = None,
+                    older_than: datetime | None = None) -> list[StorageEntry]:
+        busy_records = select(Record.id).where(Record.status.in_(BUSY_STATUSES))
+        query = select(StorageEntry).where(
+            StorageEntry.kind.in_(DELETABLE_KINDS),
+            (StorageEntry.record_id == None) | StorageEntry.record_id.not_in(busy_records),
+        )
+        if task_id is not None:
+            query = query.where(StorageEntry.task_id == task_id)
+        if older_than is not None:
+            query = query.where(StorageEntry.created_at < older_than)
+        order = StorageEntry.last_access if retention == "lru" else StorageEntry.created_at
+        return list(session.exec(query.order_by(order.asc())).all())
+
+    @staticmethod
+    def _delete(session: Session, entry: StorageEntry, reason: str) -> int:
+        try:
+            if os.path.isdir(entry.path):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to delete {entry.path}: {e}")
+            return 0
+
+        if entry.record_id is not None:
+            record = session.get(Record, entry.record_id)
+            if record and record.video_path == entry.path:
+                record.video_path = None
+                session.add(record)
+        freed = entry.bytes
+        session.delete(entry)
+        STORAGE_DELETED_BYTES_TOTAL.inc(freed, reason=reason)
+        logger.info(f"Storage retention ({reason}): deleted {entry.path} ({freed / 1024 / 1024:.1f} MB)")
+        return freed
+
+    @classmethod
+    def _shrink(cls, session: Session, used: int, quota: int, retention: str, reason: str,
+                task_id: int | None = None) -> int:
+        freed = 0
+        for entry in cls._candidates(session, retention, task_id):
+            if used - freed <= quota:
+                break
+            freed += cls._delete(session, entry, reason)
+        if used - freed > quota:
+            logger.warning(f"Storage still over quota ({reason}) after retention: "
+                           f"{(used - freed) / 1024 ** 3:.2f} GB used, {quota / 1024 ** 3:.2f} GB allowed")
+        return freed
+
+    @classmethod
+    def enforce(cls, session: Session, task: Task | None = None) -> int:
+        """执行保留策略，返回释放的字节数。录制完成后对所在任务调用，开销只与需要删除的文件数有关"""
+        settings = cls._settings(session)
+        freed = 0
+
+        if settings["max_age_days"] > 0:
+            older_than = datetime.now() - timedelta(days=settings["max_age_days"])
+            for entry in cls._candidates(session, "age", older_than=older_than):
+                freed += cls._delete(session, entry, "age")
+
+        if task is not None and task.storage_quota_mb > 0:
+            quota = task.storage_quota_mb * 1024 * 1024
+            used = cls._used_bytes(session, task.id)
+            if used > quota:
+                freed += cls._shrink(session, used, quota, settings["retention"], "task_quota", task.id)
+
+        if settings["quota_bytes"] > 0:
+            used = cls._used_bytes(session)
+            if used > settings["quota_bytes"]:
+                freed += cls._shrink(session, used, settings["quota_bytes"], settings["retention"], "global_quota")
+
+        session.commit()
+        return freed
+
+    @classmethod
+    def _free_disk_bytes(cls) -> int | None:
+        try:
+            return shutil.disk_usage(cls.disk_path if os.path.exists(cls.disk_path) else ".").free
+        except OSError:
+            return None
+
+    @classmethod
+    def stats(cls) -> dict:
+        with Session(engine) as session:
+            settings = cls._settings(session)
+            used = cls._used_bytes(session)
+
+            def _group(column):
+                rows = session.exec(
+                    select(column, func.sum(StorageEntry.bytes), func.count()).group_by(column)
+                ).all()
+                return {str(key): {"bytes": int(total or 0), "files": count} for key, total, count in rows}
+
+            by_task = _group(StorageEntry.task_id)
+            quotas = dict(session.exec(select(Task.id, Task.storage_quota_mb).where(Task.storage_quota_mb > 0)).all())
+            for task_id, quota_mb in quotas.items():
+                by_task.setdefault(str(task_id), {"bytes": 0, "files": 0})["quota_bytes"] = quota_mb * 1024 * 1024
+
+            since = datetime.now() - INGEST_WINDOW
+            recent = int(session.exec(
+                select(func.coalesce(func.sum(StorageEntry.bytes), 0)).where(StorageEntry.created_at >= since)
+            ).one())
+            result = {
+                "used_bytes": used,
+                "by_kind": _group(StorageEntry.kind),
+                "by_task": by_task,
+                "by_anchor": _group(StorageEntry.anchor_id),
+                "by_platform": _group(StorageEntry.platform),
+            }
+
+        # 剩余空间取配额余量和磁盘剩余中较小的一个，按最近一小时的写入速率估算写满时间
+        ingest_rate = recent / INGEST_WINDOW.total_seconds()
+        free_disk = cls._free_disk_bytes()
+        limits = [value for value in (free_disk, settings["quota_bytes"] - used if settings["quota_bytes"] else None)
+                  if value is not None]
+        remaining = max(0, min(limits)) if limits else None
+        result.update({
+            "quota_bytes": settings["quota_bytes"] or None,
+            "retention": settings["retention"],
+            "max_age_days": settings["max_age_days"] or None,
+            "free_disk_bytes": free_disk,
+            "ingest_bytes_per_second": round(ingest_rate, 1),
+            "seconds_to_full": round(remaining / ingest_rate) if remaining is not None and ingest_rate > 0 else None,
+        })
+        return result
@@ -2,18 +2,46 @@ import asyncio
 import logging
 import sys
 import os
+import time
 
 # Add parent directory to path for imports
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from src import spider, stream
 from services.config_manager import ConfigManager
+from services.metrics import STREAM_RESOLVE_SECONDS
+from services.url_cache import ResolvedUrlCache
 
 logger = logging.getLogger(__name__)
 
+PLATFORM_HOSTS = {
+    "douyin.com": "douyin",
+    "tiktok.com": "tiktok",
+    "kuaishou.com": "kuaishou",
+    "huya.com": "huya",
+    "douyu.com": "douyu",
+    "bilibili.com": "bilibili",
+}
+
+
+def _on_config_change(changed: set):
+    # cookie 或代理变化后已缓存的地址可能失效（按旧 cookie 签名或需要走代理）
+    if any(section == "Cookie" or key == "proxy_addr" for section, key in changed):
+        ResolvedUrlCache.clear("config changed")
+
+
+ConfigManager.on_change(_on_config_change)
+
+
 class StreamFetcher:
     @staticmethod
-    async def get_stream_url(url: str, timeout: int = 30) -> dict:
+    def get_platform(url: str) -> str:
+        for host, platform in PLATFORM_HOSTS.items():
+            if host in url:
+                return platform
+        return "unknown"
+
+    @staticmethod
+    async def get_stream_url(url: str, timeout: int = 30, cache_key=None) -> dict:
         """
         Resolve the real stream URL from the live room URL.
         Returns a dict with keys: 'record_url', 'anchor_name', 'is_live', etc.
@@ -21,7 +49,34 @@ class StreamFetcher:
         Args:
             url: Live room URL
             timeout: Timeout in seconds (default: 30)
+            cache_key: 传入时（通常为任务ID）复用未过期的已解析地址，命中时结果带 cached=True
         """
+        if cache_key is not None:
+            cached = ResolvedUrlCache.get(cache_key)
+            if cached:
+                return cached
+
+        stream_info = await StreamFetcher._timed_resolve(url, timeout)
+        if cache_key is not None:
+            ResolvedUrlCache.put(cache_key, stream_info)
+        return stream_info
+
+    @staticmethod
+    async def _timed_resolve(url: str, timeout: int) -> dict:
+        platform = StreamFetcher.get_platform(url)
+        result = "error"
+        started = time.perf_counter()
+        try:
+            stream_info = await StreamFetcher._resolve(url, timeout)
+            result = "live" if stream_info.get("is_live") else "offline"
+            return stream_info
+        finally:
+            STREAM_RESOLVE_SECONDS.observe(time.perf_counter() - started, platform=platform, result=result)
+
+    @staticmethod
+    async def _resolve(url: str, timeout: int) -> dict:
+        # spider 体积大且依赖 execjs/httpx，首次解析时才导入，服务启动时不加载
+        from src import spider, stream
         proxy = ConfigManager.get_proxy()
         
         try:
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+import urllib.parse
+
+from services.metrics import URL_CACHE_TOTAL
+
+logger = logging.getLogger(__name__)
+
+# 签名 CDN 地址中的过期时间参数：十进制 Unix 时间戳
+DECIMAL_EXPIRY_PARAMS = ("expire", "expires", "x-expires", "deadline")
+# 十六进制 Unix 时间戳（网宿 wsTime、腾讯云 txTime）
+HEX_EXPIRY_PARAMS = ("wsTime", "txTime")
+
+# 距离过期不足该秒数时不再复用，FFmpeg 建立连接也需要时间
+DEFAULT_MIN_REMAINING = 60
+# 没有过期参数的地址的复用时长，失效时依赖 FFmpeg 的 403/404 触发重新解析
+DEFAULT_TTL = 600
+
+
+def parse_expiry(url: str) -> float | None:
+    """从签名地址中解析过期时间（Unix 时间戳），解析不到返回 None"""
+    try:
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    except ValueError:
+        return None
+
+    for name in DECIMAL_EXPIRY_PARAMS:
+        value = query.get(name, [None])[0]
+        if value and value.isdigit():
+            expiry = int(value)
+            # 部分平台使用毫秒时间戳
+            return expiry / 1000 if expiry > 10 ** 12 else float(expiry)
+
+    for name in HEX_EXPIRY_PARAMS:
+        value = query.get(name, [None])[0]
+        if value:
+            try:
+                return float(int(value, 16))
+            except ValueError:
+                continue
+    return None
+
+
+class _Entry:
+    __slots__ = ("stream_info", "expires_at", "cached_at")
+
+    def __init__(self, stream_info: dict, expires_at: float):
+        self.stream_info = stream_info
+        self.expires_at = expires_at
+        self.cached_at = time.time()
+
+
+class ResolvedUrlCache:
+    """
+    按任务缓存已解析的直播流地址，在签名过期前复用，避免每次调度都请求房间接口、计算签名和探测地址。
+    命中时不再确认是否在播（is_live 沿用缓存时的值），因此录制失败或卡顿时由调用方 invalidate 并重新解析。
+    """
+    _entries: dict = {}
+    _lock = threading.Lock()
+    min_remaining = DEFAULT_MIN_REMAINING
+    default_ttl = DEFAULT_TTL
+
+    @classmethod
+    def get(cls, key) -> dict | None:
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                URL_CACHE_TOTAL.inc(result="miss")
+                return None
+            remaining = entry.expires_at - time.time()
+            if remaining < cls.min_remaining:
+                del cls._entries[key]
+                URL_CACHE_TOTAL.inc(result="expired")
+                logger.info(f"Cached stream URL for {key} expires in {remaining:.0f}s, re-resolving")
+                return None
+        URL_CACHE_TOTAL.inc(result="hit")
+        return dict(entry.stream_info, cached=True)
+
+    @classmethod
+    def put(cls, key, stream_info: dict):
+        record_url = stream_info.get("record_url")
+        if not stream_info.get("is_live") or not record_url:
+            return
+        expires_at = parse_expiry(record_url) or time.time() + cls.default_ttl
+        with cls._lock:
+            cls._entries[key] = _Entry(stream_info, expires_at)
+        logger.info(f"Cached stream URL for {key}, valid for {expires_at - time.time():.0f}s")
+
+    @classmethod
+    def invalidate(cls, key, reason: str = ""):
+        with cls._lock:
+            removed = cls._entries.pop(key, None)
+        if removed:
+            URL_CACHE_TOTAL.inc(result="invalidated")
+            logger.info(f"Invalidated cached stream URL for {key}{': ' + reason if reason else ''}")
+
+    @classmethod
+    def clear(cls, reason: str = ""):
+        with cls._lock:
+            count = len(cls._entries)
+            cls._entries.clear()
+        if count:
+            URL_CACHE_TOTAL.inc(count, result="invalidated")
+            logger.info(f"Cleared {count} cached stream URLs{': ' + reason if reason else ''}")
+
+    @classmethod
+    def stats(cls) -> dict:
+        now = time.time()
+        with cls._lock:
+            return {
+                str(key): {
+                    "expires_in": round(entry.expires_at - now),
+                    "age": round(now - entry.cached_at),
+                }
+                for key, entry in cls._entries.items()
+            }
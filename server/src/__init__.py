@@ -1,7 +1,8 @@
+import importlib
 import os
 import sys
+import threading
 from pathlib import Path
-from .initializer import check_node
 
 current_file_path = Path(__file__).resolve()
 current_dir = current_file_path.parent
@@ -11,4 +12,36 @@ execute_dir = os.path.split(os.path.realpath(sys.argv[0]))[0]
 node_execute_dir = Path(execute_dir) / 'node'
 current_env_path = os.environ.get('PATH')
 os.environ['PATH'] = str(node_execute_dir) + os.pathsep + current_env_path
-check_node()
+
+
+def __getattr__(name: str):
+    # 子模块在首次访问时才导入（PEP 562），只用到 fmp4、supervisor 等模块时不会加载 spider/httpx/execjs
+    try:
+        return importlib.import_module(f'.{name}', __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f'{__name__}.{name}':
+            raise
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_node_lock = threading.Lock()
+_node_available: bool | None = None
+
+
+def ensure_node() -> bool:
+    """首次需要执行 JS 时才检测（缺少时尝试安装）Node.js，结果缓存，不再在导入时启动子进程"""
+    global _node_available
+    if _node_available is None:
+        with _node_lock:
+            if _node_available is None:
+                from .initializer import check_nodejs_installed, install_nodejs
+                _node_available = check_nodejs_installed() or bool(install_nodejs())
+    return _node_available
+
+
+async def ensure_node_async() -> bool:
+    """异步代码中使用：检测或安装 Node.js 会启动子进程甚至下载，放到线程中执行，不阻塞事件循环"""
+    if _node_available is not None:
+        return _node_available
+    import asyncio
+    return await asyncio.to_thread(ensure_node)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+config.ini 的共享缓存。
+
+同一个文件只解析一次，之后的读取都来自内存；每次读取最多每 check_interval 秒 stat 一次文件，
+修改时间或大小变化时重新解析，并把变化的 (section, key) 通知给 on_change 注册的回调。
+写入（补充默认值、更新 cookie/token）先写临时文件再原子替换，同时更新内存中的值。
+"""
+import configparser
+import os
+import threading
+import time
+from typing import Callable
+from .logger import logger
+
+TRUE_VALUES = ('是', 'true', 'yes', 'on', '1')
+FALSE_VALUES = ('否', 'false', 'no', 'off', '0')
+
+
+class ConfigStore:
+    def __init__(self, path: str, encoding: str = 'utf-8-sig', check_interval: float = 1.0):
+        self.path = path
+        self.encoding = encoding
+        self.check_interval = check_interval
+        self._parser = configparser.RawConfigParser()
+        self._signature = None
+        self._checked_at = 0.0
+        self._callbacks: list[Callable[[set], None]] = []
+        self._lock = threading.RLock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _snapshot(parser: configparser.RawConfigParser) -> dict:
+        return {(section, key): value for section in parser.sections() for key, value in parser.items(section)}
+
+    def _refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        signature = self._stat()
+        if signature == self._signature:
+            return
+
+        parser = configparser.RawConfigParser()
+        try:
+            if signature is not None:
+                parser.read(self.path, encoding=self.encoding)
+        except configparser.Error as e:
+            logger.error(f"配置文件解析失败，继续使用上次的配置: {e}")
+            self._signature = signature
+            return
+        first_load = self._signature is None and not self._parser.sections()
+        old = self._snapshot(self._parser)
+        self._parser = parser
+        self._signature = signature
+        if first_load:
+            return
+        new = self._snapshot(parser)
+        changed = {key for key in old.keys() | new.keys() if old.get(key) != new.get(key)}
+        if changed:
+            self._notify(changed)
+
+    def _notify(self, changed: set) -> None:
+        for callback in list(self._callbacks):
+            try:
+                callback(changed)
+            except Exception as e:
+                logger.error(f"配置变更回调执行失败: {e}")
+
+    def on_change(self, callback: Callable[[set], None]) -> None:
+        """注册配置变化回调，参数为变化的 {(section, key)}"""
+        self._callbacks.append(callback)
+
+    def reload(self) -> None:
+        with self._lock:
+            self._refresh(force=True)
+
+    def get(self, section: str, key: str, default: str | None = None, raw: bool = True) -> str | None:
+        """
+        读取原始字符串，不存在时返回 default。
+        raw=False 时按 ConfigParser 的规则处理 %% 和 %(name)s（与 update_config 写入时的转义对应）。
+        """
+        with self._lock:
+            self._refresh()
+            if not self._parser.has_option(section, key):
+                return default
+            value = self._parser.get(section, key)
+            if raw:
+                return value
+            try:
+                return configparser.BasicInterpolation().before_get(
+                    self._parser, section, key, value, dict(self._parser.items(section)))
+            except configparser.InterpolationError:
+                return value
+
+    def get_bool(self, section: str, key: str, default: bool = False) -> bool:
+        value = self.get(section, key)
+        if value is None:
+            return default
+        value = value.strip().lower()
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        return default
+
+    def get_int(self, section: str, key: str, default: int = 0) -> int:
+        value = self.get(section, key)
+        try:
+            return int(value) if value not in (None, '') else default
+        except ValueError:
+            return default
+
+    def get_float(self, section: str, key: str, default: float = 0.0) -> float:
+        value = self.get(section, key)
+        try:
+            return float(value) if value not in (None, '') else default
+        except ValueError:
+            return default
+
+    def get_list(self, section: str, key: str, default: list | None = None) -> list[str]:
+        """逗号（中英文均可）分隔的值"""
+        value = self.get(section, key)
+        if not value:
+            return list(default or [])
+        return [item.strip() for item in value.replace('，', ',').split(',') if item.strip()]
+
+    def has_section(self, section: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return self._parser.has_section(section)
+
+    def set(self, section: str, key: str, value: str, create_section: bool = True) -> bool:
+        """写入一个值并保存文件；section 不存在且 create_section=False 时不写入，返回 False"""
+        with self._lock:
+            self._refresh(force=True)
+            if not self._parser.has_section(section):
+                if not create_section:
+                    return False
+                self._parser.add_section(section)
+            old = self._parser.get(section, key) if self._parser.has_option(section, key) else None
+            self._parser.set(section, key, value)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w', encoding=self.encoding) as f:
+                self._parser.write(f)
+            os.replace(tmp_path, self.path)
+            self._signature = self._stat()
+            if old is not None and old != value:
+                self._notify({(section, key)})
+            return True
+
+    def setdefault(self, section: str, key: str, default: str) -> str:
+        """读取值，不存在时写入 default 并返回"""
+        value = self.get(section, key)
+        if value is None:
+            self.set(section, key, default)
+            return default
+        return value
+
+
+_stores: dict[str, ConfigStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: str, encoding: str = 'utf-8-sig') -> ConfigStore:
+    """同一文件在进程内共用一个 ConfigStore"""
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ConfigStore(path, encoding)
+        return store
@@ -6,6 +6,9 @@ from .. import utils
 OptionalStr = str | None
 OptionalDict = Dict[str, Any] | None
 
+# 可替换的底层传输层，供离线基准测试/请求回放使用；None 表示使用 httpx 默认网络传输
+transport: httpx.AsyncBaseTransport | None = None
+
 
 async def async_req(
         url: str,
@@ -27,10 +30,12 @@ async def async_req(
     try:
         proxy_addr = utils.handle_proxy_addr(proxy_addr)
         if data or json_data:
-            async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2) as client:
+            async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2,
+                                         transport=transport) as client:
                 response = await client.post(url, data=data, json=json_data, headers=headers)
         else:
-            async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2) as client:
+            async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify, http2=http2,
+                                         transport=transport) as client:
                 response = await client.get(url, headers=headers, follow_redirects=True)
 
         if redirect_url:
@@ -51,7 +56,8 @@ async def get_response_status(url: str, proxy_addr: OptionalStr = None, headers:
 
     try:
         proxy_addr = utils.handle_proxy_addr(proxy_addr)
-        async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify) as client:
+        async with httpx.AsyncClient(proxy=proxy_addr, timeout=timeout, verify=verify,
+                                     transport=transport) as client:
             response = await client.head(url, headers=headers, follow_redirects=True)
             return response.status_code == 200
     except Exception as e:
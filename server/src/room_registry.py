@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+正在监测的直播间登记表。
+
+每个直播间一个 RoomState，按地址放在字典中，查找、添加和移除都是 O(1)，不再扫描列表。
+每个直播间有一个取消事件：地址被注释或从配置中删除时立即置位，监测线程的等待、
+FLV 下载和 FFmpeg 监督都在同一个事件上等待，不需要等到下一轮检测才发现。
+"""
+import threading
+import time
+
+
+class RoomState:
+    __slots__ = ('url', 'quality', 'name', 'aliases', 'cancel', 'stop_event', 'record_name', 'recording_since')
+
+    def __init__(self, url: str, quality: str = '原画', name: str = ''):
+        self.url = url
+        self.quality = quality
+        self.name = name
+        # 监测线程把地址改写后（如短链解析、补充 uid）配置文件中的新地址，仍由本直播间监测
+        self.aliases: set[str] = set()
+        # 直播间被取消（注释/删除）时置位，监测线程据此退出
+        self.cancel = threading.Event()
+        # 当前这次录制的停止信号（FLV 下载、HLS 下载器、FFmpeg 共用）
+        self.stop_event: threading.Event | None = None
+        self.record_name = ''
+        self.recording_since: float | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel.is_set()
+
+    def wait(self, timeout: float) -> bool:
+        """等待 timeout 秒，期间被取消时立即返回 True"""
+        return self.cancel.wait(timeout)
+
+    def as_tuple(self) -> tuple[str, str, str]:
+        return self.quality, self.url, self.name
+
+
+class RoomRegistry:
+    def __init__(self):
+        self._rooms: dict[str, RoomState] = {}
+        # 改写后的地址 -> 原直播间地址；原直播间仍在监测时，改写后的地址不再单独监测
+        self._aliases: dict[str, str] = {}
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rooms)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._rooms
+
+    def get(self, url: str) -> RoomState | None:
+        return self._rooms.get(url)
+
+    def all(self) -> list[RoomState]:
+        """当前登记的直播间快照，可在其它线程（如状态接口）中调用"""
+        with self._lock:
+            return list(self._rooms.values())
+
+    def add(self, url: str, quality: str = '原画', name: str = '') -> RoomState | None:
+        """登记新的直播间；已在监测或已被跳过时返回 None"""
+        with self._lock:
+            if url in self._rooms or self._alias_owner(url) is not None:
+                return None
+            room = self._rooms[url] = RoomState(url, quality, name)
+            return room
+
+    def _alias_owner(self, url: str) -> RoomState | None:
+        """url 是正在监测的直播间的改写地址时返回该直播间；直播间已取消或移除时改写地址不再被跳过"""
+        owner = self._rooms.get(self._aliases.get(url, ''))
+        if owner is None or owner.cancelled:
+            self._aliases.pop(url, None)
+            return None
+        return owner
+
+    def _drop_aliases(self, room: RoomState) -> None:
+        for alias in room.aliases:
+            if self._aliases.get(alias) == room.url:
+                del self._aliases[alias]
+
+    def discard(self, url: str) -> RoomState | None:
+        with self._lock:
+            room = self._rooms.pop(url, None)
+            if room is not None:
+                self._drop_aliases(room)
+            return room
+
+    def alias(self, url: str, new_url: str) -> None:
+        """配置中的 url 被改写为 new_url：new_url 不再单独监测，只要它还在配置中，原直播间就继续监测"""
+        with self._lock:
+            room = self._rooms.get(url)
+            if room is not None:
+                room.aliases.add(new_url)
+                self._aliases[new_url] = url
+
+    def cancel(self, url: str) -> bool:
+        """取消直播间的监测，正在进行的录制同时停止"""
+        with self._lock:
+            room = self._rooms.get(url)
+            if room is None:
+                return False
+            room.cancel.set()
+            self._drop_aliases(room)
+        stop_event = room.stop_event
+        if stop_event:
+            stop_event.set()
+        return True
+
+    def retain(self, urls: set[str]) -> list[str]:
+        """取消地址（及改写后的地址）都不在 urls 中的直播间，返回被取消的地址"""
+        with self._lock:
+            removed = [url for url, room in self._rooms.items()
+                       if url not in urls and not room.aliases & urls and not room.cancelled]
+        for url in removed:
+            self.cancel(url)
+        return removed
+
+    def attach_stop(self, url: str, stop_event: threading.Event | None = None,
+                    record_name: str = '') -> threading.Event:
+        """为一次录制登记停止信号；直播间已被取消或正在全部停止时直接置位"""
+        stop_event = stop_event or threading.Event()
+        room = self._rooms.get(url)
+        if room is not None:
+            room.record_name = record_name
+            room.recording_since = time.time()
+            room.stop_event = stop_event
+        if self._stopping or (room is not None and room.cancelled):
+            stop_event.set()
+        return stop_event
+
+    def release_stop(self, url: str, stop_event: threading.Event) -> None:
+        room = self._rooms.get(url)
+        if room is not None and room.stop_event is stop_event:
+            room.stop_event = None
+            room.recording_since = None
+
+    def stop_all(self) -> None:
+        """停止所有正在进行的录制（如磁盘空间不足），之后开始的录制也会立即停止"""
+        self._stopping = True
+        for room in self.all():
+            if room.stop_event:
+                room.stop_event.set()
@@ -24,7 +24,7 @@ import re
 import json
 import execjs
 import urllib.request
-from . import JS_SCRIPT_PATH, utils
+from . import JS_SCRIPT_PATH, utils, ensure_node_async
 from .utils import trace_error_decorator, generate_random_string
 from .logger import script_path
 from .room import get_sec_user_id, get_unique_id, UnsupportedUrlError
@@ -527,6 +527,7 @@ async def get_token_js(rid: str, did: str, proxy_addr: OptionalStr = None) -> Li
     html_str = await async_req(url=url, proxy_addr=proxy_addr)
     result = re.search(r'(vdwdae325w_64we[\s\S]*function ub98484234[\s\S]*?)function', html_str).group(1)
     func_ub9 = re.sub(r'eval.*?;}', 'strc;}', result)
+    await ensure_node_async()
     js = execjs.compile(func_ub9)
     res = js.call('ub98484234')
 
@@ -2222,6 +2223,7 @@ async def get_liveme_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
             url = match_url.group(1)
 
     room_id = url.split("/index.html")[0].rsplit('/', maxsplit=1)[-1]
+    await ensure_node_async()
     sign_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/liveme.js').read()).call('sign', room_id,
                                                                                 f'{JS_SCRIPT_PATH}/crypto-js.min.js')
     lm_s_sign = sign_data.pop("lm_s_sign")
@@ -2745,6 +2747,7 @@ async def get_haixiu_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         "c": "10138100100000",
         "_st1": int(time.time() * 1000)
     }
+    await ensure_node_async()
     ajax_data = execjs.compile(open(f'{JS_SCRIPT_PATH}/haixiu.js').read()).call('sign', params,
                                                                                 f'{JS_SCRIPT_PATH}/crypto-js.min.js')
 
@@ -3066,6 +3069,7 @@ async def get_taobao_stream_url(url: str, proxy_addr: OptionalStr = None, cookie
         _m_h5_tk = re.findall('_m_h5_tk=(.*?);', headers['Cookie'])[0]
         t13 = int(time.time() * 1000)
         pre_sign_str = f'{_m_h5_tk.split("_")[0]}&{t13}&{app_key}&' + params['data']
+        await ensure_node_async()
         sign = execjs.compile(open(f'{JS_SCRIPT_PATH}/taobao-sign.js').read()).call('sign', pre_sign_str)
         params |= {'sign': sign, 't': t13}
         api = f'https://h5api.m.taobao.com/h5/mtop.mediaplatform.live.livedetail/4.0/?{urllib.parse.urlencode(params)}'
@@ -3249,6 +3253,7 @@ async def get_migu_stream_url(url: str, proxy_addr: OptionalStr = None, cookies:
         source_url = json_data['body']['urlInfo']['url']
 
         async def _get_dd_calcu(url):
+            await ensure_node_async()
             try:
                 result = subprocess.run(
                     ["node", f"{JS_SCRIPT_PATH}/migu.js", url],
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+命令行录制的状态输出（JSON）。
+
+- 可选的内置 HTTP 接口：GET /status 返回当前状态，供容器健康检查、监控或其它程序读取
+- 可选的状态文件：每隔 interval 秒写入一次紧凑 JSON（写临时文件后原子替换），读取方不会读到写了一半的文件
+
+状态内容由调用方传入的 collect 函数生成，这里只负责发布。
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from .logger import logger
+
+
+def dumps(status: dict, compact: bool = False) -> str:
+    if compact:
+        return json.dumps(status, ensure_ascii=False, separators=(',', ':'), default=str)
+    return json.dumps(status, ensure_ascii=False, indent=2, default=str)
+
+
+class StatusServer:
+    def __init__(self, collect: Callable[[], dict], host: str = '127.0.0.1', port: int = 0,
+                 status_file: str = '', interval: float = 5):
+        self.collect = collect
+        self.host = host
+        self.port = port
+        self.status_file = status_file
+        self.interval = interval
+        self._httpd: ThreadingHTTPServer | None = None
+        self._stop = threading.Event()
+
+    def _handler(self):
+        collect = self.collect
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0].rstrip('/') not in ('', '/status'):
+                    self.send_error(404)
+                    return
+                try:
+                    body = dumps(collect()).encode('utf-8')
+                except Exception as e:
+                    logger.error(f"生成状态信息失败: {e}")
+                    self.send_error(500)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def write_file(self) -> None:
+        tmp_path = f'{self.status_file}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(dumps(self.collect(), compact=True))
+        os.replace(tmp_path, self.status_file)
+
+    def _write_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.write_file()
+            except Exception as e:
+                logger.error(f"写入状态文件失败 {self.status_file}: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self.port:
+            try:
+                self._httpd = ThreadingHTTPServer((self.host, self.port), self._handler())
+            except OSError as e:
+                logger.error(f"状态接口启动失败 {self.host}:{self.port}: {e}")
+            else:
+                self._httpd.daemon_threads = True
+                threading.Thread(target=self._httpd.serve_forever, name='status-http', daemon=True).start()
+                logger.info(f"状态接口已启动: http://{self.host}:{self.port}/status")
+        if self.status_file:
+            status_dir = os.path.dirname(os.path.abspath(self.status_file))
+            os.makedirs(status_dir, exist_ok=True)
+            threading.Thread(target=self._write_loop, name='status-file', daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
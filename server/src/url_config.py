@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+URL_config.ini 监视与整理。
+
+主循环每轮只 stat 一次文件，大小和修改时间都没有变化、也没有待写入的修改时不再重新解析。
+解析时在内存中一次性完成整理（去重、去掉多余的“主播: ”、清理链接参数、注释未知链接，以及录制线程提交的
+主播名回写），有修改时写入临时文件后原子替换，整个文件只重写一次。
+"""
+import os
+import re
+import threading
+from typing import NamedTuple
+from .logger import logger
+
+PLATFORM_HOSTS = (
+    'live.douyin.com',
+    'v.douyin.com',
+    'www.douyin.com',
+    'live.kuaishou.com',
+    'www.huya.com',
+    'www.douyu.com',
+    'www.yy.com',
+    'live.bilibili.com',
+    'www.redelight.cn',
+    'www.xiaohongshu.com',
+    'xhslink.com',
+    'www.bigo.tv',
+    'slink.bigovideo.tv',
+    'app.blued.cn',
+    'cc.163.com',
+    'qiandurebo.com',
+    'fm.missevan.com',
+    'look.163.com',
+    'twitcasting.tv',
+    'live.baidu.com',
+    'weibo.com',
+    'fanxing.kugou.com',
+    'fanxing2.kugou.com',
+    'mfanxing.kugou.com',
+    'www.huajiao.com',
+    'www.7u66.com',
+    'wap.7u66.com',
+    'live.acfun.cn',
+    'm.acfun.cn',
+    'live.tlclw.com',
+    'wap.tlclw.com',
+    'live.ybw1666.com',
+    'wap.ybw1666.com',
+    'www.inke.cn',
+    'www.zhihu.com',
+    'www.haixiutv.com',
+    "h5webcdnp.vvxqiu.com",
+    "17.live",
+    'www.lang.live',
+    "m.pp.weimipopo.com",
+    "v.6.cn",
+    "m.6.cn",
+    'www.lehaitv.com',
+    'h.catshow168.com',
+    'e.tb.cn',
+    'huodong.m.taobao.com',
+    '3.cn',
+    'eco.m.jd.com',
+    'www.miguvideo.com',
+    'm.miguvideo.com',
+    'show.lailianjie.com',
+    'www.imkktv.com',
+    'www.picarto.tv',
+)
+
+OVERSEAS_PLATFORM_HOSTS = (
+    'www.tiktok.com',
+    'play.sooplive.co.kr',
+    'm.sooplive.co.kr',
+    'www.sooplive.com',
+    'm.sooplive.com',
+    'www.pandalive.co.kr',
+    'www.winktv.co.kr',
+    'www.flextv.co.kr',
+    'www.ttinglive.com',
+    'www.popkontv.com',
+    'www.twitch.tv',
+    'www.liveme.com',
+    'www.showroom-live.com',
+    'chzzk.naver.com',
+    'm.chzzk.naver.com',
+    'live.shopee.',
+    '.shp.ee',
+    'www.youtube.com',
+    'youtu.be',
+    'www.faceit.com',
+)
+
+# 集合用于按 host 精确查找，元组保留给需要按子串匹配的地方
+KNOWN_HOSTS = frozenset(PLATFORM_HOSTS + OVERSEAS_PLATFORM_HOSTS)
+
+# 这些平台的直播间地址去掉 ? 后面的参数
+CLEAN_URL_HOSTS = frozenset((
+    "live.douyin.com",
+    "live.bilibili.com",
+    "www.huajiao.com",
+    "www.zhihu.com",
+    "www.huya.com",
+    "chzzk.naver.com",
+    "www.liveme.com",
+    "www.haixiutv.com",
+    "v.6.cn",
+    "m.6.cn",
+    'www.lehaitv.com',
+))
+
+QUALITIES = ("原画", "蓝光", "超清", "高清", "标清", "流畅")
+
+URL_PATTERN = re.compile(r"(https?://)?(www\.)?[a-zA-Z0-9-]+(\.[a-zA-Z0-9-]+)+(:\d+)?(/.*)?")
+SEPARATOR_PATTERN = re.compile('[,，]')
+XHS_HOST_ID_PATTERN = re.compile('&host_id=(.*?)(?=&|$)')
+
+
+def contains_url(string: str) -> bool:
+    return URL_PATTERN.search(string) is not None
+
+
+class UrlEntry(NamedTuple):
+    quality: str
+    url: str
+    name: str
+
+
+def _replace(lines: list[str], old: str, new: str, start_str: str | None = None) -> list[str]:
+    """在所有包含 old 的行中替换为 new（可加前缀），并去掉替换后重复的行"""
+    result = []
+    for line in lines:
+        if old in line:
+            line = line.replace(old, new)
+            if start_str:
+                line = f'{start_str}{line}'
+        if line not in result:
+            result.append(line)
+    return result
+
+
+def parse_lines(lines: list[str], default_quality: str) -> tuple[list[str], list[UrlEntry], list[str]]:
+    """
+    整理并解析配置行，返回 (整理后的行, 需要录制的地址, 已注释的地址)。
+    """
+    seen_lines = set()
+    seen_urls = set()
+    output = []
+    entries = []
+    comments = []
+    for origin_line in lines:
+        if origin_line in seen_lines:
+            continue
+        seen_lines.add(origin_line)
+        line = origin_line.strip()
+        if len(line) < 18:
+            output.append(origin_line)
+            continue
+
+        line_split = line.split('主播: ')
+        if len(line_split) > 2:
+            line = f'{line_split[0]}主播: {line_split[-1]}'
+        # 整理过程中的修改都作用在 text 上，最后写回文件
+        text = line + '\n'
+
+        is_comment_line = line.startswith("#")
+        if is_comment_line:
+            line = line.lstrip('#')
+
+        split_line = SEPARATOR_PATTERN.split(line) if SEPARATOR_PATTERN.search(line) else [line, '']
+        if len(split_line) == 1:
+            url = split_line[0]
+            quality, name = default_quality, ''
+        elif len(split_line) == 2:
+            if contains_url(split_line[0]):
+                quality = default_quality
+                url, name = split_line
+            else:
+                quality, url = split_line
+                name = ''
+        else:
+            quality, url, name = split_line[:3]
+
+        if quality not in QUALITIES:
+            quality = '原画'
+
+        if url in seen_urls:
+            continue
+        seen_urls.add(url)
+
+        url = 'https://' + url if '://' not in url else url
+        url_host = url.split('/')[2]
+        if 'live.shopee.' in url_host or '.shp.ee' in url_host:
+            url_host = 'live.shopee.' if 'live.shopee.' in url_host else '.shp.ee'
+
+        if url_host in KNOWN_HOSTS or any(ext in url for ext in (".flv", ".m3u8")):
+            if url_host in CLEAN_URL_HOSTS:
+                new_url = url.split('?')[0]
+                text = text.replace(url, new_url)
+                url = new_url
+
+            if 'xiaohongshu' in url:
+                host_id = XHS_HOST_ID_PATTERN.search(url)
+                if host_id:
+                    new_url = url.split('?')[0] + f'?host_id={host_id.group(1)}'
+                    text = text.replace(url, new_url)
+                    url = new_url
+
+            if is_comment_line:
+                comments.append(url)
+            else:
+                entries.append(UrlEntry(quality, url, name))
+        elif not is_comment_line:
+            logger.warning(f"{line} 本行包含未知链接.此条跳过")
+            text = '#' + text
+        output.append(text)
+
+    active = {entry.url for entry in entries}
+    return output, entries, [url for url in comments if url not in active]
+
+
+class UrlConfigWatcher:
+    def __init__(self, path: str, encoding: str = 'utf-8-sig'):
+        self.path = path
+        self.encoding = encoding
+        self.entries: list[UrlEntry] = []
+        self.comments: list[str] = []
+        self._signature = None
+        self._edits: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        return bool(self._edits) or self._stat() != self._signature
+
+    def queue_edit(self, old: str, new: str) -> None:
+        """录制线程提交的修改（如补充主播名），下次 poll 时与其它整理一起写入；new 以 # 开头时注释该行"""
+        with self._lock:
+            self._edits.append((old, new))
+
+    def _write(self, lines: list[str]) -> None:
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding=self.encoding) as f:
+            f.write(''.join(lines))
+        os.replace(tmp_path, self.path)
+
+    def poll(self, default_quality: str) -> bool:
+        """文件有变化或有待写入的修改时重新解析并返回 True，结果在 entries/comments 中"""
+        if not self.changed():
+            return False
+        with self._lock:
+            edits, self._edits = self._edits, []
+            signature = self._stat()
+            if signature is None:
+                lines = []
+            else:
+                with open(self.path, 'r', encoding=self.encoding, errors='ignore') as f:
+                    lines = f.readlines()
+            if lines and not lines[-1].endswith('\n'):
+                lines[-1] += '\n'
+
+            for old, new in edits:
+                if old == new:
+                    continue
+                start_str = '#' if new.startswith('#') else None
+                lines = _replace(lines, old, new.lstrip('#'), start_str)
+            output, self.entries, self.comments = parse_lines(lines, default_quality)
+
+            if signature is not None and output != lines:
+                try:
+                    self._write(output)
+                    signature = self._stat()
+                except OSError as e:
+                    logger.error(f"写入 {self.path} 失败: {e}")
+            self._signature = signature
+        return True
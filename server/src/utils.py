@@ -14,7 +14,7 @@ from urllib.parse import parse_qs, urlparse
 from collections import OrderedDict
 import execjs
 from .logger import logger
-import configparser
+from . import config_store
 
 OptionalStr = str | None
 OptionalDict = dict | None
@@ -63,45 +63,30 @@ def dict_to_cookie_str(cookies_dict: dict) -> str:
 
 
 def read_config_value(file_path: str | Path, section: str, key: str) -> str | None:
-    config = configparser.ConfigParser()
-
+    store = config_store.get_store(str(file_path))
     try:
-        config.read(file_path, encoding='utf-8-sig')
+        value = store.get(section, key, raw=False)
     except Exception as e:
         print(f"Error occurred while reading the configuration file: {e}")
         return None
 
-    if section in config:
-        if key in config[section]:
-            return config[section][key]
-        else:
-            print(f"Key [{key}] does not exist in section [{section}].")
+    if value is not None:
+        return value
+    if store.has_section(section):
+        print(f"Key [{key}] does not exist in section [{section}].")
     else:
         print(f"Section [{section}] does not exist in the file.")
-
     return None
 
 
 def update_config(file_path: str | Path, section: str, key: str, new_value: str) -> None:
-    config = configparser.ConfigParser()
-
-    try:
-        config.read(file_path, encoding='utf-8-sig')
-    except Exception as e:
-        print(f"An error occurred while reading the configuration file: {e}")
-        return
-
-    if section not in config:
-        print(f"Section [{section}] does not exist in the file.")
-        return
-
+    store = config_store.get_store(str(file_path))
     # 转义%字符
     escaped_value = new_value.replace('%', '%%')
-    config[section][key] = escaped_value
-
     try:
-        with open(file_path, 'w', encoding='utf-8-sig') as configfile:
-            config.write(configfile)
+        if not store.set(section, key, escaped_value, create_section=False):
+            print(f"Section [{section}] does not exist in the file.")
+            return
         print(f"The value of {key} under [{section}] in the configuration file has been updated.")
     except Exception as e:
         print(f"Error occurred while writing to the configuration file: {e}")
@@ -0,0 +1,138 @@
+"""
+分布式 worker：从共享队列认领录制/分析任务并执行。
+
+API 进程以 RUN_MODE=distributed 启动时只负责入队，任意主机上的 worker 进程
+连接同一个数据库（或 JOB_QUEUE_URL 指定的 Redis）后即可分担录制负载：
+
+    RUN_MODE=distributed python worker.py --concurrency 2
+
+worker 在执行期间定期续约，进程退出或宕机后租约过期，任务会被其他 worker 重新认领。
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import time
+
+from database import create_db_and_tables
+from scheduler import execute_recording_job, execute_analysis_job
+from services.admission import AdmissionController
+from services.media_processor import MediaProcessor
+from services.job_queue import get_job_queue, default_worker_id, LEASE_SECONDS
+
+logger = logging.getLogger("worker")
+
+HANDLERS = {
+    "recording": lambda job: execute_recording_job(job.task_id),
+    "analysis": lambda job: execute_analysis_job(job.payload["record_id"]),
+}
+
+
+class Worker:
+    def __init__(self, worker_id: str, concurrency: int = 1, poll_interval: float = 2.0):
+        self.worker_id = worker_id
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.queue = get_job_queue()
+        self.running: set[asyncio.Task] = set()
+        self.stopping = asyncio.Event()
+
+    async def _heartbeat(self, job, job_task: asyncio.Task):
+        """
+        定期续约。续约出错（数据库被锁、Redis 连接断开等）时下一轮重试，
+        只有确认租约已被接管，或一直续约失败直到租约到期时才取消任务，避免同一直播被两个 worker 同时录制。
+        """
+        lease_deadline = time.monotonic() + LEASE_SECONDS
+        while not job_task.done():
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                ok = await asyncio.to_thread(self.queue.heartbeat, job.id, self.worker_id)
+            except Exception as e:
+                if time.monotonic() < lease_deadline:
+                    logger.warning(f"Heartbeat for {job} failed, retrying: {e}")
+                    continue
+                ok = False
+                logger.error(f"Heartbeat for {job} kept failing until the lease expired: {e}")
+            else:
+                if ok:
+                    lease_deadline = time.monotonic() + LEASE_SECONDS
+            if not ok and not job_task.done():
+                logger.warning(f"Lost lease for {job}, cancelling")
+                job_task.cancel()
+                return
+
+    async def _run_job(self, job):
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            await asyncio.to_thread(self.queue.fail, job.id, self.worker_id, f"Unknown job kind: {job.kind}", False)
+            return
+
+        logger.info(f"Running {job}")
+        job_task = asyncio.create_task(handler(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job, job_task))
+        try:
+            await job_task
+            await asyncio.to_thread(self.queue.complete, job.id, self.worker_id)
+            logger.info(f"Completed {job}")
+        except asyncio.CancelledError:
+            logger.warning(f"Cancelled {job}")
+        except Exception as e:
+            logger.error(f"{job} failed: {e}", exc_info=True)
+            await asyncio.to_thread(self.queue.fail, job.id, self.worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+
+    async def run(self):
+        logger.info(f"Worker {self.worker_id} started (concurrency={self.concurrency})")
+        while not self.stopping.is_set():
+            if len(self.running) >= self.concurrency:
+                await asyncio.wait(self.running, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id, list(HANDLERS))
+            except Exception as e:
+                # 队列暂时不可用（数据库被锁、Redis 连接断开等）时等待后继续轮询
+                logger.error(f"Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run_job(job))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+        if self.running:
+            logger.info(f"Waiting for {len(self.running)} running job(s) to finish")
+            await asyncio.wait(self.running)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="DouyinLiveRecorder distributed worker")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时执行的任务数")
+    parser.add_argument("--worker-id", default=None, help="worker 标识，默认 主机名-进程号")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="队列为空时的轮询间隔（秒）")
+    args = parser.parse_args()
+
+    create_db_and_tables()
+    AdmissionController.configure_from_settings()
+    MediaProcessor.configure_from_settings()
+
+    worker = Worker(args.worker_id or default_worker_id(), args.concurrency, args.poll_interval)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, worker.stopping.set)
+        except NotImplementedError:
+            pass
+    await worker.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s - %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+异步 FLV 直播流下载器。
+
+- 预分配的大块写缓冲区，多个网络分片合并后再写盘，减少系统调用
+- 通过 threading.Event 停止，不需要在每个分片上扫描全局列表
+- 读超时即判定为卡顿，自动重连并追加写入同一个文件，重连后跳过新连接的 FLV 文件头
+- 统计下载字节数、平均/瞬时速率、重连次数
+"""
+import asyncio
+import threading
+import time
+import httpx
+from .logger import logger
+
+FLV_SIGNATURE = b'FLV'
+# FLV 文件头 9 字节 + PreviousTagSize0 4 字节
+FLV_HEADER_SIZE = 13
+
+
+class DownloadStats:
+    __slots__ = ('bytes', 'started_at', 'reconnects', 'stalls', 'stopped', 'last_data_at',
+                 '_window_bytes', '_window_started', 'current_bps')
+
+    def __init__(self):
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        self.reconnects = 0
+        self.stalls = 0
+        self.stopped = False
+        self.last_data_at = self.started_at
+        self._window_bytes = 0
+        self._window_started = self.started_at
+        self.current_bps = 0.0
+
+    def add(self, n: int) -> None:
+        now = time.monotonic()
+        self.bytes += n
+        self.last_data_at = now
+        self._window_bytes += n
+        elapsed = now - self._window_started
+        if elapsed >= 5:
+            self.current_bps = self._window_bytes / elapsed
+            self._window_bytes = 0
+            self._window_started = now
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def average_bps(self) -> float:
+        elapsed = self.elapsed
+        return self.bytes / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.bytes / 1024 / 1024:.1f} MB in {self.elapsed:.0f}s, "
+                f"avg {self.average_bps * 8 / 1000 / 1000:.2f} Mbps, "
+                f"reconnects {self.reconnects}, stalls {self.stalls}")
+
+
+class FlvDownloader:
+    def __init__(self, url: str, save_path: str, headers: dict | None = None,
+                 stop_event: threading.Event | None = None, proxy: str | None = None,
+                 stall_timeout: float = 20, max_reconnects: int = 5, reconnect_delay: float = 3,
+                 buffer_size: int = 1024 * 1024, chunk_size: int = 256 * 1024, flush_interval: float = 2):
+        self.url = url
+        self.save_path = save_path
+        self.headers = headers or {}
+        self.stop_event = stop_event or threading.Event()
+        self.proxy = proxy
+        self.stall_timeout = stall_timeout
+        self.max_reconnects = max_reconnects
+        self.reconnect_delay = reconnect_delay
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.stats = DownloadStats()
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._fill = 0
+        self._last_flush = time.monotonic()
+
+    def _flush(self, f) -> None:
+        if self._fill:
+            f.write(self._view[:self._fill])
+            self._fill = 0
+        self._last_flush = time.monotonic()
+
+    def _write(self, f, data: bytes | memoryview) -> None:
+        n = len(data)
+        if self._fill + n > len(self._buffer):
+            self._flush(f)
+        if n >= len(self._buffer):
+            f.write(data)
+        else:
+            self._buffer[self._fill:self._fill + n] = data
+            self._fill += n
+        # 定时落盘，便于外部观察文件增长，进程异常退出时也只丢失少量数据
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush(f)
+
+    async def _stream_once(self, client: httpx.AsyncClient, f, skip_header: bool) -> bool:
+        """
+        下载一次连接的数据，返回该连接是否收到过数据。
+        skip_header 为 True 时丢弃新连接开头的 FLV 文件头，使数据能接续在已写入的内容之后。
+        """
+        received = False
+        pending_skip = FLV_HEADER_SIZE if skip_header else 0
+        async with client.stream('GET', self.url, headers=self.headers, follow_redirects=True) as response:
+            if response.status_code != 200:
+                raise httpx.HTTPStatusError(
+                    f"status {response.status_code}", request=response.request, response=response)
+
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                if self.stop_event.is_set():
+                    self.stats.stopped = True
+                    return received
+                if not chunk:
+                    continue
+                received = True
+                if pending_skip:
+                    if pending_skip == FLV_HEADER_SIZE and not chunk.startswith(FLV_SIGNATURE):
+                        # 服务端没有返回文件头，直接接续
+                        pending_skip = 0
+                    else:
+                        skipped = min(pending_skip, len(chunk))
+                        chunk = memoryview(chunk)[skipped:]
+                        pending_skip -= skipped
+                        if not chunk:
+                            continue
+                self._write(f, chunk)
+                self.stats.add(len(chunk))
+        return received
+
+    async def _watch_stop(self, task: asyncio.Task) -> None:
+        # 卡在网络读取时也能及时响应停止请求
+        while not task.done():
+            if self.stop_event.is_set():
+                self.stats.stopped = True
+                task.cancel()
+                return
+            await asyncio.sleep(0.5)
+
+    async def _download(self) -> None:
+        timeout = httpx.Timeout(connect=10, read=self.stall_timeout, write=10, pool=10)
+        failures = 0
+        async with httpx.AsyncClient(timeout=timeout, proxy=self.proxy, verify=False) as client:
+            with open(self.save_path, 'wb') as f:
+                try:
+                    while not self.stop_event.is_set():
+                        try:
+                            received = await self._stream_once(client, f, skip_header=self.stats.bytes > 0)
+                            if self.stats.stopped:
+                                return
+                            failures = 0 if received else failures + 1
+                        except httpx.ReadTimeout:
+                            self.stats.stalls += 1
+                            failures += 1
+                            logger.warning(f"FLV流 {self.stall_timeout}s 无数据，准备重连: {self.save_path}")
+                        except httpx.HTTPStatusError as e:
+                            # 已经录到数据后返回 4xx 通常表示直播结束
+                            if self.stats.bytes and e.response.status_code in (403, 404, 410):
+                                return
+                            failures += 1
+                            logger.warning(f"FLV流请求失败: {e}")
+                        except httpx.TransportError as e:
+                            failures += 1
+                            logger.warning(f"FLV流连接中断: {e}")
+
+                        if failures > self.max_reconnects:
+                            logger.warning(f"FLV流重连 {self.max_reconnects} 次仍失败，结束下载: {self.save_path}")
+                            return
+                        self.stats.reconnects += 1
+                        if await self._sleep_or_stop(self.reconnect_delay):
+                            self.stats.stopped = True
+                            return
+                finally:
+                    self._flush(f)
+
+    async def _sleep_or_stop(self, seconds: float) -> bool:
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if self.stop_event.is_set():
+                return True
+            await asyncio.sleep(min(0.5, deadline - time.monotonic()))
+        return False
+
+    async def run(self) -> DownloadStats:
+        task = asyncio.create_task(self._download())
+        watcher = asyncio.create_task(self._watch_stop(task))
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not self.stats.stopped:
+                raise
+        finally:
+            watcher.cancel()
+        logger.info(f"FLV下载结束 {self.save_path}: {self.stats.summary()}")
+        return self.stats
+
+
+def download_flv(url: str, save_path: str, headers: dict | None = None,
+                 stop_event: threading.Event | None = None, **kwargs) -> DownloadStats:
+    """在当前线程中同步运行下载器，供 main.py 的录制线程调用"""
+    return asyncio.run(FlvDownloader(url, save_path, headers, stop_event, **kwargs).run())
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+分片 MP4（fragmented MP4）录制辅助。
+
+录制时使用 +frag_keyframe+empty_moov+default_base_moof：文件头只有空的 moov，数据以 moof+mdat 片段追加，
+进程被杀或断电时已写入的片段仍可播放，也就不需要录制后再整体转封装一次。
+
+finalize 只读取各个顶层 box 的头部和最后一个片段，不会整体重写文件：
+- 截掉末尾不完整的片段（异常退出时可能只写了一半）
+- 把总时长写回 moov 中的 mvhd/mehd（empty_moov 时为 0，部分播放器会因此显示不出时长）
+"""
+import os
+import struct
+from .logger import logger
+
+FRAGMENT_MOVFLAGS = '+frag_keyframe+empty_moov+default_base_moof'
+
+
+def movflags_args() -> list[str]:
+    return ['-movflags', FRAGMENT_MOVFLAGS]
+
+
+def _read_box_header(f, offset: int, end: int) -> tuple[int, str, int] | None:
+    """返回 (box 大小, 类型, 头部长度)，不完整时返回 None"""
+    if offset + 8 > end:
+        return None
+    f.seek(offset)
+    size, box_type = struct.unpack('>I4s', f.read(8))
+    header = 8
+    if size == 1:
+        if offset + 16 > end:
+            return None
+        size = struct.unpack('>Q', f.read(8))[0]
+        header = 16
+    elif size == 0:
+        size = end - offset
+    if size < header:
+        return None
+    return size, box_type.decode('latin-1'), header
+
+
+def scan_boxes(path: str) -> tuple[list[tuple[str, int, int]], int]:
+    """
+    扫描顶层 box，返回 ([(类型, 偏移, 大小)], 完整部分的结束偏移)。
+    只 seek 和读取每个 box 的头部。
+    """
+    boxes = []
+    end = os.path.getsize(path)
+    offset = 0
+    with open(path, 'rb') as f:
+        while offset < end:
+            header = _read_box_header(f, offset, end)
+            if header is None or offset + header[0] > end:
+                break
+            size, box_type, _ = header
+            boxes.append((box_type, offset, size))
+            offset += size
+    return boxes, offset
+
+
+def _children(data: bytes, start: int = 0, end: int | None = None):
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>I4s', data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            return
+        yield box_type.decode('latin-1'), offset, offset + header, offset + size
+        offset += size
+
+
+def _find(data: bytes, box_type: str, start: int = 0, end: int | None = None):
+    for child_type, offset, body, child_end in _children(data, start, end):
+        if child_type == box_type:
+            return offset, body, child_end
+    return None
+
+
+def _parse_moov(moov: bytes) -> dict:
+    info = {'movie_timescale': None, 'mvhd': None, 'mehd': None, 'tracks': {}, 'trex': {}}
+    for box_type, offset, body, end in _children(moov):
+        if box_type == 'mvhd':
+            version = moov[body]
+            if version == 1:
+                timescale = struct.unpack_from('>I', moov, body + 20)[0]
+                info['mvhd'] = (body + 24, 8)
+            else:
+                timescale = struct.unpack_from('>I', moov, body + 12)[0]
+                info['mvhd'] = (body + 16, 4)
+            info['movie_timescale'] = timescale
+        elif box_type == 'trak':
+            tkhd = _find(moov, 'tkhd', body, end)
+            mdia = _find(moov, 'mdia', body, end)
+            mdhd = _find(moov, 'mdhd', mdia[1], mdia[2]) if mdia else None
+            if not tkhd or not mdhd:
+                continue
+            track_id = struct.unpack_from('>I', moov, tkhd[1] + (20 if moov[tkhd[1]] == 1 else 12))[0]
+            timescale = struct.unpack_from('>I', moov, mdhd[1] + (20 if moov[mdhd[1]] == 1 else 12))[0]
+            info['tracks'][track_id] = timescale
+        elif box_type == 'mvex':
+            for child_type, _, child_body, _ in _children(moov, body, end):
+                if child_type == 'trex':
+                    track_id, _, default_duration = struct.unpack_from('>III', moov, child_body + 4)
+                    info['trex'][track_id] = default_duration
+                elif child_type == 'mehd':
+                    info['mehd'] = (child_body + 4, 8 if moov[child_body] == 1 else 4)
+    return info
+
+
+def _fragment_end_times(moof: bytes, trex: dict) -> dict:
+    """返回最后一个片段中每条轨道的结束时间（轨道时间基）"""
+    result = {}
+    for box_type, _, body, end in _children(moof):
+        if box_type != 'traf':
+            continue
+        track_id = None
+        default_duration = 0
+        base_time = 0
+        total = 0
+        for child_type, _, child_body, _ in _children(moof, body, end):
+            flags = struct.unpack_from('>I', moof, child_body)[0] & 0xFFFFFF
+            if child_type == 'tfhd':
+                track_id = struct.unpack_from('>I', moof, child_body + 4)[0]
+                pos = child_body + 8
+                if flags & 0x1:
+                    pos += 8
+                if flags & 0x2:
+                    pos += 4
+                default_duration = struct.unpack_from('>I', moof, pos)[0] if flags & 0x8 else trex.get(track_id, 0)
+            elif child_type == 'tfdt':
+                if moof[child_body] == 1:
+                    base_time = struct.unpack_from('>Q', moof, child_body + 4)[0]
+                else:
+                    base_time = struct.unpack_from('>I', moof, child_body + 4)[0]
+            elif child_type == 'trun':
+                count = struct.unpack_from('>I', moof, child_body + 4)[0]
+                pos = child_body + 8
+                if flags & 0x1:
+                    pos += 4
+                if flags & 0x4:
+                    pos += 4
+                fields = sum(1 for bit in (0x100, 0x200, 0x400, 0x800) if flags & bit)
+                if flags & 0x100:
+                    for i in range(count):
+                        total += struct.unpack_from('>I', moof, pos + i * fields * 4)[0]
+                else:
+                    total += count * default_duration
+        if track_id is not None:
+            result[track_id] = base_time + total
+    return result
+
+
+def finalize(path: str) -> dict:
+    """
+    整理分片 MP4，返回 {'fragments', 'truncated', 'duration'}。
+    不是分片 MP4（没有 moof）时不做任何修改。
+    """
+    boxes, complete_end = scan_boxes(path)
+    file_size = os.path.getsize(path)
+    moov = next((b for b in boxes if b[0] == 'moov'), None)
+    moofs = [i for i, b in enumerate(boxes) if b[0] == 'moof']
+    result = {'fragments': 0, 'truncated': 0, 'duration': None}
+    if not moov or not moofs:
+        return result
+
+    # 只保留后面跟着完整 mdat 的片段
+    last = moofs[-1]
+    if last + 1 >= len(boxes) or boxes[last + 1][0] != 'mdat':
+        moofs.pop()
+        if not moofs:
+            return result
+        last = moofs[-1]
+    keep_end = boxes[last + 1][1] + boxes[last + 1][2]
+    tail = [b for b in boxes[last + 2:] if b[0] in ('mfra', 'free', 'skip')]
+    if tail and tail[-1][1] + tail[-1][2] == complete_end:
+        keep_end = complete_end
+
+    with open(path, 'r+b') as f:
+        f.seek(moov[1])
+        moov_data = f.read(moov[2])
+        moof_box = boxes[last]
+        f.seek(moof_box[1])
+        moof_data = f.read(moof_box[2])
+
+        header = _read_box_header(f, moov[1], file_size)
+        try:
+            info = _parse_moov(moov_data[header[2]:])
+            moof_header = _read_box_header(f, moof_box[1], file_size)
+            end_times = _fragment_end_times(moof_data[moof_header[2]:], info['trex'])
+        except (struct.error, IndexError) as e:
+            logger.warning(f"分片MP4时长解析失败，跳过时长修正: {e}")
+            info, end_times = {'movie_timescale': None}, {}
+        movie_timescale = info['movie_timescale']
+        seconds = None
+        if movie_timescale and end_times:
+            # 片段中的轨道在 moov 中都没有时间刻度时，没有可用的时长
+            seconds = max((end / info['tracks'][tid] for tid, end in end_times.items() if info['tracks'].get(tid)),
+                          default=None)
+        if seconds is not None:
+            result['duration'] = round(seconds, 3)
+            # 只改写 moov 中时长字段本身，box 大小不变
+            for field in (info['mvhd'], info['mehd']):
+                if not field:
+                    continue
+                pos, width = field
+                value = int(seconds * movie_timescale)
+                if width == 4:
+                    value = min(value, 0xFFFFFFFF)
+                f.seek(moov[1] + header[2] + pos)
+                f.write(struct.pack('>Q' if width == 8 else '>I', value))
+
+        if keep_end < file_size:
+            f.truncate(keep_end)
+            result['truncated'] = file_size - keep_end
+
+    result['fragments'] = len(moofs)
+    if result['truncated']:
+        logger.warning(f"分片MP4末尾不完整，已截掉 {result['truncated']} 字节: {path}")
+    return result
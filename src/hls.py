@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+内置 HLS 分片下载器，替代 FFmpeg 的 HLS 解复用器（串行下载分片且 -re 限速到实时）。
+
+- 从主播放列表中解析出码率最高的子播放列表（相对地址按主播放列表的地址补全）
+- 按 EXT-X-TARGETDURATION 轮询媒体播放列表，按 media sequence 去重
+- 同一个连接池内并发预取多个分片，失败重试，按序写入 sink（TS 文件或 FFmpeg 的 stdin）
+- 统计缺失分片（gap）与分片从出现在播放列表到写出的延迟
+"""
+import asyncio
+import collections
+import re
+import threading
+import time
+import urllib.parse
+import httpx
+from . import utils
+from .logger import logger
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class HlsSegment:
+    __slots__ = ('sequence', 'url', 'duration', 'byte_range', 'init_url')
+
+    def __init__(self, sequence: int, url: str, duration: float, byte_range: tuple[int, int] | None = None,
+                 init_url: str | None = None):
+        self.sequence = sequence
+        self.url = url
+        self.duration = duration
+        self.byte_range = byte_range
+        self.init_url = init_url
+
+
+class MediaPlaylist:
+    __slots__ = ('target_duration', 'media_sequence', 'segments', 'ended', 'encrypted')
+
+    def __init__(self):
+        self.target_duration = 6.0
+        self.media_sequence = 0
+        self.segments: list[HlsSegment] = []
+        self.ended = False
+        self.encrypted = False
+
+
+def _attributes(line: str) -> dict:
+    return {k: v.strip('"') for k, v in ATTRIBUTE_PATTERN.findall(line.split(':', 1)[-1])}
+
+
+def parse_media_playlist(text: str, base_url: str) -> MediaPlaylist:
+    playlist = MediaPlaylist()
+    sequence = None
+    duration = 0.0
+    byte_range = None
+    next_offset = 0
+    init_url = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            playlist.target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            playlist.media_sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',', 1)[0] or 0)
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line.split(':', 1)[1].partition('@')
+            start = int(offset) if offset else next_offset
+            byte_range = (start, start + int(length) - 1)
+            next_offset = start + int(length)
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = _attributes(line).get('URI')
+            init_url = urllib.parse.urljoin(base_url, uri) if uri else None
+        elif line.startswith('#EXT-X-KEY:'):
+            playlist.encrypted = _attributes(line).get('METHOD', 'NONE') != 'NONE'
+        elif line.startswith('#EXT-X-ENDLIST'):
+            playlist.ended = True
+        elif not line.startswith('#'):
+            if sequence is None:
+                sequence = playlist.media_sequence
+            playlist.segments.append(
+                HlsSegment(sequence, urllib.parse.urljoin(base_url, line), duration, byte_range, init_url))
+            sequence += 1
+            duration = 0.0
+            byte_range = None
+    return playlist
+
+
+def parse_master_playlist(text: str, base_url: str) -> list[str]:
+    """主播放列表中的各码率子播放列表地址（相对地址按 base_url 补全），按 BANDWIDTH 从高到低排序"""
+    variants = []
+    bandwidth = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            value = _attributes(line).get('BANDWIDTH', '')
+            bandwidth = int(value) if value.isdigit() else 0
+        elif not line.startswith('#') and bandwidth is not None:
+            variants.append((bandwidth, urllib.parse.urljoin(base_url, line)))
+            bandwidth = None
+    variants.sort(key=lambda item: item[0], reverse=True)
+    return [url for _, url in variants]
+
+
+class HlsStats:
+    __slots__ = ('segments', 'bytes', 'gaps', 'failed', 'retries', 'playlist_reloads', 'stopped',
+                 'started_at', 'latencies')
+
+    def __init__(self):
+        self.segments = 0
+        self.bytes = 0
+        self.gaps = 0
+        self.failed = 0
+        self.retries = 0
+        self.playlist_reloads = 0
+        self.stopped = False
+        self.started_at = time.monotonic()
+        # 分片出现在播放列表中到写入 sink 的耗时
+        self.latencies = collections.deque(maxlen=1000)
+
+    def latency(self, pct: float) -> float | None:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def summary(self) -> str:
+        p50, p99 = self.latency(50), self.latency(99)
+        latency = f"latency p50 {p50:.2f}s p99 {p99:.2f}s" if p50 is not None else "latency n/a"
+        return (f"{self.segments} segments, {self.bytes / 1024 / 1024:.1f} MB, gaps {self.gaps}, "
+                f"failed {self.failed}, retries {self.retries}, {latency}")
+
+
+class HlsFetcher:
+    def __init__(self, url: str, headers: dict | None = None, proxy: str | None = None,
+                 stop_event: threading.Event | None = None, prefetch: int = 4, max_retries: int = 3,
+                 segment_timeout: float = 15, live_edge: int = 3, max_playlist_failures: int = 5):
+        self.url = url
+        self.headers = headers or {}
+        self.proxy = utils.handle_proxy_addr(proxy)
+        self.stop_event = stop_event or threading.Event()
+        self.prefetch = max(1, prefetch)
+        self.max_retries = max_retries
+        self.segment_timeout = segment_timeout
+        self.live_edge = live_edge
+        self.max_playlist_failures = max_playlist_failures
+        self.stats = HlsStats()
+        self._sink_broken = False
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    async def _get(self, client: httpx.AsyncClient, url: str, headers: dict | None = None) -> bytes:
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        return response.content
+
+    async def _media_playlist_url(self, client: httpx.AsyncClient) -> str:
+        response = await client.get(self.url)
+        response.raise_for_status()
+        text = response.content.decode('utf-8', errors='ignore')
+        if '#EXT-X-STREAM-INF' not in text:
+            return self.url
+        # 子播放列表的相对地址相对于跳转后的最终地址
+        variants = parse_master_playlist(text, str(response.url))
+        if not variants:
+            raise Exception(f"No variant playlist found in {self.url}")
+        return variants[0]
+
+    def _sequence_reset(self, playlist: MediaPlaylist, next_sequence: int | None) -> bool:
+        """播放列表中的分片全部早于已下载位置，且落后超过两个播放列表长度（不是 CDN 缓存的旧列表）时视为编号重置"""
+        if next_sequence is None or not playlist.segments or playlist.segments[-1].sequence >= next_sequence:
+            return False
+        window = max(len(playlist.segments), self.live_edge)
+        return next_sequence - playlist.media_sequence > 2 * window
+
+    async def _fetch_segment(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore,
+                             segment: HlsSegment) -> bytes | None:
+        headers = None
+        if segment.byte_range:
+            headers = {'Range': f'bytes={segment.byte_range[0]}-{segment.byte_range[1]}'}
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self._get(client, segment.url, headers)
+                except (httpx.HTTPError, httpx.StreamError) as e:
+                    if attempt == self.max_retries:
+                        logger.warning(f"HLS分片 {segment.sequence} 下载失败: {e}")
+                        return None
+                    self.stats.retries += 1
+                    await asyncio.sleep(min(2 ** attempt * 0.5, 4))
+
+    async def _writer(self, queue: asyncio.Queue, sink) -> None:
+        """按 media sequence 顺序等待预取任务完成并写入 sink"""
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            segment, seen_at, task = item
+            data = await task
+            if data is None:
+                self.stats.failed += 1
+                self.stats.gaps += 1
+                continue
+            if self._sink_broken:
+                continue
+            try:
+                await asyncio.to_thread(sink.write, data)
+            except (OSError, ValueError) as e:
+                # FFmpeg 提前退出时管道已断开，继续消费队列让下载循环退出
+                logger.warning(f"HLS分片写入失败: {e}")
+                self._sink_broken = True
+                continue
+            self.stats.segments += 1
+            self.stats.bytes += len(data)
+            self.stats.latencies.append(time.monotonic() - seen_at)
+
+    async def _download(self, sink) -> None:
+        timeout = httpx.Timeout(self.segment_timeout, connect=10)
+        limits = httpx.Limits(max_connections=self.prefetch + 1, max_keepalive_connections=self.prefetch + 1)
+        async with httpx.AsyncClient(headers=self.headers, proxy=self.proxy, timeout=timeout, limits=limits,
+                                     verify=False, follow_redirects=True) as client:
+            media_url = await self._media_playlist_url(client)
+            semaphore = asyncio.Semaphore(self.prefetch)
+            # 限制排队中的分片数，sink 写不动时暂停预取
+            queue = asyncio.Queue(maxsize=self.prefetch * 2)
+            writer = asyncio.create_task(self._writer(queue, sink))
+            next_sequence = None
+            current_init = None
+            failures = 0
+            try:
+                while not self.stop_event.is_set() and not self._sink_broken:
+                    try:
+                        text = (await self._get(client, media_url)).decode('utf-8', errors='ignore')
+                        playlist = parse_media_playlist(text, media_url)
+                        failures = 0
+                    except (httpx.HTTPError, ValueError) as e:
+                        failures += 1
+                        if failures > self.max_playlist_failures:
+                            logger.warning(f"HLS播放列表连续 {failures} 次获取失败，结束下载: {e}")
+                            break
+                        await asyncio.sleep(1)
+                        continue
+
+                    self.stats.playlist_reloads += 1
+                    if playlist.encrypted:
+                        logger.error(f"HLS流已加密，内置下载器不支持: {media_url}")
+                        break
+
+                    segments = playlist.segments
+                    if self._sequence_reset(playlist, next_sequence):
+                        # 推流重启后部分 CDN 在同一地址上从头编号，不重置会把之后的分片全部当作已下载而丢弃
+                        logger.warning(f"HLS media sequence 从 {next_sequence} 回退到 {playlist.media_sequence}，"
+                                       f"按推流重启处理，从最新分片继续")
+                        self.stats.gaps += 1
+                        next_sequence = None
+                    if next_sequence is None and not playlist.ended:
+                        segments = segments[-self.live_edge:]
+                    new_segments = 0
+                    for segment in segments:
+                        if next_sequence is not None and segment.sequence < next_sequence:
+                            continue
+                        if next_sequence is not None and segment.sequence > next_sequence:
+                            missed = segment.sequence - next_sequence
+                            self.stats.gaps += missed
+                            logger.warning(f"HLS分片缺失 {missed} 个 (sequence {next_sequence}-{segment.sequence - 1})")
+                        if segment.init_url and segment.init_url != current_init:
+                            current_init = segment.init_url
+                            init = HlsSegment(segment.sequence, segment.init_url, 0)
+                            init_task = asyncio.create_task(self._fetch_segment(client, semaphore, init))
+                            await queue.put((init, time.monotonic(), init_task))
+                        task = asyncio.create_task(self._fetch_segment(client, semaphore, segment))
+                        await queue.put((segment, time.monotonic(), task))
+                        next_sequence = segment.sequence + 1
+                        new_segments += 1
+
+                    if playlist.ended:
+                        break
+                    # 播放列表有更新时按目标时长轮询，没有更新时缩短到一半（RFC 8216 6.3.4）
+                    delay = playlist.target_duration if new_segments else playlist.target_duration / 2
+                    await asyncio.sleep(delay)
+            finally:
+                await queue.put(None)
+                await writer
+
+    async def _watch_stop(self, task: asyncio.Task) -> None:
+        while not task.done():
+            if self.stop_event.is_set():
+                self.stats.stopped = True
+                task.cancel()
+                return
+            await asyncio.sleep(0.5)
+
+    async def run(self, sink) -> HlsStats:
+        task = asyncio.create_task(self._download(sink))
+        watcher = asyncio.create_task(self._watch_stop(task))
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not self.stats.stopped:
+                raise
+        finally:
+            watcher.cancel()
+        logger.info(f"HLS下载结束 {self.url}: {self.stats.summary()}")
+        return self.stats
+
+    def fetch_to(self, sink, close: bool = True) -> HlsStats:
+        """
+        在当前线程中同步运行，sink 为可写的二进制文件对象（TS 文件或 FFmpeg 的 stdin）。
+        close 为 True 时结束后关闭 sink，FFmpeg 读到 EOF 后会正常收尾。
+        """
+        try:
+            return asyncio.run(self.run(sink))
+        except Exception as e:
+            logger.error(f"HLS下载错误: {e}")
+            return self.stats
+        finally:
+            if close:
+                try:
+                    sink.close()
+                except OSError:
+                    pass
+
+
+def pipe_input_command(ffmpeg_command: list) -> list:
+    """把 FFmpeg 命令的网络输入改为从 stdin 读取，去掉只对 HTTP 输入生效的参数和 -re 限速"""
+    http_only = {'-user_agent', '-headers', '-http_proxy'}
+    command = []
+    skip = False
+    for i, arg in enumerate(ffmpeg_command):
+        if skip:
+            skip = False
+            continue
+        if arg in http_only:
+            skip = True
+            continue
+        if arg == '-re':
+            continue
+        if i > 0 and ffmpeg_command[i - 1] == '-i':
+            arg = 'pipe:0'
+        elif i > 0 and ffmpeg_command[i - 1] == '-protocol_whitelist' and 'pipe' not in arg.split(','):
+            arg += ',pipe'
+        command.append(arg)
+    return command
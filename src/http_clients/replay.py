@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+请求录制/回放传输层，挂到 async_http.transport 上使用:
+
+    from src.http_clients import async_http, replay
+    async_http.transport = replay.ReplayTransport('fixtures/spider', mode='record')
+
+record 模式真实发起请求并把响应保存为 fixture 文件；replay 模式只从 fixture 读取，不访问网络；
+auto 模式有 fixture 时回放，没有时录制。
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import urllib.parse
+import httpx
+
+# 签名、时间戳、随机数等每次请求都会变化的参数，不参与 fixture 匹配
+VOLATILE_PARAMS = {
+    'a_bogus', 'X-Bogus', 'msToken', '_signature', 'signature', 'sign', 'w_rid', 'wts', 'nonce',
+    't', 'ts', '_t', '_', 'timestamp', 'time', 'rnd', 'r', 'did', 'uuid', 'seqid', 'callback', 'v',
+}
+
+MODES = ('record', 'replay', 'auto')
+
+
+class FixtureNotFound(Exception):
+    pass
+
+
+def fixture_key(method: str, url: httpx.URL, ignore_params: set[str] = VOLATILE_PARAMS) -> str:
+    query = sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(url.query.decode(), keep_blank_values=True)
+        if k not in ignore_params
+    )
+    return f"{method.upper()} {url.host}{url.path}?{urllib.parse.urlencode(query)}"
+
+
+def _fixture_name(key: str, host: str) -> str:
+    safe_host = re.sub(r'[^A-Za-z0-9.-]', '_', host)
+    return f"{safe_host}_{hashlib.sha1(key.encode()).hexdigest()[:16]}.json"
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    同一请求（忽略易变参数后）的多次响应按顺序保存在一个 fixture 中，回放时依次返回并循环。
+    """
+
+    def __init__(self, fixture_dir: str, mode: str = 'replay', ignore_params: set[str] | None = None,
+                 proxy: str | None = None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.fixture_dir = fixture_dir
+        self.mode = mode
+        self.proxy = proxy
+        self.ignore_params = VOLATILE_PARAMS if ignore_params is None else ignore_params
+        self._cache: dict[str, dict] = {}
+        self._cursor: dict[str, int] = {}
+        self._recorded: set[str] = set()
+        self.missing: set[str] = set()
+        self._lock = threading.Lock()
+        os.makedirs(fixture_dir, exist_ok=True)
+
+    def _path(self, key: str, host: str) -> str:
+        return os.path.join(self.fixture_dir, _fixture_name(key, host))
+
+    def _load(self, key: str, host: str) -> dict | None:
+        fixture = self._cache.get(key)
+        if fixture is None:
+            path = self._path(key, host)
+            if not os.path.exists(path):
+                return None
+            with open(path, encoding='utf-8') as f:
+                fixture = json.load(f)
+            self._cache[key] = fixture
+        return fixture
+
+    def _replay(self, key: str, host: str, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            fixture = self._load(key, host)
+            if not fixture or not fixture['responses']:
+                # async_req 会吞掉异常，这里记录下来便于调用方判断是否缺少 fixture
+                self.missing.add(key)
+                raise FixtureNotFound(f"No fixture for {key}")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            item = fixture['responses'][index % len(fixture['responses'])]
+        content = base64.b64decode(item['body_b64']) if 'body_b64' in item else item['body'].encode('utf-8')
+        return httpx.Response(item['status'], headers=item['headers'], content=content, request=request)
+
+    async def _record(self, key: str, host: str, request: httpx.Request) -> httpx.Response:
+        async with httpx.AsyncHTTPTransport(verify=False, proxy=self.proxy) as inner:
+            response = await inner.handle_async_request(request)
+            content = await response.aread()
+
+        # 响应体已解压，去掉与原始传输相关的头，回放时由 httpx 按 content 重新计算
+        headers = [(k, v) for k, v in response.headers.multi_items()
+                   if k.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')]
+        item = {'status': response.status_code, 'headers': headers}
+        try:
+            item['body'] = content.decode('utf-8')
+        except UnicodeDecodeError:
+            item['body_b64'] = base64.b64encode(content).decode()
+
+        with self._lock:
+            fixture = self._load(key, host)
+            # 本次运行第一次录到该请求时覆盖旧 fixture，之后的响应追加
+            if fixture is None or key not in self._recorded:
+                fixture = {'key': key, 'url': str(request.url), 'responses': []}
+                self._cache[key] = fixture
+                self._recorded.add(key)
+            fixture['responses'].append(item)
+            tmp_path = self._path(key, host) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(fixture, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self._path(key, host))
+
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        key = fixture_key(request.method, request.url, self.ignore_params)
+        if self.mode == 'record':
+            return await self._record(key, host, request)
+        if self.mode == 'auto' and self._load(key, host) is None:
+            return await self._record(key, host, request)
+        return self._replay(key, host, request)
+
+    def reset(self):
+        """回放游标归零，重复跑同一组用例时使用"""
+        with self._lock:
+            self._cursor.clear()
+
+    async def aclose(self):
+        # 同一个实例会被多个 AsyncClient 复用，客户端关闭时不能把它一起关掉
+        pass
@@ -214,7 +214,3 @@ def check_nodejs_installed() -> bool:
         pass
     return False
 
-
-def check_node() -> bool:
-    if not check_nodejs_installed():
-        return install_nodejs()
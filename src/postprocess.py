@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+录制完成后的转码/分段后处理队列。
+
+- 固定数量的工作线程，同时运行的 FFmpeg 数量不超过 workers
+- 按优先级（数值越小越先执行）和提交顺序排队
+- 以 nice/ionice（Windows 下为低于正常优先级）运行，避免影响正在进行的录制
+- 任务记录在 JSON 日志中（写临时文件后原子替换），程序中断后未完成的任务在下次启动时继续
+- 通过 FFmpeg 进度输出报告每个任务的完成百分比
+"""
+import collections
+import heapq
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from .logger import logger
+from . import supervisor
+
+KIND_MP4 = 'mp4'
+KIND_M4A = 'm4a'
+KIND_SEGMENT = 'segment'
+
+# 默认优先级：直接封装转换最快，其次是分段，重新编码最慢
+PRIORITY_REMUX = 10
+PRIORITY_SEGMENT = 20
+PRIORITY_ENCODE = 30
+
+
+class PostJob:
+    __slots__ = ('id', 'kind', 'source', 'params', 'priority', 'created_at', 'state', 'resumed', 'duration',
+                 'out_time', 'started_at')
+
+    def __init__(self, kind: str, source: str, params: dict | None = None, priority: int = PRIORITY_REMUX,
+                 job_id: str | None = None, created_at: float | None = None, resumed: bool = False):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.source = source
+        self.params = params or {}
+        self.priority = priority
+        self.created_at = created_at or time.time()
+        self.state = 'queued'
+        self.resumed = resumed
+        self.duration = None
+        self.out_time = 0.0
+        self.started_at = None
+
+    @property
+    def percent(self) -> float | None:
+        if not self.duration:
+            return None
+        return min(100.0, round(self.out_time / self.duration * 100, 1))
+
+    def to_journal(self) -> dict:
+        return {'id': self.id, 'kind': self.kind, 'source': self.source, 'params': self.params,
+                'priority': self.priority, 'created_at': self.created_at, 'state': self.state}
+
+    @property
+    def output(self) -> str | None:
+        """输出文件路径；分段任务输出多个文件，返回 None"""
+        if self.kind in (KIND_MP4, KIND_M4A):
+            return f"{self.source.rsplit('.', maxsplit=1)[0]}.{self.kind}"
+        return None
+
+    def command(self) -> list[str]:
+        source = self.source
+        # 从日志恢复的任务在执行前已处理过残留的输出文件（见 PostProcessQueue._prepare_output）
+        overwrite = '-y' if self.resumed else '-n'
+        if self.kind == KIND_MP4:
+            if self.params.get('h264'):
+                codec = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-vf", "format=yuv420p"]
+            else:
+                codec = ["-c:v", "copy"]
+            return ["ffmpeg", overwrite, "-i", source, *codec, "-c:a", "copy", "-f", "mp4", self.output]
+        if self.kind == KIND_M4A:
+            return ["ffmpeg", overwrite, "-i", source, "-vn",
+                    "-c:a", "aac", "-bsf:a", "aac_adtstoasc", "-ab", "320k", self.output]
+        if self.kind == KIND_SEGMENT:
+            return [
+                "ffmpeg", "-y", "-i", source,
+                "-c:v", "copy",
+                "-c:a", "copy",
+                "-map", "0",
+                "-f", "segment",
+                "-segment_time", str(self.params['segment_time']),
+                "-segment_format", self.params['segment_format'],
+                "-reset_timestamps", "1",
+                "-movflags", "+frag_keyframe+empty_moov",
+                self.params['output'],
+            ]
+        raise ValueError(f"Unknown post-processing job kind: {self.kind}")
+
+
+def _probe_duration(path: str) -> float | None:
+    try:
+        output = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+            capture_output=True, text=True, timeout=30
+        ).stdout.strip()
+        return float(output) if output else None
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def _low_priority(command: list[str], niceness: int) -> tuple[list[str], dict]:
+    """返回降低 CPU/IO 优先级后的命令和额外的进程创建参数"""
+    if os.name == 'nt':
+        return command, {'creationflags': subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    prefix = []
+    if niceness and shutil.which('nice'):
+        prefix += ['nice', '-n', str(niceness)]
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '3']
+    return prefix + command, {}
+
+
+class PostProcessQueue:
+    def __init__(self, journal_path: str, workers: int = 2, niceness: int = 10, startupinfo=None):
+        self.journal_path = journal_path
+        self.workers = max(1, workers)
+        self.niceness = niceness
+        self.startupinfo = startupinfo
+        self._heap: list[tuple[int, int, PostJob]] = []
+        self._counter = itertools.count()
+        self._jobs: dict[str, PostJob] = {}
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._alive = 0
+        self._started = False
+        self.completed = 0
+        self.failed = 0
+
+    def configure(self, workers: int | None = None, niceness: int | None = None) -> None:
+        """配置文件变更时调整并发数和优先级，并发数调小时多余的工作线程空闲后退出"""
+        with self._cond:
+            if workers is not None:
+                self.workers = max(1, workers)
+            if niceness is not None:
+                self.niceness = niceness
+            self._cond.notify_all()
+        if self._started:
+            self._spawn_workers()
+
+    def start(self) -> None:
+        """恢复日志中未完成的任务并启动工作线程"""
+        if self._started:
+            return
+        self._started = True
+        for entry in self._load_journal():
+            if not os.path.exists(entry['source']):
+                logger.warning(f"后处理源文件已不存在，跳过: {entry['source']}")
+                continue
+            job = PostJob(entry['kind'], entry['source'], entry.get('params'), entry.get('priority', PRIORITY_REMUX),
+                          job_id=entry['id'], created_at=entry.get('created_at'), resumed=True)
+            self._push(job)
+        if self._jobs:
+            logger.info(f"恢复 {len(self._jobs)} 个未完成的后处理任务")
+        self._save_journal()
+        self._spawn_workers()
+
+    def submit(self, kind: str, source: str, params: dict | None = None, priority: int = PRIORITY_REMUX) -> PostJob:
+        self.start()
+        job = PostJob(kind, source, params, priority)
+        self._push(job)
+        self._save_journal()
+        return job
+
+    def _push(self, job: PostJob) -> None:
+        with self._cond:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (job.priority, next(self._counter), job))
+            self._cond.notify()
+
+    def _spawn_workers(self) -> None:
+        with self._cond:
+            for _ in range(self.workers - self._alive):
+                self._alive += 1
+                threading.Thread(target=self._worker, name='postprocess', daemon=True).start()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and self._alive <= self.workers:
+                    self._cond.wait()
+                if self._alive > self.workers:
+                    self._alive -= 1
+                    return
+                _, _, job = heapq.heappop(self._heap)
+                job.state = 'running'
+                job.started_at = time.monotonic()
+            self._save_journal()
+            try:
+                self._run(job)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"后处理失败 {job.source}: {e}")
+            finally:
+                with self._cond:
+                    self._jobs.pop(job.id, None)
+                self._save_journal()
+
+    @staticmethod
+    def _prepare_output(job: PostJob) -> bool:
+        """
+        从日志恢复的任务，输出文件可能已经完整（上次转换完成后、删除源文件前被中断），也可能只写了一部分。
+        时长与源文件一致时视为已完成，返回 True；否则删除残留的输出文件后重新转换。
+        """
+        output = job.output
+        if not job.resumed or not output or output == job.source or not os.path.exists(output):
+            return False
+        output_duration = _probe_duration(output)
+        if job.duration and output_duration and abs(output_duration - job.duration) <= max(1.0, job.duration * 0.01):
+            logger.info(f"后处理输出已完整，跳过转换: {output}")
+            return True
+        logger.info(f"删除上次未完成的后处理输出: {output}")
+        os.remove(output)
+        return False
+
+    def _run(self, job: PostJob) -> None:
+        if not os.path.exists(job.source) or os.path.getsize(job.source) == 0:
+            return
+        job.duration = _probe_duration(job.source)
+        if not self._prepare_output(job):
+            self._convert(job)
+        if job.params.get('delete_source') and os.path.exists(job.source):
+            os.remove(job.source)
+
+    def _convert(self, job: PostJob) -> None:
+        command = job.command()
+        command, popen_kwargs = _low_priority(
+            [command[0], *supervisor.progress_args(), *command[1:]], self.niceness)
+
+        output_tail = collections.deque(maxlen=10)
+
+        def on_progress(progress):
+            job.out_time = progress.out_time
+
+        result = supervisor.default_supervisor.run_sync(
+            command, on_progress=on_progress, on_line=output_tail.append, stdin=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, startupinfo=self.startupinfo, **popen_kwargs
+        )
+        if result.returncode != 0:
+            raise Exception(f"FFmpeg exited with code {result.returncode}: {' '.join(output_tail)}")
+
+    def _load_journal(self) -> list[dict]:
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                return json.load(f).get('jobs', [])
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            logger.error(f"后处理任务日志读取失败: {e}")
+            return []
+
+    def _save_journal(self) -> None:
+        with self._cond:
+            jobs = [job.to_journal() for job in self._jobs.values()]
+        with self._journal_lock:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            tmp_path = self.journal_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'jobs': jobs}, f, ensure_ascii=False, indent=1)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.journal_path)
+
+    def status(self) -> dict:
+        with self._cond:
+            jobs = list(self._jobs.values())
+        running = [job for job in jobs if job.state == 'running']
+        return {
+            'running': [{'source': job.source, 'kind': job.kind, 'percent': job.percent,
+                         'elapsed': round(time.monotonic() - job.started_at)} for job in running],
+            'queued': len(jobs) - len(running),
+            'completed': self.completed,
+            'failed': self.failed,
+        }
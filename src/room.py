@@ -12,7 +12,7 @@ import urllib.parse
 import execjs
 import httpx
 import urllib.request
-from . import JS_SCRIPT_PATH, utils
+from . import JS_SCRIPT_PATH, utils, ensure_node_async
 
 no_proxy_handler = urllib.request.ProxyHandler({})
 opener = urllib.request.build_opener(no_proxy_handler)
@@ -43,6 +43,7 @@ async def get_xbogus(url: str, headers: dict | None = None) -> str:
     if not headers or 'user-agent' not in (k.lower() for k in headers):
         headers = HEADERS
     query = urllib.parse.urlparse(url).query
+    await ensure_node_async()
     xbogus = execjs.compile(open(f'{JS_SCRIPT_PATH}/x-bogus.js').read()).call(
         'sign', query, headers.get("User-Agent", "user-agent"))
     return xbogus
@@ -37,6 +37,19 @@ def get_quality_index(quality) -> tuple:
     return quality_str, QUALITY_MAPPING.get(quality_str, 0)
 
 
+def rank_candidates(url_lists: list[list], quality_index: int, primary: str | None = None) -> list[str]:
+    """
+    录制中途切换用的候选地址：首选地址，以及同一画质的其他格式/CDN 地址。
+    不同画质的分辨率和编码参数不同，切换后的分片无法与之前的分片无损拼接，因此不作为候选。
+    url_lists 中每个列表按画质从高到低排列。
+    """
+    candidates = [primary]
+    for urls in url_lists:
+        if 0 <= quality_index < len(urls):
+            candidates.append(urls[quality_index])
+    return list(dict.fromkeys(url for url in candidates if url and isinstance(url, str)))
+
+
 @trace_error_decorator
 async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr: str) -> dict:
     anchor_name = json_data.get('anchor_name')
@@ -74,6 +87,7 @@ async def get_douyin_stream_url(json_data: dict, video_quality: str, proxy_addr:
             'm3u8_url': m3u8_url,
             'flv_url': flv_url,
             'record_url': m3u8_url or flv_url,
+            'candidate_urls': rank_candidates([m3u8_url_list, flv_url_list], quality_index, m3u8_url or flv_url),
         }
     return result
 
@@ -142,6 +156,7 @@ async def get_tiktok_stream_url(json_data: dict, video_quality: str, proxy_addr:
 
         flv_url = flv_dict['url']
         m3u8_url = m3u8_dict['url']
+        url_lists = [[i['url'] for i in m3u8_url_list], [i['url'] for i in flv_url_list]]
         result |= {
             'is_live': True,
             'title': live_room['liveRoom']['title'],
@@ -149,6 +164,7 @@ async def get_tiktok_stream_url(json_data: dict, video_quality: str, proxy_addr:
             'm3u8_url': m3u8_url,
             'flv_url': flv_url,
             'record_url': m3u8_url or flv_url,
+            'candidate_urls': rank_candidates(url_lists, quality_index, m3u8_url or flv_url),
         }
     return result
 
@@ -170,12 +186,14 @@ async def get_kuaishou_stream_url(json_data: dict, video_quality: str) -> dict:
         if video_quality in QUALITY_MAPPING:
 
             quality, quality_index = get_quality_index(video_quality)
+            url_lists = []
             if 'm3u8_url_list' in json_data:
                 m3u8_url_list = json_data['m3u8_url_list'][::-1]
                 while len(m3u8_url_list) < 5:
                     m3u8_url_list.append(m3u8_url_list[-1])
                 m3u8_url = m3u8_url_list[quality_index]['url']
                 result['m3u8_url'] = m3u8_url
+                url_lists.append([i['url'] for i in m3u8_url_list])
 
             if 'flv_url_list' in json_data:
                 if 'bitrate' in json_data['flv_url_list'][0]:
@@ -195,12 +213,16 @@ async def get_kuaishou_stream_url(json_data: dict, video_quality: str) -> dict:
 
                     result['flv_url'] = flv_url
                     result['record_url'] = flv_url
+                    url_lists.insert(0, [i['url'] for i in flv_url_list])
                 else:
                     flv_url_list = json_data['flv_url_list'][::-1]
                     while len(flv_url_list) < 5:
                         flv_url_list.append(flv_url_list[-1])
                     flv_url = flv_url_list[quality_index]['url']
                     result |= {'flv_url': flv_url, 'record_url': flv_url}
+                    url_lists.insert(0, [i['url'] for i in flv_url_list])
+            if result.get('record_url'):
+                result['candidate_urls'] = rank_candidates(url_lists, quality_index, result['record_url'])
             result['is_live'] = True
             result['quality'] = video_quality
     return result
@@ -266,6 +288,16 @@ async def get_huya_stream_url(json_data: dict, video_quality: str) -> dict:
         new_anti_code = get_anti_code(flv_anti_code)
         flv_url = f'{flv_url}/{stream_name}.{flv_url_suffix}?{new_anti_code}&ratio='
         m3u8_url = f'{hls_url}/{stream_name}.{hls_url_suffix}?{new_anti_code}&ratio='
+        # 其他 CDN 线路，录制中途首选线路异常时切换
+        cdn_flv_urls = [
+            f"{cdn['sFlvUrl']}/{cdn['sStreamName']}.{cdn['sFlvUrlSuffix']}?{new_anti_code}&ratio="
+            for cdn in stream_info_list[1:] if cdn.get('sFlvUrl') and cdn.get('sStreamName')
+        ]
+        cdn_m3u8_urls = [
+            f"{cdn['sHlsUrl']}/{cdn['sStreamName']}.{cdn['sHlsUrlSuffix']}?{new_anti_code}&ratio="
+            for cdn in stream_info_list[1:] if cdn.get('sHlsUrl') and cdn.get('sStreamName')
+        ]
+        ratio = ''
 
         quality_list = flv_anti_code.split('&exsphd=')
         if len(quality_list) > 1 and video_quality not in ["OD", "BD"]:
@@ -285,8 +317,9 @@ async def get_huya_stream_url(json_data: dict, video_quality: str) -> dict:
                 raise ValueError(
                     f"Invalid video quality. Available options are: {', '.join(video_quality_options.keys())}")
 
-            flv_url = flv_url + str(video_quality_options[video_quality])
-            m3u8_url = m3u8_url + str(video_quality_options[video_quality])
+            ratio = str(video_quality_options[video_quality])
+            flv_url = flv_url + ratio
+            m3u8_url = m3u8_url + ratio
 
         result |= {
             'is_live': True,
@@ -294,7 +327,10 @@ async def get_huya_stream_url(json_data: dict, video_quality: str) -> dict:
             'quality': video_quality,
             'm3u8_url': m3u8_url,
             'flv_url': flv_url,
-            'record_url': flv_url or m3u8_url
+            'record_url': flv_url or m3u8_url,
+            'candidate_urls': list(dict.fromkeys(
+                [flv_url, *(url + ratio for url in cdn_flv_urls), m3u8_url, *(url + ratio for url in cdn_m3u8_urls)]
+            ))
         }
     return result
 
@@ -396,6 +432,9 @@ async def get_netease_stream_url(json_data: dict, video_quality: str) -> dict:
         flv_url_list = stream_list[selected_quality]['cdn']
         selected_cdn = list(flv_url_list.keys())[0]
         flv_url = flv_url_list[selected_cdn]
+        cdn_urls = list(flv_url_list.values())
+    else:
+        cdn_urls = []
 
     return {
         "is_live": True,
@@ -404,7 +443,8 @@ async def get_netease_stream_url(json_data: dict, video_quality: str) -> dict:
         'quality': video_quality,
         "m3u8_url": m3u8_url,
         "flv_url": flv_url,
-        "record_url": flv_url or m3u8_url
+        "record_url": flv_url or m3u8_url,
+        "candidate_urls": list(dict.fromkeys(url for url in [flv_url, *cdn_urls, m3u8_url] if url))
     }
 
 
@@ -423,24 +463,31 @@ async def get_stream_url(json_data: dict, video_quality: str, url_type: str = 'm
         "is_live": True
     }
 
-    def get_url(key):
-        play_url = play_url_list[selected_quality]
+    def get_url(key, index=selected_quality):
+        play_url = play_url_list[index]
         return play_url[key] if key else play_url
 
+    def get_urls(key) -> list:
+        return [get_url(key, i) for i in range(len(play_url_list))]
+
     if url_type == 'all':
         m3u8_url = get_url(hls_extra_key)
         flv_url = get_url(flv_extra_key)
         data |= {
             "m3u8_url": json_data['m3u8_url'] if spec else m3u8_url,
             "flv_url": json_data['flv_url'] if spec else flv_url,
-            "record_url": m3u8_url
+            "record_url": m3u8_url,
+            "candidate_urls": rank_candidates([get_urls(hls_extra_key), get_urls(flv_extra_key)], selected_quality,
+                                              m3u8_url)
         }
     elif url_type == 'm3u8':
         m3u8_url = get_url(hls_extra_key)
-        data |= {"m3u8_url": json_data['m3u8_url'] if spec else m3u8_url, "record_url": m3u8_url}
+        data |= {"m3u8_url": json_data['m3u8_url'] if spec else m3u8_url, "record_url": m3u8_url,
+                 "candidate_urls": rank_candidates([get_urls(hls_extra_key)], selected_quality, m3u8_url)}
     else:
         flv_url = get_url(flv_extra_key)
-        data |= {"flv_url": flv_url, "record_url": flv_url}
+        data |= {"flv_url": flv_url, "record_url": flv_url,
+                 "candidate_urls": rank_candidates([get_urls(flv_extra_key)], selected_quality, flv_url)}
     data['title'] = json_data.get('title')
     data['quality'] = video_quality
     return data
\ No newline at end of file
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+录制时间字幕（SRT，每秒一条，内容为当时的实际时间）。
+
+所有录制共用一个定时线程，每隔 flush_interval 秒把各录制自上次写入以来的字幕条目一次性追加到文件，
+不再每个录制一个线程、每秒打开一次文件。字幕条目按录制开始时间和经过的秒数计算，与写入时机无关。
+"""
+import datetime
+import threading
+import time
+from .logger import logger
+
+
+def _srt_time(seconds: int) -> str:
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d},000"
+
+
+def build_cues(start_time: datetime.datetime, first: int, last: int) -> str:
+    """生成第 first 到 last - 1 秒的字幕条目（条目序号从 1 开始）"""
+    lines = []
+    for second in range(first, last):
+        wall_time = (start_time + datetime.timedelta(seconds=second)).strftime('%Y-%m-%d %H:%M:%S')
+        lines.append(f"{second + 1}\n{_srt_time(second)} --> {_srt_time(second + 1)}\n{wall_time}\n\n")
+    return ''.join(lines)
+
+
+class SubtitleTrack:
+    __slots__ = ('path', 'encoding', 'start_time', 'started_at', 'written')
+
+    def __init__(self, path: str, encoding: str):
+        self.path = path
+        self.encoding = encoding
+        self.start_time = datetime.datetime.now()
+        self.started_at = time.monotonic()
+        self.written = 0
+
+    def flush(self, until: float | None = None) -> None:
+        elapsed = int((until or time.monotonic()) - self.started_at) + 1
+        if elapsed <= self.written:
+            return
+        text = build_cues(self.start_time, self.written, elapsed)
+        with open(self.path, 'a', encoding=self.encoding) as f:
+            f.write(text)
+        self.written = elapsed
+
+
+class SubtitleWriter:
+    def __init__(self, flush_interval: float = 10):
+        self.flush_interval = flush_interval
+        self._tracks: dict[str, SubtitleTrack] = {}
+        # 定时写入和 finish 都在锁内进行，同一条目不会被写两次
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def start(self, path: str, encoding: str = 'utf-8') -> SubtitleTrack:
+        """开始为一个录制生成字幕，path 为完整的字幕文件路径"""
+        track = SubtitleTrack(path, encoding)
+        with self._lock:
+            self._tracks[path] = track
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='subtitles', daemon=True)
+                self._thread.start()
+        return track
+
+    def finish(self, path: str) -> None:
+        """录制结束时写入剩余的字幕条目"""
+        with self._lock:
+            track = self._tracks.pop(path, None)
+            if track:
+                self._flush(track)
+
+    @staticmethod
+    def _flush(track: SubtitleTrack) -> None:
+        try:
+            track.flush()
+        except OSError as e:
+            logger.error(f"字幕文件写入失败 {track.path}: {e}")
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            with self._lock:
+                if not self._tracks:
+                    self._thread = None
+                    return
+                for track in self._tracks.values():
+                    self._flush(track)
+
+
+default_writer = SubtitleWriter()
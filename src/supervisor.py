@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+FFmpeg 进程监管器。
+
+- 用 asyncio 等待进程退出，不再每个录制线程各自 poll + sleep
+- 解析 `-progress pipe:1` 输出（码率、速度、丢帧等）
+- 所有进程共用一个看门狗协程：检查停止请求、录制时长上限，以及输出大小长时间不增长（卡顿）
+- 卡顿时调用 on_stall 回调（默认结束进程），由调用方决定重启或换地址
+
+同步代码（main.py 的录制线程）通过 run_sync 把进程交给后台事件循环线程，阻塞等待结果；
+异步代码（服务端）直接 await run。
+"""
+import asyncio
+import inspect
+import os
+import re
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from .logger import logger
+
+PROGRESS_KEYS = {
+    'frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time',
+    'dup_frames', 'drop_frames', 'speed', 'progress',
+}
+PROGRESS_LINE = re.compile(r'^([a-z_0-9]+)=(.*)$')
+NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+
+
+def progress_args() -> list[str]:
+    """插入到 FFmpeg 命令开头的进度输出参数"""
+    return ['-progress', 'pipe:1', '-nostats']
+
+
+def _number(value: str) -> float | None:
+    match = NUMBER.search(value)
+    return float(match.group()) if match else None
+
+
+class FfmpegProgress:
+    __slots__ = ('frame', 'fps', 'bitrate_kbps', 'total_size', 'out_time', 'speed', 'dup_frames', 'drop_frames',
+                 'updated_at')
+
+    def __init__(self):
+        self.frame = 0
+        self.fps = 0.0
+        self.bitrate_kbps = None
+        self.total_size = 0
+        self.out_time = 0.0
+        self.speed = None
+        self.dup_frames = 0
+        self.drop_frames = 0
+        self.updated_at = None
+
+    def update(self, key: str, value: str) -> None:
+        number = _number(value)
+        if number is None:
+            return
+        if key == 'frame':
+            self.frame = int(number)
+        elif key == 'fps':
+            self.fps = number
+        elif key == 'bitrate':
+            self.bitrate_kbps = number
+        elif key == 'total_size':
+            self.total_size = int(number)
+        elif key in ('out_time_us', 'out_time_ms'):
+            # 两个字段的单位实际上都是微秒
+            self.out_time = number / 1_000_000
+        elif key == 'speed':
+            self.speed = number
+        elif key == 'dup_frames':
+            self.dup_frames = int(number)
+        elif key == 'drop_frames':
+            self.drop_frames = int(number)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class SupervisedProcess:
+    def __init__(self, command: list, output_path: str | None, stall_timeout: float | None, timeout: float | None,
+                 stop_event: threading.Event | None, on_progress, on_line, on_stall):
+        self.command = command
+        self.output_path = output_path
+        self.stall_timeout = stall_timeout
+        self.timeout = timeout
+        self.stop_event = stop_event
+        self.on_progress = on_progress
+        self.on_line = on_line
+        self.on_stall = on_stall
+        self.process: asyncio.subprocess.Process | None = None
+        self.progress = FfmpegProgress()
+        self.started_at = time.monotonic()
+        self.last_size = 0
+        self.last_out_time = 0.0
+        self.last_growth_at = self.started_at
+        self.returncode = None
+        self.stalls = 0
+        self.stopped = False
+        self.timed_out = False
+        self._stopping = False
+
+    @property
+    def output_size(self) -> int:
+        """
+        输出文件大小与 FFmpeg 报告的 total_size 中较大者。
+        segment muxer 没有单一输出文件，total_size 也为 N/A，此时一直为 0，卡顿检测改用 out_time（见 check）
+        """
+        size = self.progress.total_size
+        if self.output_path and os.path.isfile(self.output_path):
+            size = max(size, os.path.getsize(self.output_path))
+        return size
+
+    async def _emit(self, callback, *args):
+        try:
+            result = callback(*args)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"FFmpeg supervisor callback error: {e}")
+
+    async def _read_stdout(self) -> None:
+        async for raw in self.process.stdout:
+            line = raw.decode(errors='ignore').strip()
+            if not line:
+                continue
+            match = PROGRESS_LINE.match(line)
+            if match and match.group(1) in PROGRESS_KEYS:
+                key, value = match.groups()
+                if key == 'progress':
+                    self.progress.updated_at = time.monotonic()
+                    if self.on_progress:
+                        await self._emit(self.on_progress, self.progress)
+                else:
+                    self.progress.update(key, value)
+            elif self.on_line:
+                # 其他输出（如 segment muxer 的分段列表）交给调用方处理
+                await self._emit(self.on_line, line)
+
+    async def stop(self, grace: float = 10) -> None:
+        """请求 FFmpeg 正常收尾（Windows 写入 q，其他平台发送 SIGINT），超时后强制结束"""
+        if self._stopping or self.process is None or self.process.returncode is not None:
+            return
+        self._stopping = True
+        try:
+            if os.name == 'nt' and isinstance(self.process.stdin, asyncio.StreamWriter):
+                self.process.stdin.write(b'q')
+                await self.process.stdin.drain()
+                self.process.stdin.close()
+            elif os.name == 'nt':
+                # stdin 由外部写入（如内置HLS下载器）时，关闭输入后 FFmpeg 会自行收尾
+                pass
+            else:
+                self.process.send_signal(signal.SIGINT)
+            await asyncio.wait_for(self.process.wait(), grace)
+        except (asyncio.TimeoutError, OSError):
+            if self.process.returncode is None:
+                self.process.kill()
+
+    async def check(self, now: float) -> None:
+        """由看门狗定期调用"""
+        if self.process is None or self.process.returncode is not None or self._stopping:
+            return
+        if self.stop_event is not None and self.stop_event.is_set():
+            self.stopped = True
+            asyncio.create_task(self.stop())
+            return
+        if self.timeout and now - self.started_at > self.timeout:
+            self.timed_out = True
+            logger.warning(f"FFmpeg exceeded {self.timeout}s, stopping: {self.output_path}")
+            asyncio.create_task(self.stop())
+            return
+        # 输出变大或输出时间戳前进都算有进展（分段输出时只有 out_time 可用）
+        size = self.output_size
+        out_time = self.progress.out_time
+        if size > self.last_size or out_time > self.last_out_time:
+            self.last_size = max(size, self.last_size)
+            self.last_out_time = max(out_time, self.last_out_time)
+            self.last_growth_at = now
+        elif self.stall_timeout and now - self.last_growth_at > self.stall_timeout:
+            self.stalls += 1
+            self.last_growth_at = now
+            logger.warning(f"FFmpeg output has not advanced for {self.stall_timeout}s: {self.output_path}")
+            if self.on_stall:
+                await self._emit(self.on_stall, self)
+            else:
+                asyncio.create_task(self.stop())
+
+
+class FfmpegSupervisor:
+    def __init__(self, check_interval: float = 2):
+        self.check_interval = check_interval
+        self._active: set[SupervisedProcess] = set()
+        # 状态接口等其它线程会读取 active，增删和复制都在锁内进行
+        self._active_lock = threading.Lock()
+        self._watchdog: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+
+    @property
+    def active(self) -> list[SupervisedProcess]:
+        """当前运行中的进程快照，可从任意线程调用"""
+        with self._active_lock:
+            return list(self._active)
+
+    async def _watch(self) -> None:
+        while self._active:
+            now = time.monotonic()
+            for supervised in self.active:
+                await supervised.check(now)
+            await asyncio.sleep(self.check_interval)
+        self._watchdog = None
+
+    async def run(self, command: list, output_path: str | None = None, stall_timeout: float | None = None,
+                  timeout: float | None = None, stop_event: threading.Event | None = None,
+                  on_progress=None, on_line=None, on_stall=None, on_start=None,
+                  stdin=asyncio.subprocess.PIPE, stderr=None, **popen_kwargs) -> SupervisedProcess:
+        """
+        启动 FFmpeg 并等待退出。command 需要包含 progress_args() 才能获得进度信息。
+        stdout 被监管器占用；stderr 默认继承父进程，传入 asyncio.subprocess.PIPE 时由 on_line 一并接收。
+        """
+        supervised = SupervisedProcess(command, output_path, stall_timeout, timeout, stop_event,
+                                       on_progress, on_line, on_stall)
+        merge_stderr = stderr == asyncio.subprocess.PIPE
+        supervised.process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=stdin,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT if merge_stderr else stderr,
+            **popen_kwargs
+        )
+        if on_start:
+            await supervised._emit(on_start, supervised)
+
+        with self._active_lock:
+            self._active.add(supervised)
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch())
+        try:
+            await supervised._read_stdout()
+            supervised.returncode = await supervised.process.wait()
+            return supervised
+        except asyncio.CancelledError:
+            await asyncio.shield(supervised.stop())
+            raise
+        finally:
+            with self._active_lock:
+                self._active.discard(supervised)
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='ffmpeg-supervisor', daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, command: list, **kwargs) -> Future:
+        """在后台事件循环线程中运行，可从任意线程调用"""
+        return asyncio.run_coroutine_threadsafe(self.run(command, **kwargs), self._ensure_loop())
+
+    def run_sync(self, command: list, **kwargs) -> SupervisedProcess:
+        return self.submit(command, **kwargs).result()
+
+
+# main.py 中所有录制线程共用一个监管器
+default_supervisor = FfmpegSupervisor()
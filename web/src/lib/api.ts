@@ -15,6 +15,10 @@ export interface Task {
     loop_count: number;
     max_recordings: number;
     audio_only: boolean;
+    record_mode?: 'interval' | 'continuous';
+    max_instances?: number;
+    coalesce?: boolean;
+    misfire_grace_time?: number;
     ai_enabled: boolean;
     prompt_transcript?: string;
     prompt_vision?: string;
@@ -37,6 +41,14 @@ export interface Record {
     status: string;
     transcript_path?: string;
     analysis_result?: string;
+    timings?: string;
+}
+
+export interface SpriteInfo {
+    interval: number;
+    count: number;
+    columns: number;
+    rows: number;
 }
 
 export interface Settings {
@@ -83,6 +95,19 @@ export const getRecord = async (id: number) => {
     return response.data;
 };
 
+// 录像、HLS、缩略图等媒体文件的地址（直接用于 <video>/<img>，不经过 axios）
+export const recordMediaUrl = (id: number, path: string) => `/api/records/${id}/media/${path}`;
+
+// 只录音频的录制没有画面，不请求缩略图和雪碧图
+const AUDIO_EXTENSIONS = ['.wav', '.opus', '.mp3', '.m4a', '.aac'];
+export const isAudioOnly = (path?: string | null) =>
+    !!path && AUDIO_EXTENSIONS.some(ext => path.toLowerCase().endsWith(ext));
+
+export const getRecordSprite = async (id: number) => {
+    const response = await api.get<SpriteInfo>(`/records/${id}/media/sprite`);
+    return response.data;
+};
+
 export const getSetting = async (key: string) => {
     try {
         const response = await api.get<Settings>(`/settings/${key}`);
@@ -1,7 +1,7 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useParams } from 'react-router-dom';
 import { useQuery } from '@tanstack/react-query';
-import { getRecord } from '../lib/api';
+import { getRecord, getRecordSprite, isAudioOnly, recordMediaUrl } from '../lib/api';
 import { Download, FileText, FileVideo } from 'lucide-react';
 
 const RecordDetail: React.FC = () => {
@@ -12,6 +12,16 @@ const RecordDetail: React.FC = () => {
     });
 
     const [transcript, setTranscript] = useState<any[]>([]);
+    const videoRef = useRef<HTMLVideoElement>(null);
+
+    // 拖动预览雪碧图（首次请求时由后端生成）
+    const { data: sprite } = useQuery({
+        queryKey: ['record-sprite', id],
+        queryFn: () => getRecordSprite(parseInt(id!)),
+        enabled: !!record?.video_path && !isAudioOnly(record.video_path),
+        retry: false,
+        staleTime: Infinity
+    });
 
     // 加载转写内容
     useEffect(() => {
@@ -85,7 +95,7 @@ const RecordDetail: React.FC = () => {
     const downloadVideo = () => {
         if (!record?.video_path) return;
         const link = document.createElement('a');
-        link.href = `/${record.video_path}`;
+        link.href = recordMediaUrl(record.id, 'video');
         link.download = `record_${record.id}.mp4`;
         link.click();
     };
@@ -140,7 +150,19 @@ const RecordDetail: React.FC = () => {
     if (isLoading) return <div className="p-8">加载中...</div>;
     if (!record) return <div className="p-8">记录未找到</div>;
 
-    const videoUrl = `/${record.video_path}`;
+    const videoUrl = recordMediaUrl(record.id, 'video');
+    const durationSeconds = record.end_time
+        ? (new Date(record.end_time).getTime() - new Date(record.start_time).getTime()) / 1000
+        : 0;
+    const audioOnly = isAudioOnly(record.video_path);
+    // 长录像优先使用按需打包的 HLS（支持原生 HLS 的浏览器），其余浏览器按 Range 读取 MP4
+    const useHls = !audioOnly && durationSeconds > 1800;
+
+    const seekTo = (seconds: number) => {
+        if (!videoRef.current) return;
+        videoRef.current.currentTime = seconds;
+        videoRef.current.play();
+    };
 
     return (
         <div className="p-8 space-y-8">
@@ -224,12 +246,42 @@ const RecordDetail: React.FC = () => {
                     {/* Video Player */}
                     <div className="aspect-video bg-black rounded-xl overflow-hidden shadow-lg">
                         <video
-                            src={videoUrl}
+                            ref={videoRef}
                             controls
+                            preload="metadata"
+                            poster={record.video_path && !audioOnly ? recordMediaUrl(record.id, 'thumbnail.webp') : undefined}
                             className="w-full h-full"
-                        />
+                        >
+                            {useHls && (
+                                <source src={recordMediaUrl(record.id, 'hls/index.m3u8')} type="application/vnd.apple.mpegurl" />
+                            )}
+                            <source src={videoUrl} type={audioOnly ? undefined : 'video/mp4'} />
+                        </video>
                     </div>
 
+                    {/* Storyboard: 点击缩略图跳转到对应时间 */}
+                    {sprite && (
+                        <div className="flex gap-1 overflow-x-auto pb-2">
+                            {Array.from({ length: sprite.count }, (_, index) => {
+                                const column = index % sprite.columns;
+                                const row = Math.floor(index / sprite.columns);
+                                return (
+                                    <button
+                                        key={index}
+                                        onClick={() => seekTo(index * sprite.interval)}
+                                        title={formatTime(index * sprite.interval * 1000)}
+                                        className="shrink-0 w-32 aspect-video rounded border hover:ring-2 hover:ring-blue-500"
+                                        style={{
+                                            backgroundImage: `url(${recordMediaUrl(record.id, 'sprite.webp')})`,
+                                            backgroundSize: `${sprite.columns * 100}% ${sprite.rows * 100}%`,
+                                            backgroundPosition: `${sprite.columns > 1 ? column / (sprite.columns - 1) * 100 : 0}% ${sprite.rows > 1 ? row / (sprite.rows - 1) * 100 : 0}%`
+                                        }}
+                                    />
+                                );
+                            })}
+                        </div>
+                    )}
+
                     {/* Transcript */}
                     <div className="bg-white p-6 rounded-xl border shadow-sm">
                         <h2 className="text-xl font-semibold mb-4">转写稿</h2>
@@ -1,6 +1,6 @@
 import React from 'react';
 import { useQuery } from '@tanstack/react-query';
-import { getRecords } from '../lib/api';
+import { getRecords, isAudioOnly, recordMediaUrl } from '../lib/api';
 import { Link } from 'react-router-dom';
 
 const Records: React.FC = () => {
@@ -46,8 +46,21 @@ const Records: React.FC = () => {
                             return (
                                 <tr key={record.id} className="hover:bg-gray-50">
                                     <td className="px-6 py-4">
-                                        <div className="font-medium">{record.anchor_name || record.anchor_id || 'N/A'}</div>
-                                        <div className="text-xs text-gray-500">ID: {record.anchor_id}</div>
+                                        <div className="flex items-center gap-3">
+                                            {record.video_path && !isAudioOnly(record.video_path) && (
+                                                <img
+                                                    src={recordMediaUrl(record.id, 'thumbnail.webp')}
+                                                    loading="lazy"
+                                                    alt=""
+                                                    className="w-20 aspect-video object-cover rounded bg-gray-100"
+                                                    onError={(e) => { e.currentTarget.style.display = 'none'; }}
+                                                />
+                                            )}
+                                            <div>
+                                                <div className="font-medium">{record.anchor_name || record.anchor_id || 'N/A'}</div>
+                                                <div className="text-xs text-gray-500">ID: {record.anchor_id}</div>
+                                            </div>
+                                        </div>
                                     </td>
                                     <td className="px-6 py-4">#{recordNumber}</td>
                                     <td className="px-6 py-4">
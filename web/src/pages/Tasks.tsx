@@ -17,6 +17,7 @@ const Tasks: React.FC = () => {
         interval: 300,
         duration: 60,
         max_recordings: 0,
+        record_mode: 'interval',
         ai_enabled: true
     });
 
@@ -25,7 +26,7 @@ const Tasks: React.FC = () => {
         onSuccess: () => {
             queryClient.invalidateQueries({ queryKey: ['tasks'] });
             setIsModalOpen(false);
-            setNewTask({ url: '', anchor_id: '', anchor_name: '', interval: 300, duration: 60, max_recordings: 0, ai_enabled: true });
+            setNewTask({ url: '', anchor_id: '', anchor_name: '', interval: 300, duration: 60, max_recordings: 0, record_mode: 'interval', ai_enabled: true });
         }
     });
 
@@ -78,7 +79,7 @@ const Tasks: React.FC = () => {
                         <div className="space-y-1">
                             <div className="font-medium">{task.anchor_name || task.url}</div>
                             <div className="text-sm text-gray-500">
-                                主播ID: {task.anchor_id || 'N/A'} | 间隔: {task.interval}s | 时长: {task.duration}s | 段数: {task.max_recordings || '∞'} | AI: {task.ai_enabled ? '开启' : '关闭'}
+                                主播ID: {task.anchor_id || 'N/A'} | 间隔: {task.interval}s | 时长: {task.duration}s | 模式: {task.record_mode === 'continuous' ? '连续' : '间隔'} | 段数: {task.max_recordings || '∞'} | AI: {task.ai_enabled ? '开启' : '关闭'}
                                 {task.scheduled_start_time && (
                                     <span className="ml-2 text-blue-600">
                                         | 定时启动: {new Date(task.scheduled_start_time).toLocaleString()}
@@ -190,6 +191,18 @@ const Tasks: React.FC = () => {
                                     />
                                 </div>
                             </div>
+                            <div>
+                                <label className="block text-sm font-medium mb-1">录制模式</label>
+                                <select
+                                    value={newTask.record_mode}
+                                    onChange={e => setNewTask({ ...newTask, record_mode: e.target.value as Task['record_mode'] })}
+                                    className="w-full p-2 border rounded"
+                                >
+                                    <option value="interval">按间隔录制 (每次重新连接)</option>
+                                    <option value="continuous">连续录制 (按录制时长切段)</option>
+                                </select>
+                                <p className="text-xs text-gray-500 mt-1">连续录制时直播期间保持同一个连接，每段结束后立即分析；间隔时长用于检测开播。</p>
+                            </div>
                             <div>
                                 <label className="block text-sm font-medium mb-1">定时开始时间 (可选)</label>
                                 <input